@@ -1,27 +1,203 @@
 # app/core/auth.py
-import os
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional
+
 import httpx
 from fastapi import Request, HTTPException
 
-CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import jwt
+
+logger = logging.getLogger(__name__)
+
+CLERK_SECRET_KEY = settings.CLERK_SECRET_KEY
 CLERK_BASE_URL = "https://api.clerk.com/v1"
 
-async def verify_clerk_token(request: Request):
-    authorization = request.headers.get("Authorization")
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
+# 远程调用（JWKS 获取 / 旧 sessions API）共用一个连接池，避免每次请求重新握手
+_http: Optional[httpx.AsyncClient] = None
 
-    token = authorization.split("Bearer ")[1]
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{CLERK_BASE_URL}/sessions/{token}",
-            headers={"Authorization": f"Bearer {CLERK_SECRET_KEY}"}
+def _client() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(timeout=httpx.Timeout(5.0))
+    return _http
+
+
+async def aclose():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+class JWKSCache:
+    """
+    Clerk 的签名公钥（JWKS）缓存。
+    - CLERK_JWKS_FILE 指定时从本地文件读取（离线测试用）
+    - 否则从 CLERK_JWKS_URL（未设置时为 Backend API /jwks）获取
+    遇到未知 kid 时刷新（有最小间隔，防止伪造 kid 造成请求风暴）；获取失败时继续使用旧的公钥。
+    """
+
+    def __init__(
+        self,
+        url: str = settings.CLERK_JWKS_URL,
+        path: str = settings.CLERK_JWKS_FILE,
+        ttl: float = settings.CLERK_JWKS_TTL_SECONDS,
+        min_refresh_interval: float = settings.CLERK_JWKS_MIN_REFRESH_SECONDS,
+    ):
+        self.url = url or f"{CLERK_BASE_URL}/jwks"
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, "jwt.PyJWK"] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or settings.CLERK_JWKS_URL or CLERK_SECRET_KEY)
+
+    async def _load(self) -> dict:
+        if self.path:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        headers = {}
+        if not settings.CLERK_JWKS_URL:
+            headers["Authorization"] = f"Bearer {CLERK_SECRET_KEY}"
+        resp = await _client().get(self.url, headers=headers)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _refresh(self, unknown_kid: bool):
+        import jwt  # PyJWT / cryptography 在首次验证时才 import（缩短冷启动）
+
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if self._fetched_at and age < self.min_refresh_interval:
+                return  # 刚刷新 / 刚失败过（公钥为空时也限速，JWKS 不可用时不会每个请求都去取）
+            if self._keys and not unknown_kid and age < self.ttl:
+                return  # 其他协程刚刚刷新过
+            try:
+                jwk_set = jwt.PyJWKSet.from_dict(await self._load())
+            except Exception as e:
+                logger.error(f"[Auth] JWKS refresh failed: {e}")
+                self._fetched_at = time.monotonic()  # 失败也计入间隔
+                return
+            self._keys = {key.key_id: key for key in jwk_set.keys if key.key_id}
+            self._fetched_at = time.monotonic()
+            logger.info(f"[Auth] JWKS loaded: {len(self._keys)} keys")
+
+    async def get_key(self, kid: str) -> Optional["jwt.PyJWK"]:
+        if time.monotonic() - self._fetched_at >= self.ttl:
+            await self._refresh(unknown_kid=False)
+        if kid not in self._keys:
+            await self._refresh(unknown_kid=True)
+        return self._keys.get(kid)
+
+
+class VerifiedTokenCache:
+    """验证通过的 token → user_id（有效期不超过 token 本身的 exp）"""
+
+    def __init__(self, ttl: float = settings.CLERK_TOKEN_CACHE_SECONDS, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[str]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if time.time() >= expires_at:
+            self._entries.pop(token, None)
+            return None
+        return user_id
+
+    def put(self, token: str, user_id: str, exp: Optional[float] = None):
+        if self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        self._entries[token] = (user_id, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+jwks = JWKSCache()
+verified_tokens = VerifiedTokenCache()
+
+
+async def _verify_jwt(token: str) -> str:
+    import jwt
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    key = await jwks.get_key(header.get("kid", ""))
+    if key is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    try:
+        claims = jwt.decode(
+            token,
+            key.key,
+            algorithms=["RS256"],
+            issuer=settings.CLERK_ISSUER or None,
+            leeway=settings.CLERK_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"], "verify_aud": False},
         )
+    except jwt.InvalidTokenError as e:
+        logger.info(f"[Auth] JWT rejected: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    authorized_parties = [p.strip() for p in settings.CLERK_AUTHORIZED_PARTIES.split(",") if p.strip()]
+    if authorized_parties and claims.get("azp") not in authorized_parties:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    verified_tokens.put(token, claims["sub"], claims["exp"])
+    return claims["sub"]
+
+
+async def _verify_remote(token: str) -> str:
+    """旧方式：通过 Clerk sessions API 校验（非 JWT 的 session ID）"""
+    resp = await _client().get(
+        f"{CLERK_BASE_URL}/sessions/{token}",
+        headers={"Authorization": f"Bearer {CLERK_SECRET_KEY}"}
+    )
 
     if resp.status_code != 200:
         raise HTTPException(status_code=401, detail="Invalid token")
 
     session_data = resp.json()
     user_id = session_data.get("user_id")
+    if user_id:
+        verified_tokens.put(token, user_id)
     return user_id
+
+
+async def verify_clerk_token(request: Request):
+    authorization = request.headers.get("Authorization")
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+
+    token = authorization.split("Bearer ")[1]
+
+    user_id = verified_tokens.get(token)
+    if user_id:
+        return user_id
+
+    # session JWT 在本地用 JWKS 验签，不再每次请求都访问 Clerk
+    if token.count(".") == 2 and jwks.enabled:
+        return await _verify_jwt(token)
+    return await _verify_remote(token)
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -9,20 +10,115 @@ class Settings(BaseSettings):
     # OpenAI 配置
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-4o"
+    OPENAI_BASE_URL: str = ""                     # 空 = 官方端点；负载测试时指向 tools/stub_server.py
+    OPENAI_MAX_CONNECTIONS: int = 50              # 共享连接池大小
+    OPENAI_BREAKER_FAILURE_THRESHOLD: int = 5     # 连续失败 / 慢调用次数达到后熔断
+    OPENAI_BREAKER_RESET_SECONDS: float = 30.0    # 熔断后多久放行试探请求
+    LLM_CACHE_PATH: str = ".cache/llm_cache.sqlite3"  # LLM 响应缓存（空字符串 = 仅内存）
+    LLM_CACHE_MEMORY_ENTRIES: int = 2048              # 内存 LRU 条目数
+
+    # LLM 调用预算（令牌桶；每次调用按 llm_gateway.POLICIES 的 cost 扣减）
+    LLM_BUDGET_ENABLED: bool = True
+    LLM_BUDGET_STORE: str = "memory"                  # "memory"（按 worker）/ "mongo"（llm_budgets 集合，多 worker 共享）
+    LLM_USER_BUDGET_CAPACITY: float = 40.0            # 单个用户可连续使用的令牌数（图片判定 1 次 = 10）
+    LLM_USER_BUDGET_REFILL_PER_MINUTE: float = 20.0
+    LLM_GLOBAL_BUDGET_CAPACITY: float = 1000.0        # 全体（按 OpenAI 配额设置）
+    LLM_GLOBAL_BUDGET_REFILL_PER_MINUTE: float = 500.0
 
     # MongoDB 配置
     MONGO_URI: str = "mongodb://localhost:27017"
     MONGO_DB_NAME: str = "mystery_recipe"
+    MONGO_MAX_POOL_SIZE: int = 100                 # 每个 worker 的连接池上限
+    MONGO_MIN_POOL_SIZE: int = 0                   # 预先保持的连接数（>0 时启动预热会建立这些连接）
+    MONGO_MAX_IDLE_TIME_MS: int = 300000           # 空闲连接回收时间
+    MONGO_CONNECT_TIMEOUT_MS: int = 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000  # 找不到可用节点时尽快失败（默认 30 秒）
+    MONGO_SOCKET_TIMEOUT_MS: int = 0               # 0 = 不设置
+    MONGO_COMPRESSORS: str = ""                    # 例: "zstd,snappy,zlib"（zstd / snappy 需额外安装）
+    MONGO_READ_ONLY_PREFERENCE: Literal[
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+    ] = "primary"                                  # 菜谱 / 食材只读查询的 read preference（例: secondaryPreferred）
+    MONGO_ENSURE_INDEXES: bool = True              # 启动时应用 app/core/indexes.py 中声明的索引
+    MONGO_WARMUP: bool = True                      # 启动时 ping，避免首个请求承担连接建立
 
     # CLERK 配置
     CLERK_SECRET_KEY: str = ""
+    CLERK_JWKS_URL: str = ""                    # 空 = Backend API /v1/jwks（使用 CLERK_SECRET_KEY）
+    CLERK_JWKS_FILE: str = ""                   # 本地 JWKS 文件（离线测试用，优先于 URL）
+    CLERK_ISSUER: str = ""                      # 设置后校验 iss（例: https://xxx.clerk.accounts.dev）
+    CLERK_AUTHORIZED_PARTIES: str = ""          # 允许的 azp（逗号分隔，空 = 不校验）
+    CLERK_JWKS_TTL_SECONDS: float = 3600.0      # JWKS 定期刷新间隔
+    CLERK_JWKS_MIN_REFRESH_SECONDS: float = 60.0  # 未知 kid 触发刷新的最小间隔
+    CLERK_TOKEN_CACHE_SECONDS: float = 30.0     # 已验证 token 的缓存时间（0 = 不缓存）
+    CLERK_LEEWAY_SECONDS: float = 5.0           # exp / nbf 允许的时钟误差
 
     # LINE Messaging API 配置 ✅ 新增
     LINE_CHANNEL_ACCESS_TOKEN: str = ""
     LINE_CHANNEL_SECRET: str = ""
+    LINE_API_ENDPOINT: str = "https://api.line.me"            # 负载测试时可指向 stub
+    LINE_API_DATA_ENDPOINT: str = "https://api-data.line.me"
+
+    # LINE 送信レイヤー配置
+    LINE_COALESCE_WINDOW_MS: int = 250           # 同一用户消息合并窗口
+    LINE_REPLY_TOKEN_TTL_SECONDS: float = 50.0   # reply token 视为有效的时间
+    LINE_PUSH_RATE_PER_SECOND: float = 50.0      # push 令牌桶速率
+    LINE_PUSH_BURST: int = 100                   # push 令牌桶容量
+    LINE_PUSH_MAX_RETRIES: int = 4               # 429 / 5xx 重试次数
+    LINE_PROGRESS_NOTICE_DELAY_SECONDS: float = 2.0  # 超过该时间才发送「処理中」提示
 
     FRONTEND_URL: str = ""
 
+    # 「今すぐ作れる」索引
+    COOKABLE_MAX_USERS: int = 10000               # 内存中保留状态的用户数（LRU）
+    COOKABLE_CATALOG_TTL_SECONDS: float = 300.0   # 菜谱目录重新加载间隔
+    COOKABLE_NOTIFY_ENABLED: bool = True          # 库存更新后通过 LINE 通知新增可做菜谱
+    RECIPE_INDEX_PATH: str = ""                  # 设置后菜谱目录编译为 mmap 文件，多 worker 共享（需要 numpy）
+
+    # 菜谱正文的共享缓存（用户状态只保存菜谱 ID / 版本 / 步骤）
+    RECIPE_CACHE_MAX_ENTRIES: int = 5000        # LRU 条目数
+    RECIPE_CACHE_TTL_SECONDS: float = 300.0     # 不带版本的查询（推荐时）重新读取的间隔
+
+    # 近似重复菜谱（MinHash / LSH）
+    RECIPE_DUPLICATE_THRESHOLD: float = 0.8     # 食材集合的 Jaccard 估计值 >= 该值视为同一道菜的变体
+    RECIPE_DIVERSITY_SAMPLE: int = 20           # 推荐时先随机取出的候选数（在其中按菜聚类后再选）
+    RECIPE_DIVERSITY_THRESHOLD: float = 0.7     # 推荐多样化时视为同一道菜的阈值（比去重宽松）
+
+    # 献立（複数レシピ）最適化
+    MEAL_PLAN_MAX_RECIPES: int = 14              # 一次最多规划的菜谱数
+    MEAL_PLAN_MAX_CANDIDATES: int = 3000         # 按单独得分剪枝后的候选上限
+    MEAL_PLAN_TIME_BUDGET_MS: float = 150.0      # 求解时间上限（超时返回当前最优解）
+
+    # 库存批量导入
+    INVENTORY_BULK_BATCH_SIZE: int = 1000   # 每批 bulk_write 的行数
+    INVENTORY_BULK_MAX_ERRORS: int = 1000   # 响应中返回的错误行上限
+    INVENTORY_BULK_MAX_LINE_BYTES: int = 65536  # 单行上限（超过的行记为错误，不缓存在内存中）
+
+    # 菜谱完成时的库存扣减（按批写入）
+    COMPLETION_BATCH_SIZE: int = 200          # 达到该数量立即写入
+    COMPLETION_FLUSH_INTERVAL_MS: int = 100   # 否则最多等待该时间
+
+    # HTTP 缓存（ETag / Cache-Control）
+    HTTP_CACHE_PUBLIC_MAX_AGE: int = 60                   # /ingredients 的 max-age
+    HTTP_CACHE_CATALOG_VERSION_TTL_SECONDS: float = 30.0  # 食材目录版本的重新查询间隔
+
+    # 指标接口 /metrics（Prometheus 文本格式；含路由 / 集合名等内部信息，默认不挂载）
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str = ""                 # 设置时要求 Authorization: Bearer <token>（Prometheus 的 bearer_token）
+
+    # 请求剖析（X-Profile 签名头或采样触发；/admin/profiles 查看）
+    PROFILING_SECRET: str = ""              # X-Profile 签名密钥（空 = 不接受签名头）
+    PROFILING_SAMPLE_RATE: float = 0.0      # 随机剖析比例（0 = 关闭）
+    PROFILING_DIR: str = ".cache/profiles"
+    PROFILING_MAX_PROFILES: int = 50        # 环形缓冲容量（超出时删除最旧的）
+    PROFILING_TRAILING_SECONDS: float = 10.0  # 响应后继续收集后台任务时间线的时间
+    PROFILING_ADMIN_TOKEN: str = ""         # /admin/profiles 的 X-Admin-Token（空 = 不挂载）
+
+    # 诊断接口 /debug/stats（事件循环延迟、Mongo 命令计数；仅负载测试时开启）
+    DEBUG_STATS_ENABLED: bool = False
+
+    # LINE 会话步骤迁移（乐观并发冲突时的重试次数）
+    STEP_TRANSITION_MAX_RETRIES: int = 3
+
     class Config:
         env_file = f".env.{os.getenv('ENVIRONMENT', 'development')}"
         env_file_encoding = 'utf-8'
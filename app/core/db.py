@@ -1,15 +1,96 @@
-from pymongo import AsyncMongoClient
+from pymongo import AsyncMongoClient, ReadPreference
 from functools import lru_cache
+from urllib.parse import parse_qsl
 from app.core.config import settings
+from app.core.diagnostics import command_counter
+from app.core.metrics import mongo_metrics
+from app.core.profiling import profiling_listener
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+def _uri_option_names(uri: str) -> set:
+    """MONGO_URI 查询串中出现的参数名（小写；不解析 DNS）"""
+    query = uri.partition("?")[2]
+    return {name.lower() for name, _ in parse_qsl(query, keep_blank_values=True)}
+
+def _client_options() -> dict:
+    """
+    连接池 / 超时 / 压缩。优先级：显式设置的环境变量 > MONGO_URI 中的同名参数 > Settings 的默认值
+    （URI 里写了的参数不会被 Settings 的默认值覆盖）。
+    """
+    explicit = settings.model_fields_set
+    in_uri = _uri_option_names(settings.MONGO_URI)
+    candidates = {
+        "maxPoolSize": ("MONGO_MAX_POOL_SIZE", settings.MONGO_MAX_POOL_SIZE),
+        "minPoolSize": ("MONGO_MIN_POOL_SIZE", settings.MONGO_MIN_POOL_SIZE),
+        "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", settings.MONGO_MAX_IDLE_TIME_MS),
+        "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", settings.MONGO_CONNECT_TIMEOUT_MS),
+        "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", settings.MONGO_SERVER_SELECTION_TIMEOUT_MS),
+        "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", settings.MONGO_SOCKET_TIMEOUT_MS or None),  # 0 = 不设置
+        "compressors": ("MONGO_COMPRESSORS", settings.MONGO_COMPRESSORS or None),
+        "appname": (None, "mystery-recipe-backend"),
+    }
+    options = {}
+    for option, (field, value) in candidates.items():
+        if value is None:
+            continue
+        if field in explicit or option.lower() not in in_uri:
+            options[option] = value
+    return options
 
 @lru_cache()
 def get_client():
-    return AsyncMongoClient(settings.MONGO_URI)
+    return AsyncMongoClient(
+        settings.MONGO_URI,
+        event_listeners=[command_counter, mongo_metrics, profiling_listener],
+        **_client_options(),
+    )
+
+
+class _Deferred:
+    """首次访问属性时才解析目标（import 时不创建客户端，也不解析 mongodb+srv 的 DNS）"""
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._target = None
+
+    def _get(self):
+        if self._target is None:
+            self._target = self._resolve()
+        return self._target
 
-db = get_client()[settings.MONGO_DB_NAME]
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, name):
+        return self._get()[name]
+
+
+db = _Deferred(lambda: get_db())
 
 def get_db():
     return get_client()[settings.MONGO_DB_NAME]
 
 def get_collection(collection_name: str):
-    return get_db()[collection_name]
\ No newline at end of file
+    return _Deferred(lambda: get_db()[collection_name])
+
+def get_read_collection(collection_name: str):
+    """只读查询用（菜谱 / 食材主数据）：使用 MONGO_READ_ONLY_PREFERENCE，可分流到 secondary"""
+    read_preference = READ_PREFERENCES[settings.MONGO_READ_ONLY_PREFERENCE]
+    return _Deferred(lambda: get_db().get_collection(collection_name, read_preference=read_preference))
+
+async def warm_up():
+    """建立连接并完成握手（minPoolSize > 0 时连接池会在后台补足）"""
+    await get_client().admin.command("ping")
+
+async def close_client():
+    """lifespan 结束时关闭（未创建过客户端时什么也不做）"""
+    if get_client.cache_info().currsize:
+        await get_client().close()
+        get_client.cache_clear()
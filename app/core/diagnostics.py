@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """定期 sleep 并测量实际唤醒延迟，作为事件循环阻塞程度的指标"""
+
+    def __init__(self, interval: float = 0.1, window: int = 3000):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def reset(self):
+        self.samples.clear()
+        self.max_lag = 0.0
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p99_ms": round(ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+class CommandCounter(monitoring.CommandListener):
+    """PyMongo 命令监听：按「集合.命令」统计次数与耗时"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.failures = Counter()
+        self.total_ms = Counter()
+        self._pending = {}
+
+    @staticmethod
+    def _label(command_name: str, command) -> str:
+        collection = command.get(command_name) if command else None
+        return f"{collection}.{command_name}" if isinstance(collection, str) else command_name
+
+    def started(self, event):
+        self._pending[event.request_id] = self._label(event.command_name, event.command)
+
+    def succeeded(self, event):
+        label = self._pending.pop(event.request_id, event.command_name)
+        self.counts[label] += 1
+        self.total_ms[label] += event.duration_micros / 1000
+
+    def failed(self, event):
+        label = self._pending.pop(event.request_id, event.command_name)
+        self.counts[label] += 1
+        self.failures[label] += 1
+        self.total_ms[label] += event.duration_micros / 1000
+
+    def reset(self):
+        self.counts.clear()
+        self.failures.clear()
+        self.total_ms.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            label: {
+                "count": count,
+                "failures": self.failures[label],
+                "avg_ms": round(self.total_ms[label] / count, 3),
+            }
+            for label, count in sorted(self.counts.items())
+        }
+
+
+loop_lag = LoopLagMonitor()
+command_counter = CommandCounter()
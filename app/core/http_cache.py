@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import time
+from typing import Optional
+
+from fastapi import Request, Response
+
+from app.core.config import settings
+from app.core.db import get_read_collection
+
+# ======================
+# Cache-Control 策略
+# ======================
+NO_STORE = "no-store"                  # 写操作 / 推荐结果等每次都不同的响应
+PRIVATE_REVALIDATE = "private, no-cache"  # 用户数据：可缓存但每次用 ETag 重新验证
+PUBLIC_REVALIDATE = f"public, max-age={settings.HTTP_CACHE_PUBLIC_MAX_AGE}, stale-while-revalidate=300"
+
+
+def cache_control(value: str):
+    """路由级策略：dependencies=[Depends(cache_control(...))]"""
+    def dependency(response: Response):
+        response.headers["Cache-Control"] = value
+    return dependency
+
+
+def default_cache_control(method: str) -> str:
+    """未声明策略的路由：GET 需重新验证，其余不缓存"""
+    return PRIVATE_REVALIDATE if method in ("GET", "HEAD") else NO_STORE
+
+
+# ======================
+# ETag
+# ======================
+def make_etag(*parts) -> str:
+    raw = "|".join(str(p) for p in parts)
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较：忽略 W/ 前缀
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(etag: str, policy: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": policy})
+
+
+def inventory_etag(user_id: str, user: Optional[dict]) -> str:
+    """用户库存的 ETag：写入时递增的 inventory_version（旧文档没有）+ updated_at"""
+    if not user:
+        return make_etag("inventory", user_id, "none")
+    return make_etag("inventory", user_id, user.get("inventory_version", 0), user.get("updated_at"))
+
+
+class CollectionVersion:
+    """
+    集合整体的版本（件数 + 最新 _id + 最新 updated_at），每 ttl 秒最多查询一次。
+    用于很少变化的主数据（食材目录）。
+    """
+
+    def __init__(self, collection_name: str, ttl: float):
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self._version: Optional[str] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def peek(self) -> Optional[str]:
+        if self._version is None or time.monotonic() - self._loaded_at >= self.ttl:
+            return None
+        return self._version
+
+    async def get(self) -> str:
+        version = self.peek()
+        if version is not None:
+            return version
+        async with self._lock:
+            if self.peek() is None:
+                col = get_read_collection(self.collection_name)
+                count = await col.estimated_document_count()
+                latest = await col.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+                updated = await col.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+                self._version = f"{count}:{latest and latest['_id']}:{updated and updated.get('updated_at')}"
+                self._loaded_at = time.monotonic()
+        return self._version
+
+    def invalidate(self):
+        self._version = None
+
+
+ingredient_catalog_version = CollectionVersion("ingredient_list", settings.HTTP_CACHE_CATALOG_VERSION_TTL_SECONDS)
@@ -0,0 +1,84 @@
+"""
+声明式索引注册表。启动时（MONGO_ENSURE_INDEXES=true）或手动执行时幂等地应用：
+已存在的同名同键索引跳过；同名但定义不同的索引只记录警告，不会自动删除。
+
+    python -m app.core.indexes
+"""
+import asyncio
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.core.db import get_db
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    # 推荐 pipeline：cooking_time 范围 + ingredients 的 $elemMatch(name, amount)
+    "recipe_list": [
+        IndexModel([("cooking_time", ASCENDING)], name="cooking_time_1"),
+        IndexModel([("ingredients.name", ASCENDING), ("ingredients.amount", ASCENDING)], name="ingredients_name_amount"),
+        IndexModel([("name", ASCENDING)], name="name_1"),
+        # 批量导入的去重键（手工 / GPT 写入的菜谱没有该字段）
+        IndexModel(
+            [("source_key", ASCENDING)], name="source_key_1", unique=True,
+            partialFilterExpression={"source_key": {"$exists": True}},
+        ),
+        # 近似重复检测的 LSH 桶（多键）
+        IndexModel([("lsh_bands", ASCENDING)], name="lsh_bands_1"),
+        # 目录版本（CollectionVersion：最新 updated_at），没有索引时每次检查都是全集合扫描
+        IndexModel([("updated_at", DESCENDING)], name="updated_at_-1"),
+    ],
+    # 食材检索：name / synonyms 等值查询（GPT 建议回查）、category 过滤
+    "ingredient_list": [
+        IndexModel([("name", ASCENDING)], name="name_1"),
+        IndexModel([("synonyms", ASCENDING)], name="synonyms_1"),
+        IndexModel([("category", ASCENDING), ("name", ASCENDING)], name="category_1_name_1"),
+        # 目录版本（/ingredients 的 ETag：最新 updated_at）
+        IndexModel([("updated_at", DESCENDING)], name="updated_at_-1"),
+    ],
+    # users 只按 _id 访问（默认索引即可）
+    "users": [],
+    "recipe_completions": [
+        IndexModel([("user_id", ASCENDING), ("completed_at", DESCENDING)], name="user_id_1_completed_at_-1"),
+    ],
+    # LLM 预算的令牌桶（LLM_BUDGET_STORE=mongo）：桶补满后即可删除
+    "llm_budgets": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0),
+    ],
+}
+
+
+def _same_keys(existing: dict, model: IndexModel) -> bool:
+    return list(existing.get("key", [])) == list(model.document["key"].items())
+
+
+async def ensure_indexes(indexes: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, List[str]]:
+    """返回 {集合: 新建的索引名}；某个集合失败时记录警告，继续处理其余集合"""
+    db = get_db()
+    created: Dict[str, List[str]] = {}
+    for collection_name, models in indexes.items():
+        if not models:
+            continue
+        try:
+            collection = db[collection_name]
+            existing = await collection.index_information()
+            missing = []
+            for model in models:
+                name = model.document["name"]
+                if name not in existing:
+                    missing.append(model)
+                elif not _same_keys(existing[name], model):
+                    logger.warning(f"[Indexes] {collection_name}.{name} exists with a different definition; skipped")
+            if missing:
+                created[collection_name] = await collection.create_indexes(missing)
+                logger.info(f"[Indexes] {collection_name}: created {created[collection_name]}")
+        except Exception as e:
+            logger.warning(f"[Indexes] {collection_name}: failed to apply indexes: {e}")
+    return created
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(ensure_indexes()))
@@ -0,0 +1,246 @@
+"""
+进程内指标（Prometheus 文本格式，GET /metrics）。
+不依赖外部 collector / 客户端库，本地直接 curl 即可查看。
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+from app.core.profiling import record_span
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Prometheus 文本格式的样本行"""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """值由 callback 在采集时计算（callback 返回 {label 值元组: 值} 或单个数值）"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        values = dict(self._values)
+        if self.callback:
+            result = self.callback()
+            values.update(result if isinstance(result, dict) else {(): result})
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[tuple, list] = {}   # key → [bucket counts..., sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0] * len(self.buckets) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+                break
+        entry[-1] += value
+
+    def samples(self):
+        lines = []
+        for key, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing  # 重复 import 时返回同一实例
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ======================
+# 公共指标
+# ======================
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command", "outcome")
+)
+mongo_documents = registry.counter(
+    "mongo_documents_total", "Documents returned (reads) or affected (writes) by MongoDB commands",
+    ("collection", "command"),
+)
+llm_request_duration = registry.histogram(
+    "llm_request_duration_seconds", "OpenAI request latency per attempt", ("call_type", "outcome")
+)
+llm_tokens = registry.counter("llm_tokens_total", "OpenAI token usage", ("call_type", "kind"))
+llm_errors = registry.counter("llm_errors_total", "OpenAI errors by type", ("call_type", "error"))
+llm_cache_hits = registry.counter("llm_cache_hits_total", "LLM responses served from cache", ("call_type",))
+llm_budget_tokens = registry.counter(
+    "llm_budget_tokens_total", "LLM budget tokens consumed by admitted calls", ("scope", "call_type")
+)
+llm_budget_rejections = registry.counter(
+    "llm_budget_rejections_total", "LLM calls rejected by admission control", ("scope", "call_type")
+)
+recipe_cache_lookups = registry.counter(
+    "recipe_cache_lookups_total", "Shared recipe cache lookups by outcome", ("outcome",)
+)
+line_api_duration = registry.histogram(
+    "line_api_duration_seconds", "LINE Messaging API call latency", ("api", "outcome")
+)
+line_api_errors = registry.counter("line_api_errors_total", "LINE Messaging API errors", ("api", "status"))
+
+
+def record_line_call(api: str, seconds: float, error=None):
+    """LINE API 调用结果（error 为 LineBotApiError 或其他异常）"""
+    status = getattr(error, "status_code", None)
+    outcome = "ok" if error is None else "error"
+    line_api_duration.observe(seconds, api=api, outcome=outcome)
+    record_span("line", api, time.perf_counter() - seconds, seconds, status=status)
+    if error is not None:
+        line_api_errors.inc(api=api, status=str(status) if status else type(error).__name__)
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """按「集合 × 命令」记录延迟与文档数"""
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _collection(command_name: str, command) -> str:
+        if not command:
+            return ""
+        if command_name == "getMore":
+            return command.get("collection", "")
+        value = command.get(command_name)
+        return value if isinstance(value, str) else ""
+
+    @staticmethod
+    def _documents(command_name: str, reply) -> int:
+        if not reply:
+            return 0
+        cursor = reply.get("cursor")
+        if isinstance(cursor, dict):
+            return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+        if command_name == "findAndModify":
+            return 1 if reply.get("value") else 0
+        n = reply.get("n")
+        return n if isinstance(n, int) else 0
+
+    def started(self, event):
+        self._pending[event.request_id] = (self._collection(event.command_name, event.command), event.command_name)
+
+    def succeeded(self, event):
+        collection, command = self._pending.pop(event.request_id, ("", event.command_name))
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=command, outcome="ok")
+        documents = self._documents(event.command_name, event.reply)
+        if documents:
+            mongo_documents.inc(documents, collection=collection, command=command)
+
+    def failed(self, event):
+        collection, command = self._pending.pop(event.request_id, ("", event.command_name))
+        mongo_command_duration.observe(
+            event.duration_micros / 1e6, collection=collection, command=command, outcome="error"
+        )
+
+
+mongo_metrics = MongoMetricsListener()
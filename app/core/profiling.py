@@ -0,0 +1,223 @@
+"""
+按需请求剖析：签名头（X-Profile）或采样率触发。
+记录 cProfile 统计 + 该请求期间被 await 的 MongoDB / OpenAI / LINE 调用时间线，
+写入磁盘上的环形缓冲（最多 PROFILING_MAX_PROFILES 个），由 /admin/profiles 查看与下载。
+未触发时的开销只有一次 header 查找和一次随机数比较。
+"""
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import List, Optional
+
+from pymongo import monitoring
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+# 当前请求的时间线；由请求派生的后台任务（safe_task）会继承同一个列表
+_timeline: ContextVar[Optional[list]] = ContextVar("profile_timeline", default=None)
+
+# cProfile 在同一线程只能有一个生效
+_profiler_lock = threading.Lock()
+
+
+def sign(method: str, path: str, timestamp: Optional[int] = None) -> str:
+    """生成 X-Profile 头的值：<unix 时间>.<HMAC-SHA256(method path 时间)>"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    message = f"{timestamp}:{method.upper()}:{path}".encode("utf-8")
+    digest = hmac.new(settings.PROFILING_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}.{digest}"
+
+
+def _valid_signature(value: str, method: str, path: str) -> bool:
+    if not settings.PROFILING_SECRET:
+        return False
+    timestamp, _, _ = value.partition(".")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE_SECONDS:
+        return False
+    # 按字节比较：compare_digest 对非 ASCII 的 str 会抛 TypeError（任意客户端都能触发 500）
+    expected = sign(method, path, int(timestamp))
+    return hmac.compare_digest(value.encode("utf-8", "surrogateescape"), expected.encode("utf-8"))
+
+
+def should_profile(request) -> Optional[str]:
+    """返回触发原因（"header" / "sample"），不剖析时返回 None"""
+    header = request.headers.get(PROFILE_HEADER)
+    if header is not None and _valid_signature(header, request.method, request.url.path):
+        return "header"
+    if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def record_span(kind: str, label: str, started: float, duration: float, **extra):
+    """在当前请求的时间线上追加一次外部调用（未剖析时为空操作）"""
+    timeline = _timeline.get()
+    if timeline is not None:
+        timeline.append({"kind": kind, "label": label, "start": started, "duration_ms": round(duration * 1000, 3), **extra})
+
+
+class ProfilingListener(monitoring.CommandListener):
+    """MongoDB 命令 → 时间线（事件在发起命令的协程上下文中同步触发）"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        if _timeline.get() is not None:
+            collection = event.command.get(event.command_name) if event.command else None
+            label = f"{collection}.{event.command_name}" if isinstance(collection, str) else event.command_name
+            self._pending[event.request_id] = (label, time.perf_counter())
+
+    def succeeded(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending:
+            record_span("mongo", pending[0], pending[1], event.duration_micros / 1e6)
+
+    def failed(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending:
+            record_span("mongo", pending[0], pending[1], event.duration_micros / 1e6, error=str(event.failure)[:200])
+
+
+profiling_listener = ProfilingListener()
+
+
+# ======================
+# 磁盘环形缓冲
+# ======================
+_PROFILE_ID = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+
+
+class ProfileStore:
+    def __init__(self, directory: str = settings.PROFILING_DIR, max_profiles: int = settings.PROFILING_MAX_PROFILES):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id: str, ext: str) -> Optional[str]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        return os.path.join(self.directory, f"{profile_id}.{ext}")
+
+    def save(self, summary: dict, profiler: Optional[cProfile.Profile]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        if profiler is not None:
+            profiler.dump_stats(self._path(profile_id, "prof"))
+        with open(self._path(profile_id, "json"), "w", encoding="utf-8") as f:
+            json.dump({"id": profile_id, **summary}, f, ensure_ascii=False, default=str)
+        self._trim()
+        return profile_id
+
+    def _trim(self):
+        ids = sorted({name.rsplit(".", 1)[0] for name in os.listdir(self.directory) if _PROFILE_ID.match(name.rsplit(".", 1)[0])})
+        for profile_id in ids[:-self.max_profiles] if len(ids) > self.max_profiles else []:
+            for ext in ("json", "prof"):
+                try:
+                    os.remove(self._path(profile_id, ext))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        items = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json") and _PROFILE_ID.match(name[:-5]):
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    data = json.load(f)
+                items.append({k: data.get(k) for k in ("id", "method", "path", "status", "trigger", "duration_ms", "started_at")})
+        return items
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        path = self._path(profile_id, "json")
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        path = self._path(profile_id, "prof")
+        return path if path and os.path.exists(path) else None
+
+
+store = ProfileStore()
+
+
+def _top_stats(profiler: cProfile.Profile, limit: int = 40) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+async def profile_request(request, call_next, trigger: str):
+    """剖析一次请求。cProfile 以线程为单位，期间并发执行的其他协程也会计入（summary 中注明）"""
+    timeline: list = []
+    token = _timeline.set(timeline)
+    profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+    started_at = time.time()
+    started = time.perf_counter()
+    status = 500
+    try:
+        if profiler:
+            profiler.enable()
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if profiler:
+            profiler.disable()
+            _profiler_lock.release()
+        duration = time.perf_counter() - started
+        _timeline.reset(token)
+        summary = {
+            "method": request.method,
+            "path": request.url.path,
+            "query": request.url.query,
+            "status": status,
+            "trigger": trigger,
+            "started_at": started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "cprofile": "thread-wide" if profiler else "skipped (another profile in progress)",
+        }
+        # 后台任务（LINE webhook 的实际处理）在响应后继续向 timeline 追加，延迟写入以便收录
+        asyncio.get_running_loop().call_later(
+            settings.PROFILING_TRAILING_SECONDS, _schedule_save, summary, timeline, started, profiler
+        )
+
+
+_save_tasks = set()
+
+
+def _schedule_save(summary: dict, timeline: list, started: float, profiler: Optional[cProfile.Profile]):
+    for span in timeline:
+        span["offset_ms"] = round((span.pop("start") - started) * 1000, 3)
+    summary["timeline"] = sorted(timeline, key=lambda s: s["offset_ms"])
+    summary["top_functions"] = _top_stats(profiler) if profiler else ""
+    task = asyncio.ensure_future(asyncio.to_thread(store.save, summary, profiler))
+    _save_tasks.add(task)
+    task.add_done_callback(_on_saved)
+
+
+def _on_saved(task: asyncio.Task):
+    _save_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"[Profiling] failed to save profile: {task.exception()}")
+    elif not task.cancelled():
+        logger.info(f"[Profiling] saved profile {task.result()}")
@@ -0,0 +1,21 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:  # 可选依赖：安装了 orjson 时使用（更快），否则退回标准库
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    直接序列化已是 JSON 兼容结构（dict / list / str / 数值）的内容。
+    路由返回该响应时 FastAPI 不再经由 response_model 做校验与二次序列化。
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
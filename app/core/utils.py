@@ -1,10 +1,16 @@
 from bson import ObjectId
+from pydantic_core import core_schema
 
 class PyObjectId(ObjectId):
     @classmethod
     def __get_validators__(cls):
         yield cls.validate
 
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        # pydantic v2 不再调用 __get_validators__
+        return core_schema.no_info_plain_validator_function(cls.validate)
+
     @classmethod
     def validate(cls, v):
         if isinstance(v, ObjectId):
@@ -1,10 +1,57 @@
 # main.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from app.core import auth
+from app.core.config import settings
+from app.core.db import close_client, warm_up
+from app.core.diagnostics import loop_lag
+from app.core.http_cache import default_cache_control
+from app.core.indexes import ensure_indexes
+from app.core.metrics import http_request_duration
+from app.core.profiling import profile_request, should_profile
 from app.routers import recipe_router, line_bot_router, inventory_router
 from app.routers import ingredient_router
+from app.services.completion_service import completions
+from app.services.cookable_index import cookable_index
+from app.services.line_delivery import delivery
+from app.services.llm_gateway import gateway
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DEBUG_STATS_ENABLED or settings.METRICS_ENABLED:
+        loop_lag.start()
+    # 预先建立连接 / 应用索引；失败只记录警告，不阻塞启动（首个请求时会重试连接）
+    if settings.MONGO_WARMUP:
+        try:
+            await warm_up()
+        except Exception as e:
+            logger.warning(f"[Startup] MongoDB warm-up failed: {e}")
+    if settings.MONGO_ENSURE_INDEXES:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            logger.warning(f"[Startup] ensure_indexes failed: {e}")
+    # 「今すぐ作れる」目录在后台加载（不阻塞启动，也不让首个库存更新请求承担全量读取）
+    warm_task = asyncio.create_task(cookable_index.warm())
+    yield
+    warm_task.cancel()
+    # 客户端均在首次使用时创建（缩短冷启动），这里按依赖顺序关闭
+    await completions.aclose()  # 写入缓冲中的完成事件
+    await delivery.aclose()     # 发送合并窗口中的消息
+    await gateway.aclose()
+    await auth.aclose()
+    await close_client()
+    await loop_lag.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,14 +64,25 @@ app.add_middleware(
 # ✅ 加入全局 HTTP Header 规范中间件
 @app.middleware("http")
 async def add_standard_headers(request: Request, call_next):
+    started = time.perf_counter()
     response: Response = await call_next(request)
 
+    # 按路由模板统计延迟（未匹配的路径合并，避免标签爆炸）
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+
     # 标准 Content-Type (统一编码声明)
-    if response.headers.get("Content-Type") is None:
+    if response.headers.get("Content-Type") is None and response.status_code != 304:
         response.headers["Content-Type"] = "application/json; charset=utf-8"
 
-    # Cache-Control 策略 (生产环境可以调整为更长)
-    response.headers["Cache-Control"] = "public, max-age=600"
+    # Cache-Control 策略：路由声明优先（app/core/http_cache.py），否则 GET 需验证、其余不缓存
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = default_cache_control(request.method)
 
     # 其他安全性标准可以加入 (可选强化)
     response.headers["X-Content-Type-Options"] = "nosniff"
@@ -32,11 +90,32 @@ async def add_standard_headers(request: Request, call_next):
 
     return response
 
+# ✅ 按需剖析（未配置时不注册，零开销）
+if settings.PROFILING_SECRET or settings.PROFILING_SAMPLE_RATE:
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        trigger = should_profile(request)
+        if trigger is None:
+            return await call_next(request)
+        return await profile_request(request, call_next, trigger)
+
 app.include_router(recipe_router.router)
 app.include_router(ingredient_router.router)
 app.include_router(line_bot_router.router)
 app.include_router(inventory_router.router)
 
+if settings.METRICS_ENABLED:
+    from app.routers import metrics_router
+    app.include_router(metrics_router.router)
+
+if settings.PROFILING_ADMIN_TOKEN:
+    from app.routers import profiling_router
+    app.include_router(profiling_router.router)
+
+if settings.DEBUG_STATS_ENABLED:
+    from app.routers import debug_router
+    app.include_router(debug_router.router)
+
 @app.get("/")
 def read_root():
     return {"message": "Hello ミステリーレシピ!"}
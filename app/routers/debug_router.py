@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+
+from app.core.diagnostics import command_counter, loop_lag
+from app.routers.line_bot_router import background_tasks
+
+# ⚠️ 仅在 DEBUG_STATS_ENABLED=true 时挂载（负载测试用）
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+@router.get("/stats")
+async def get_stats():
+    return {
+        "event_loop_lag": loop_lag.snapshot(),
+        "mongo_commands": command_counter.snapshot(),
+        "background_tasks": len(background_tasks),
+    }
+
+
+@router.post("/stats/reset")
+async def reset_stats():
+    loop_lag.reset()
+    command_counter.reset()
+    return {"success": True}
@@ -1,26 +1,46 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Query, Request, Response
 from typing import List
 from collections import defaultdict
-from app.core.db import get_collection
-import openai
-from app.core.config import settings
+from app.core.db import get_read_collection
+from app.services.llm_gateway import LLMUnavailableError, gateway
 from datetime import datetime
 from pydantic import BaseModel
 from app.schemas.inventory_schema import InventoryItem
 from app.core.db import db
+from app.core.http_cache import (
+    NO_STORE,
+    PUBLIC_REVALIDATE,
+    cache_control,
+    etag_matches,
+    ingredient_catalog_version,
+    make_etag,
+    not_modified,
+)
 
-ingredient_col = get_collection("ingredient_list")
+ingredient_col = get_read_collection("ingredient_list")
 router = APIRouter(prefix="/ingredients", tags=["Ingredients"])
 
-# ✅ 初始化 OpenAI 客户端
-openai.api_key = settings.OPENAI_API_KEY
+def _degraded(response: Response) -> dict:
+    """GPT 候选不可用时的空结果：不得被公共缓存，也不带目录版本的 ETag（否则恢复后仍一直 304）"""
+    response.headers["Cache-Control"] = NO_STORE
+    del response.headers["ETag"]
+    return {"results": [], "total": 0, "source": "db", "degraded": True}
 
-@router.get("")
+
+@router.get("", dependencies=[Depends(cache_control(PUBLIC_REVALIDATE))])
 async def get_ingredients(
+    request: Request,
+    response: Response,
     search: str = Query("", description="検索キーワード"),
     categories: List[str] = Query([], description="カテゴリフィルター"),
     group_by: str = Query("", description="グルーピングキー（例: category)")
 ):
+    # ✅ ETag = 食材目录版本 + 查询参数（If-None-Match 命中时直接 304）
+    etag = make_etag("ingredients", await ingredient_catalog_version.get(), request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag, PUBLIC_REVALIDATE)
+    response.headers["ETag"] = etag
+
     query = {}
     if search:
         query["$or"] = [
@@ -66,10 +86,16 @@ async def get_ingredients(
             "source": "db"
         }
 
-    # ✅ 第二步：调用 OpenAI 生成候选
+    # ✅ 第二步：调用 OpenAI 生成候选（未登录的检索按客户端 IP 计算预算）
+    # 反向代理后面运行时 request.client 是代理的地址（全部请求共用一个桶）：
+    # uvicorn 需加 --proxy-headers --forwarded-allow-ips=<代理地址>，由它按可信代理的 X-Forwarded-For 改写。
+    # 这里不直接读 X-Forwarded-For（客户端可任意伪造，每次换值即可绕过预算）
     if search:
+        client_key = f"ip:{request.client.host}" if request.client else None
         try:
-            gpt_response = openai.OpenAI().chat.completions.create(
+            gpt_response = await gateway.chat_completion(
+                "ingredient_suggest",
+                user_id=client_key,
                 model="gpt-4o",  # 可换成 gpt-4o
                 messages=[
                     {
@@ -93,9 +119,12 @@ async def get_ingredients(
                 suggestions = [s.strip() for s in suggestions_text.split(",") if s.strip()]
             else:
                 suggestions = []
+        except LLMUnavailableError:
+            # 预算不足 / 熔断 / 超时 → 只返回本地检索结果（降级）
+            return _degraded(response)
         except Exception as e:
             print(f"OpenAI API error: {e}")
-            suggestions = []
+            return _degraded(response)
 
         # ✅ 如果 GPT 提供了候选 → 回到 MongoDB 再查
         fallback_results = []
@@ -116,6 +145,7 @@ async def get_ingredients(
                     "category": doc.get("category", ""),
                     "units": doc.get("units", []),
                 })
+        return {"results": fallback_results, "total": len(fallback_results), "source": "gpt"}
 
     # ✅ 搜索词为空 → 返回空数组
     return {"results": [], "total": 0, "source": "db"}
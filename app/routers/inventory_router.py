@@ -1,14 +1,53 @@
-from datetime import datetime
-from fastapi import APIRouter
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, Request, Response
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
 from app.core.db import db
-from app.schemas.inventory_schema import InventoryResponse, InventoryPatchRequest
+from app.core.http_cache import (
+    PRIVATE_REVALIDATE,
+    cache_control,
+    etag_matches,
+    inventory_etag,
+    not_modified,
+)
+from app.schemas.inventory_schema import InventoryResponse, InventoryPatchRequest, InventoryBulkLine
+from app.routers.line_bot_router import safe_task, send_message_async
+from app.services.cookable_index import cookable_index
+from app.services.inventory_service import (
+    BulkFold,
+    apply_patch,
+    build_patch_pipeline,
+    diff_inventory,
+    iter_records,
+    normalize_patch,
+)
 
 router = APIRouter(prefix="/users", tags=["Inventory"])
+logger = logging.getLogger(__name__)
 
-# ✅ 获取用户库存
-@router.get("/{user_id}/inventory", response_model=InventoryResponse)
-async def get_inventory(user_id: str):
-    user = await db.users.find_one({"_id": user_id}, {"inventory": 1, "updated_at": 1})
+# ✅ 获取用户库存（ETag = 用户文档上的 inventory_version + updated_at，所有 worker 一致）
+# 带 If-None-Match 时先只按投影读取版本，命中则直接 304，不读取库存数组
+@router.get(
+    "/{user_id}/inventory",
+    response_model=InventoryResponse,
+    dependencies=[Depends(cache_control(PRIVATE_REVALIDATE))],
+)
+async def get_inventory(user_id: str, request: Request, response: Response):
+    if request.headers.get("If-None-Match"):
+        user = await db.users.find_one({"_id": user_id}, {"inventory_version": 1, "updated_at": 1})
+        etag = inventory_etag(user_id, user)
+        if etag_matches(request, etag):
+            return not_modified(etag, PRIVATE_REVALIDATE)
+
+    user = await db.users.find_one({"_id": user_id}, {"inventory": 1, "inventory_version": 1, "updated_at": 1})
+    response.headers["ETag"] = inventory_etag(user_id, user)
     if not user:
         return InventoryResponse(user_id=user_id, inventory=[], updated_at=None)
 
@@ -22,32 +61,176 @@ async def get_inventory(user_id: str):
 # ✅ PATCH 更新用户库存（部分更新）
 @router.patch("/{user_id}/inventory")
 async def patch_inventory(user_id: str, req: InventoryPatchRequest):
-    # ✅ 获取当前库存
-    user = await db.users.find_one({"_id": user_id})
-    current_inventory = user.get("inventory", []) if user else []
-    inventory_map = {item["name"]: item for item in current_inventory}
-
-    # ✅ 更新操作
-    for item in req.update or []:
-        inventory_map[item.name] = item.model_dump()
-
-    # ✅ 删除操作
-    for name in req.remove or []:
-        inventory_map.pop(name, None)
-
-    # ✅ 新库存列表
-    new_inventory = list(inventory_map.values())
+    update, remove = normalize_patch(
+        [item.model_dump() for item in req.update or []], req.remove or []
+    )
 
-    # ✅ 保存到 MongoDB
-    result = await db.users.update_one(
+    # ✅ 一次往返原子更新（聚合管道），返回更新前的库存用于计算差异
+    before = await db.users.find_one_and_update(
         {"_id": user_id},
-        {"$set": {"inventory": new_inventory, "updated_at": datetime.now()}},
-        upsert=True
+        build_patch_pipeline(update, remove, datetime.now(timezone.utc)),
+        projection={"inventory": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
     )
+    before_inventory = before.get("inventory", []) if before else []
+    newly_cookable = await _update_cookable(user_id, before_inventory, apply_patch(before_inventory, update, remove))
 
+    changes = diff_inventory(before_inventory, update, remove)
     return {
         "success": True,
         "message": "Inventory patched successfully",
-        "modified_count": result.modified_count,
-        "upserted_id": str(result.upserted_id) if result.upserted_id else None
-    }
\ No newline at end of file
+        # 库存实际有变化时才计为修改（管道总会更新 updated_at，不能直接用 MongoDB 的 modified_count）
+        "modified_count": 1 if before and any(changes.values()) else 0,
+        "upserted_id": None if before else user_id,
+        "changes": changes,
+        "newly_cookable": newly_cookable,
+    }
+
+
+async def _update_cookable(user_id: str, before: list, after: list) -> list:
+    """增量更新「今すぐ作れる」集合，并通过 LINE 通知新增的菜谱（失败不影响库存更新）"""
+    if not cookable_index.ready:
+        # 目录仍在后台加载：不在用户请求中全量读取 recipe_list，状态在下次使用时按库存重建
+        cookable_index.invalidate(user_id)
+        return []
+    try:
+        recipe_ids = await cookable_index.apply_inventory_change(user_id, before, after)
+        newly = []
+        for recipe_id in recipe_ids:
+            info = await cookable_index.recipe(recipe_id)
+            if info:
+                newly.append({"recipe_id": recipe_id, "name": info.name})
+    except Exception as e:
+        logger.exception(f"[Cookable Error] user_id={user_id}, error={e}")
+        return []
+
+    if newly and settings.COOKABLE_NOTIFY_ENABLED:
+        names = "\n".join(f"・{item['name']}" for item in newly[:3])
+        more = f"\nほか{len(newly) - 3}件" if len(newly) > 3 else ""
+        safe_task(send_message_async(user_id, f"🛒 在庫が更新されました！今すぐ作れるレシピ:\n{names}{more}"))
+    return newly
+
+
+# ✅ 当前库存可做的菜谱（增量维护的索引，直接查表）
+@router.get("/{user_id}/cookable")
+async def get_cookable(user_id: str):
+    user = await db.users.find_one({"_id": user_id}, {"inventory": 1})
+    inventory = user.get("inventory", []) if user else []
+    state = await cookable_index.state_for(user_id, inventory)
+    almost = await cookable_index.missing_counts(user_id, inventory, limit=1)
+
+    async def describe(recipe_ids):
+        items = []
+        for recipe_id in recipe_ids:
+            info = await cookable_index.recipe(recipe_id)
+            if info:
+                items.append({"recipe_id": recipe_id, "name": info.name, "cooking_time": info.cooking_time})
+        return items
+
+    return {
+        "user_id": user_id,
+        "cookable": await describe(sorted(state.cookable)),
+        "missing_one": await describe(sorted(almost)),
+    }
+
+
+# ✅ 批量导入 / 多用户同步（NDJSON 或 CSV，流式解析 + 无序 bulk_write）
+@router.post("/inventory/bulk")
+async def bulk_inventory(request: Request):
+    """
+    每行: user_id, name, quantity, unit, op(set/add/remove)。
+    Content-Type 含 csv 时按 CSV 解析（首行表头），否则按 NDJSON 解析。
+    同一批内同一用户的多行折叠为一条原子更新。
+    """
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    started = time.perf_counter()
+    counts = Counter()
+    errors = []
+    users = set()
+
+    def add_error(line_no: int, message: str):
+        counts["failed"] += 1
+        if len(errors) < settings.INVENTORY_BULK_MAX_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    async def write(batch: Dict[str, BulkFold]):
+        folds = list(batch.values())
+        now = datetime.now(timezone.utc)
+        ops = [UpdateOne({"_id": user_id}, fold.pipeline(now), upsert=True) for user_id, fold in batch.items()]
+        for user_id in batch:
+            cookable_index.invalidate(user_id)
+        try:
+            result = await db.users.bulk_write(ops, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details.get("writeErrors", []):
+                for line_no in folds[write_error["index"]].line_numbers:
+                    add_error(line_no, write_error.get("errmsg", "write error"))
+                    counts["applied"] -= 1
+        except Exception as e:
+            # 网络错误 / 超时等：这一批全部记为失败，继续处理后续批次（已写入的批次计数不丢失）
+            logger.exception(f"[Inventory Bulk] batch write failed: {e}")
+            details = {}
+            for fold in folds:
+                for line_no in fold.line_numbers:
+                    add_error(line_no, f"write failed: {e}")
+                    counts["applied"] -= 1
+        counts["matched"] += details.get("nMatched", 0)
+        counts["modified"] += details.get("nModified", 0)
+        counts["upserted"] += details.get("nUpserted", 0)
+
+    batch: Dict[str, BulkFold] = {}
+    batch_lines = 0
+    in_flight: Optional[asyncio.Task] = None
+
+    async for line_no, record in iter_records(request.stream(), fmt, settings.INVENTORY_BULK_MAX_LINE_BYTES):
+        counts["lines"] += 1
+        if isinstance(record, str):
+            add_error(line_no, record)
+            continue
+        try:
+            line = InventoryBulkLine.model_validate(record)
+        except ValidationError as e:
+            add_error(line_no, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        if line.op != "remove" and (line.quantity is None or not line.unit):
+            add_error(line_no, f"quantity and unit are required for op={line.op}")
+            continue
+
+        batch.setdefault(line.user_id, BulkFold()).apply(
+            line_no, line.op, {"name": line.name, "quantity": line.quantity, "unit": line.unit}
+        )
+        users.add(line.user_id)
+        counts["applied"] += 1
+        batch_lines += 1
+
+        # 写入与解析重叠进行：最多一批在途
+        if batch_lines >= settings.INVENTORY_BULK_BATCH_SIZE:
+            if in_flight:
+                await in_flight
+            in_flight = asyncio.create_task(write(batch))
+            batch, batch_lines = {}, 0
+
+    if in_flight:
+        await in_flight
+    if batch:
+        await write(batch)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "success": counts["failed"] == 0,
+        "format": fmt,
+        "lines": counts["lines"],
+        "applied": counts["applied"],
+        "failed": counts["failed"],
+        "users": len(users),
+        "matched_count": counts["matched"],
+        "modified_count": counts["modified"],
+        "upserted_count": counts["upserted"],
+        "errors": errors,
+        "errors_truncated": counts["failed"] > len(errors),
+        "elapsed_sec": round(elapsed, 3),
+        "lines_per_sec": round(counts["lines"] / elapsed, 1) if elapsed > 0 else None,
+    }
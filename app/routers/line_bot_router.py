@@ -1,54 +1,98 @@
 from fastapi import APIRouter, Request, Response
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, ImageMessage, TextSendMessage
 from datetime import datetime, timezone
 import asyncio
 import base64
 import logging
+import time
 
 from app.core.config import settings
 from app.core.db import db
+from app.core.metrics import record_line_call, registry
+from app.services.completion_service import completions
+from app.services.db_service import USER_STATE_PROJECTION, advance_step
 from app.services.gpt_service import generate_trivia, verify_step_image
+from app.services.llm_gateway import LLMBudgetExceededError, gateway
+from app.services.line_delivery import delivery
+from app.services.recipe_cache import recipe_cache
 
 # ======================
 # 常量 & 初始化
 # ======================
 router = APIRouter(prefix="/line", tags=["LINE Bot"])
-line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(settings.LINE_CHANNEL_SECRET)
 logger = logging.getLogger(__name__)
 
 COMMAND_REGISTER = "食材を登録する"
 COMMAND_START = "スタート"
 COMMAND_NEXT = "次へ"
+BUDGET_EXCEEDED_IMAGE_MESSAGE = (
+    "📷 ただいま画像の確認が混み合っています。\n"
+    f"少し時間をおいて送り直すか、工程が終わったら「{COMMAND_NEXT}」と送ってください。"
+)
+
+_handler = None
+
+def get_handler():
+    """首次收到 webhook 时创建 WebhookHandler 并注册事件处理（linebot 延迟 import，缩短冷启动）"""
+    global _handler
+    if _handler is None:
+        from linebot import WebhookHandler
+        from linebot.models import ImageMessage, MessageEvent, TextMessage
+
+        handler = WebhookHandler(settings.LINE_CHANNEL_SECRET)
+        handler.add(MessageEvent, message=TextMessage)(handle_text)
+        handler.add(MessageEvent, message=ImageMessage)(handle_image)
+        _handler = handler
+    return _handler
 
 # ======================
 # 工具函数
 # ======================
-async def send_message_async(user_id: str, text: str):
-    """异步推送消息"""
-    await asyncio.to_thread(line_bot_api.push_message, user_id, TextSendMessage(text=text))
+def text_message(text: str):
+    from linebot.models import TextSendMessage
+
+    return TextSendMessage(text=text)
 
-async def reply_message_async(reply_token: str, text: str):
-    """异步回复用户"""
-    await asyncio.to_thread(line_bot_api.reply_message, reply_token, TextSendMessage(text=text))
+async def send_message_async(user_id: str, text: str):
+    """异步发送消息（经由 delivery 层合并，优先使用 reply token）"""
+    await delivery.send(user_id, text_message(text))
+
+# 进行中的后台任务（保持强引用，避免被 GC；也用于统计）
+background_tasks = set()
+task_events = registry.counter("background_tasks_total", "safe_task lifecycle events", ("event",))
+registry.gauge("background_tasks_in_flight", "safe_task tasks still running", callback=lambda: len(background_tasks))
+
+def _on_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        task_events.inc(event="failed")
+        logger.error(f"Task exception: {task.exception()}")
+    else:
+        task_events.inc(event="finished")
 
 def safe_task(coro):
     """包装 create_task, 捕获异常"""
     task = asyncio.create_task(coro)
-    task.add_done_callback(lambda t: logger.error(f"Task exception: {t.exception()}") if t.exception() else None)
+    task_events.inc(event="started")
+    background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
     return task
 
-async def append_trivia_if_valid(messages, step_text):
-    """生成 Trivia 并附加到消息列表（排除无效值）"""
+async def append_trivia_if_valid(messages, step_text, user_id=None):
+    """生成 Trivia 并附加到消息列表（排除无效值；预算不足时跳过）"""
     try:
-        trivia = await generate_trivia(step_text)
+        trivia = await generate_trivia(step_text, user_id)
         if trivia and "今回は暇ではない" not in trivia:
-            messages.append(TextSendMessage(text=f"🧠 うんちく:\n{trivia}"))
+            messages.append(text_message(f"🧠 うんちく:\n{trivia}"))
     except Exception as e:
         logger.error(f"[Trivia Error] {e}")
 
+async def record_completion(user_id: str, recipe: dict):
+    """扣减库存（按批写入）；失败不影响完成消息"""
+    try:
+        await completions.record(user_id, recipe)
+    except Exception as e:
+        logger.error(f"[Completion Error] user_id={user_id}: {e}")
+
 # ======================
 # 回调接口（LINE Webhook）
 # ======================
@@ -56,8 +100,10 @@ async def append_trivia_if_valid(messages, step_text):
 async def callback(request: Request):
     signature = request.headers.get("X-Line-Signature")
     body = await request.body()
+    from linebot.exceptions import InvalidSignatureError
+
     try:
-        handler.handle(body.decode(), signature)
+        get_handler().handle(body.decode(), signature)
     except InvalidSignatureError:
         logger.error("Invalid LINE signature")
         return Response(content="Invalid signature", status_code=400)
@@ -66,8 +112,8 @@ async def callback(request: Request):
 # ======================
 # 文字消息处理
 # ======================
-@handler.add(MessageEvent, message=TextMessage)
 def handle_text(event):
+    delivery.bind_reply_token(event.source.user_id, event.reply_token)
     safe_task(process_text(event.source.user_id, event.message.text.strip()))
 
 async def process_text(user_id: str, text: str):
@@ -91,6 +137,7 @@ async def process_text(user_id: str, text: str):
                 await db.users.insert_one({
                     "_id": user_id,
                     "inventory": default_inventory,
+                    "inventory_version": 1,
                     "created_at": datetime.now(timezone.utc),
                     "updated_at": datetime.now(timezone.utc)
                 })
@@ -119,8 +166,8 @@ async def process_text(user_id: str, text: str):
 # 处理「スタート」或「登録完了」
 # ======================
 async def handle_start(user_id: str):
-    user = await db.users.find_one({"_id": user_id})
-    recipe = user.get("current_recipe") if user else None
+    user = await db.users.find_one({"_id": user_id}, USER_STATE_PROJECTION)
+    recipe = await recipe_cache.for_user(user)
 
     if not recipe:
         await send_message_async(user_id, "おすすめできるレシピが見つかりませんでした。")
@@ -133,9 +180,13 @@ async def handle_start(user_id: str):
         f"ステップ1: {first_step}\nこの工程が終わったら写真を送ってください📸"
     )
 
+    # 重置步骤：step_version 递增，使旧菜谱上进行中的条件更新全部失效
     await db.users.update_one(
         {"_id": user_id},
-        {"$set": {"current_step": 1, "updated_at": datetime.now(timezone.utc)}}
+        {
+            "$set": {"current_step": 1, "updated_at": datetime.now(timezone.utc)},
+            "$inc": {"step_version": 1},
+        }
     )
     await send_message_async(user_id, reply)
 
@@ -143,88 +194,108 @@ async def handle_start(user_id: str):
 # 处理「次へ」
 # ======================
 async def handle_next_step(user_id: str):
-    user = await db.users.find_one({"_id": user_id})
-    if not user or "current_recipe" not in user:
-        await send_message_async(user_id, "スタートから始めてください。")
-        return
-
-    step_index = user.get("current_step", 1)
-    recipe = user["current_recipe"]
-    recipe_name = recipe.get("name", "不明な料理")
-    recipe_url = recipe.get("recipe_url", "")
+    # 乐观并发：读取 → 条件更新，冲突时重新读取（多 worker 同时处理同一用户时不丢失更新）
+    for _ in range(settings.STEP_TRANSITION_MAX_RETRIES):
+        user = await db.users.find_one({"_id": user_id}, USER_STATE_PROJECTION)
+        recipe = await recipe_cache.for_user(user)
+        if not recipe:
+            await send_message_async(user_id, "スタートから始めてください。")
+            return
 
-    if step_index >= len(recipe["steps"]):
-        reply = (
-            "🎉 全てのステップが完了しました！お疲れ様でした。\n\n"
-            f"今回作った料理名は「{recipe_name}」でした！\n\n"
-            f"レシピURLはこちら👇\n{recipe_url}"
-        )
-        await send_message_async(user_id, reply)
-        return
+        step_index = user.get("current_step", 1)
+        recipe_name = recipe.get("name", "不明な料理")
+        recipe_url = recipe.get("recipe_url", "")
 
-    step_text = recipe["steps"][step_index]["instruction"]
+        if step_index >= len(recipe["steps"]):
+            # 最后一步 → 完成（current_step = 步数 + 1），仅条件更新成功的一方扣减库存
+            completed_now = step_index == len(recipe["steps"])
+            if completed_now and not await advance_step(user, step_index + 1):
+                continue
+            reply = (
+                "🎉 全てのステップが完了しました！お疲れ様でした。\n\n"
+                f"今回作った料理名は「{recipe_name}」でした！\n\n"
+                f"レシピURLはこちら👇\n{recipe_url}"
+            )
+            await send_message_async(user_id, reply)
+            if completed_now:
+                await record_completion(user_id, recipe)
+            return
 
-    # 更新数据库 + 准备消息
-    update_task = asyncio.create_task(
-        db.users.update_one(
-            {"_id": user_id},
-            {"$set": {"current_step": step_index + 1, "updated_at": datetime.now(timezone.utc)}}
-        )
-    )
+        if not await advance_step(user, step_index + 1):
+            continue
 
-    messages = [
-        TextSendMessage(text=f"📝 手動で次のステップに進みます。\n\nステップ{step_index + 1}: {step_text}\n終わったら写真を送ってください📸")
-    ]
-    await append_trivia_if_valid(messages, step_text)
+        step_text = recipe["steps"][step_index]["instruction"]
+        messages = [
+            text_message(f"📝 手動で次のステップに進みます。\n\nステップ{step_index + 1}: {step_text}\n終わったら写真を送ってください📸")
+        ]
+        await append_trivia_if_valid(messages, step_text, user_id)
+        await delivery.send(user_id, messages)
+        return
 
-    await update_task
-    await asyncio.to_thread(line_bot_api.push_message, user_id, messages)
+    logger.warning(f"[Step Conflict] user_id={user_id}, retries exhausted")
+    await send_message_async(user_id, "操作が混み合っています。もう一度お試しください。")
 
 # ======================
 # 图片消息处理
 # ======================
-@handler.add(MessageEvent, message=ImageMessage)
 def handle_image(event):
-    safe_task(process_image(event.source.user_id, event.message.id, event.reply_token))
+    delivery.bind_reply_token(event.source.user_id, event.reply_token)
+    safe_task(process_image(event.source.user_id, event.message.id))
 
-async def process_image(user_id: str, message_id: str, reply_token: str):
+async def process_image(user_id: str, message_id: str):
     try:
-        await reply_message_async(reply_token, "画像を確認しています...")
+        # 判定が遅い場合のみ「確認中」を送信し、reply token は結果のために温存する
+        delivery.notify_if_slow(user_id, "画像を確認しています...")
 
-        user = await db.users.find_one({"_id": user_id})
-        if not user or "current_recipe" not in user:
+        user = await db.users.find_one({"_id": user_id}, USER_STATE_PROJECTION)
+        recipe = await recipe_cache.for_user(user)
+        if not recipe:
             await send_message_async(user_id, "レシピ情報が見つかりません。")
             return
 
         step_index = max(user.get("current_step", 1) - 1, 0)
-        recipe = user["current_recipe"]
         recipe_name = recipe.get("name", "不明な料理")
         recipe_url = recipe.get("recipe_url", "")
 
         relevant_steps = recipe["steps"][max(0, step_index - 1): step_index + 1]
         instructions = "\n".join([f"ステップ{s['step_no']}: {s['instruction']}" for s in relevant_steps])
 
-        content = line_bot_api.get_message_content(message_id)
-        image_bytes = b"".join(chunk for chunk in content.iter_content())
+        # 预算不足时不下载图片、不排队，提示用手动的「次へ」继续
+        if not await gateway.allows("verify_step_image", user_id):
+            await send_message_async(user_id, BUDGET_EXCEEDED_IMAGE_MESSAGE)
+            return
+
+        started = time.perf_counter()
+        try:
+            content = delivery.line_bot_api.get_message_content(message_id)
+            image_bytes = b"".join(chunk for chunk in content.iter_content())
+        except Exception as e:
+            record_line_call("content", time.perf_counter() - started, e)
+            raise
+        record_line_call("content", time.perf_counter() - started)
         base64_image = base64.b64encode(image_bytes).decode("utf-8")
 
-        result = await verify_step_image(instructions, base64_image)
+        try:
+            result = await verify_step_image(instructions, base64_image, user_id)
+        except LLMBudgetExceededError:
+            await send_message_async(user_id, BUDGET_EXCEEDED_IMAGE_MESSAGE)
+            return
 
         if "はい" in result:
             next_index = step_index + 1
+            # 判定中に「次へ」等でステップが進んでいた場合、この画像の判定結果はもう古い
+            if not await advance_step(user, next_index + 1):
+                await send_message_async(user_id, "ステップが既に更新されています。現在のステップの写真を送ってください📸")
+                return
+
             if next_index < len(recipe["steps"]):
                 next_step_text = recipe["steps"][next_index]["instruction"]
 
                 messages = [
-                    TextSendMessage(text=f"✅ OK! 合っていそうです!\n\nステップ{next_index + 1}: {next_step_text}\n終わったら写真を送ってください📸")
+                    text_message(f"✅ OK! 合っていそうです!\n\nステップ{next_index + 1}: {next_step_text}\n終わったら写真を送ってください📸")
                 ]
-                await append_trivia_if_valid(messages, next_step_text)
-
-                await db.users.update_one(
-                    {"_id": user_id},
-                    {"$set": {"current_step": next_index + 1, "updated_at": datetime.now(timezone.utc)}}
-                )
-                await asyncio.to_thread(line_bot_api.push_message, user_id, messages)
+                await append_trivia_if_valid(messages, next_step_text, user_id)
+                await delivery.send(user_id, messages)
 
             else:
                 reply = (
@@ -232,11 +303,9 @@ async def process_image(user_id: str, message_id: str, reply_token: str):
                     f"今回作った料理名は「{recipe_name}」でした！\n\n"
                     f"レシピURLはこちら👇\n{recipe_url}"
                 )
-                await db.users.update_one(
-                    {"_id": user_id},
-                    {"$set": {"current_step": next_index + 1, "updated_at": datetime.now(timezone.utc)}}
-                )
                 await send_message_async(user_id, reply)
+                if next_index == len(recipe["steps"]):
+                    await record_completion(user_id, recipe)
         else:
             reply = "😅 画像が手順と合っていないようです。"
             await send_message_async(user_id, reply)
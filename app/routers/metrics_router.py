@@ -0,0 +1,34 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.diagnostics import loop_lag
+from app.core.metrics import registry
+
+
+def require_metrics_token(request: Request):
+    if not settings.METRICS_TOKEN:
+        return
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    # 按字节比较（compare_digest 对非 ASCII 的 str 会抛 TypeError）
+    if not hmac.compare_digest(token.encode("utf-8", "surrogateescape"), settings.METRICS_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+# ⚠️ 仅在 METRICS_ENABLED 时挂载；公开部署时同时设置 METRICS_TOKEN
+router = APIRouter(tags=["Metrics"], dependencies=[Depends(require_metrics_token)])
+
+registry.gauge(
+    "event_loop_lag_seconds", "Event loop wake-up delay over the recent window", ("quantile",),
+    callback=lambda: {
+        (q,): loop_lag.snapshot()[f"{name}_ms"] / 1000
+        for q, name in (("0.5", "p50"), ("0.99", "p99"), ("1", "max"))
+    },
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
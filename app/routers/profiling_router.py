@@ -0,0 +1,41 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+
+from app.core.config import settings
+from app.core.profiling import store
+
+
+def require_admin_token(request: Request):
+    token = request.headers.get("X-Admin-Token", "")
+    if not settings.PROFILING_ADMIN_TOKEN or not hmac.compare_digest(
+        token.encode("utf-8", "surrogateescape"), settings.PROFILING_ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+# ⚠️ 仅在 PROFILING_ADMIN_TOKEN 设置时挂载
+router = APIRouter(prefix="/admin/profiles", tags=["Profiling"], dependencies=[Depends(require_admin_token)])
+
+
+@router.get("")
+async def list_profiles():
+    return {"profiles": store.list()}
+
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: str):
+    profile = store.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("/{profile_id}/download")
+async def download_profile(profile_id: str):
+    """cProfile 原始数据（snakeviz / pstats 可直接读取）"""
+    path = store.stats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
@@ -1,51 +1,67 @@
 from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException
-from linebot import LineBotApi
+from fastapi import APIRouter, HTTPException, Query
 from app.core.config import settings
 from app.core.db import db
+from app.core.responses import FastJSONResponse
 from app.routers.line_bot_router import send_message_async
-from app.schemas.recipe_schema import RecipeRecommendationResponse, RecipeRecommendationRequest
+from app.schemas.recipe_schema import (
+    MealPlanRequest,
+    MealPlanResponse,
+    RecipeRecommendationRequest,
+    RecipeRecommendationResponse,
+)
+from app.services.db_service import save_user_recipe
+from app.services.meal_planner import describe, meal_planner
+from app.services.recipe_similarity import find_similar, ingredient_names, minhash, parse_recipe_id, tokens
 from app.services.recommender import RecipeRecommender
 
 router = APIRouter(prefix="/recipes", tags=["Recipes"])
-recommender = RecipeRecommender()
-line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN)
+_recommender = None
+
+
+def get_recommender() -> RecipeRecommender:
+    global _recommender
+    if _recommender is None:
+        _recommender = RecipeRecommender()
+    return _recommender
 
 
 @router.post("/recommendations", response_model=RecipeRecommendationResponse)
 async def recommend_recipes(req: RecipeRecommendationRequest):
     """
-    Recommend a recipe, save it to the user state, and send an initial message to LINE user.
+    Recommend a recipe, save a reference to it in the user state, and send an initial message to LINE user.
+    The recipe dict is built once from the DB document, kept in the shared recipe cache and reused
+    for messaging and the response (response_model is only used for the OpenAPI schema).
     """
-    # Step 1: 调用推荐逻辑
-    recipe = await recommender.recommend_recipe(
-        available_ingredients=req.available_ingredients,
-        required_ingredients=req.required_ingredients,
-        max_cooking_time=req.max_cooking_time,
-    )
-
-    if not recipe:
+    if not req.user_id and not req.available_ingredients:
+        raise HTTPException(status_code=422, detail="available_ingredients または user_id を指定してください")
+
+    # Step 1: 调用推荐逻辑（未传 available_ingredients 时使用已登录库存的「今すぐ作れる」索引）
+    if req.user_id and not req.available_ingredients:
+        entry = await get_recommender().recommend_from_cookable(
+            user_id=req.user_id,
+            required_ingredients=req.required_ingredients,
+            max_cooking_time=req.max_cooking_time,
+        )
+    else:
+        entry = await get_recommender().recommend_recipe(
+            available_ingredients=req.available_ingredients,
+            required_ingredients=req.required_ingredients,
+            max_cooking_time=req.max_cooking_time,
+        )
+
+    if not entry:
         raise HTTPException(status_code=404, detail="条件に合うレシピが見つかりませんでした")
+    recipe = entry.payload
 
-    # Step 2: 保存用户状态
+    # Step 2: 保存用户状态（只保存菜谱 ID / 版本，步骤初始化为 0）
     if req.user_id:
-        await db.users.update_one(
-            {"_id": req.user_id},
-            {
-                "$set": {
-                    "current_recipe": recipe.model_dump(),  # 保存推荐结果
-                    "current_step": 0,  # 初始化步骤
-                    "updated_at": datetime.now(timezone.utc),
-                }
-            },
-            upsert=True,
-        )
+        await save_user_recipe(req.user_id, entry.id, entry.version)
 
         # Step 3: 推送 LINE 消息（尝试 catch 异常）
         try:
-            recipe_data = recipe.model_dump()
-            first_step = recipe_data["steps"][0]["instruction"]
-            servings = recipe_data.get("servings", "不明")
+            first_step = recipe["steps"][0]["instruction"]
+            servings = recipe.get("servings", "不明")
             message = (
                 f"ピッタリのレシピが見つかりました！\n\n今回作る料理は『{servings}』の料理です！頑張りましょう💪！\n\n"
                 f"ステップ1: {first_step}\n\nこの工程が終わったら写真を送ってください📸"
@@ -59,4 +75,49 @@ async def recommend_recipes(req: RecipeRecommendationRequest):
         except Exception as e:  # LINE 推送失败不影响主逻辑
             print(f"[LINE Push Error] user_id={req.user_id}, error={e}")
 
-    return recipe
+    return FastJSONResponse(recipe)
+
+
+@router.post("/meal-plan", response_model=MealPlanResponse)
+async def plan_meals(req: MealPlanRequest):
+    """
+    在库存范围内选出 count 道菜谱（食材需求合计不超过库存），使库存的使用量最大。
+    在 MEAL_PLAN_TIME_BUDGET_MS 内求解，超时返回当前最优解（solver.timed_out）。
+    """
+    if req.count > settings.MEAL_PLAN_MAX_RECIPES:
+        raise HTTPException(
+            status_code=422, detail=f"一度に提案できるレシピは{settings.MEAL_PLAN_MAX_RECIPES}品までです"
+        )
+
+    if req.available_ingredients:
+        inventory = [item.model_dump() for item in req.available_ingredients]
+        user_id = None
+    elif req.user_id:
+        user = await db.users.find_one({"_id": req.user_id}, {"inventory": 1})
+        inventory = (user or {}).get("inventory", [])
+        user_id = req.user_id
+    else:
+        raise HTTPException(status_code=400, detail="available_ingredients または user_id を指定してください")
+
+    plan = await meal_planner.plan(inventory, req.count, req.max_cooking_time, user_id)
+    if not plan.recipes:
+        raise HTTPException(status_code=404, detail="条件に合うレシピが見つかりませんでした")
+    return FastJSONResponse(await describe(plan, req.count))
+
+
+@router.get("/{recipe_id}/similar")
+async def similar_recipes(recipe_id: str, limit: int = Query(10, ge=1, le=50)):
+    """食材構成が近いレシピ（lsh_bands 索引で候補を絞り、MinHash の一致率の高い順）"""
+    doc = await db.recipe_list.find_one({"_id": parse_recipe_id(recipe_id)}, {"minhash": 1, "ingredients.name": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="レシピが見つかりませんでした")
+
+    signature = doc.get("minhash") or minhash(tokens(ingredient_names(doc)))
+    similar = await find_similar(signature, limit=limit, exclude_id=doc["_id"])
+    return {
+        "recipe_id": recipe_id,
+        "results": [
+            {"recipe_id": str(d["_id"]), "name": d.get("name", ""), "similarity": round(score, 3)}
+            for d, score in similar
+        ],
+    }
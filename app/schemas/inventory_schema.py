@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 # ✅ 单个库存食材项
@@ -22,3 +22,12 @@ class InventoryResponse(BaseModel):
     user_id: str = Field(..., description="ユーザーID")
     inventory: List[InventoryItem] = Field(default_factory=list, description="現在の在庫")
     updated_at: Optional[datetime] = Field(None, description="最後更新日時")
+
+
+# ✅ 批量导入的一行（POST /users/inventory/bulk，NDJSON / CSV）
+class InventoryBulkLine(BaseModel):
+    user_id: str = Field(..., description="ユーザーID")
+    name: str = Field(..., description="食材名")
+    quantity: Optional[float] = Field(None, description="数量（set / add の場合は必須）")
+    unit: Optional[str] = Field(None, description="単位（set / add の場合は必須）")
+    op: Literal["set", "add", "remove"] = Field("set", description="set: 上書き, add: 加算, remove: 削除")
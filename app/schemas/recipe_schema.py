@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
@@ -35,12 +35,16 @@ class RecipeRecommendationRequest(BaseModel):
     user_id: Optional[str] = None  # ✅ 新增
     max_cooking_time: int = Field(..., description="最大調理時間（分）")
     required_ingredients: List[RequiredIngredient] = Field(default_factory=list, description="必ず使用する食材名（例: ['キャベツ']）")
-    available_ingredients: List[AvailableIngredient] = Field(..., description="利用可能な食材リスト [{name, quantity, unit}]")
+    available_ingredients: List[AvailableIngredient] = Field(
+        default_factory=list,
+        description="利用可能な食材リスト [{name, quantity, unit}]（空かつ user_id 指定時は登録済み在庫を使用）",
+    )
 
 # ===============================
 # 🔹 API 出力モデル（API → フロントエンド）
 # ===============================
 class RecipeRecommendationResponse(BaseModel):
+    recipe_id: Optional[str] = Field(None, description="レシピID（recipe_list の _id）")
     name: str = Field(..., description="レシピ名")
     cooking_time: Optional[int] = Field(None, description="調理時間（分）")
     ingredients: List[IngredientItem] = Field(..., description="レシピに必要な食材")
@@ -57,7 +61,7 @@ class RecipeRecommendationResponse(BaseModel):
 # 🔹 内部レシピスキーマ（MongoDB 保存用）
 # ===============================
 class RecipeSchema(BaseModel):
-    id: PyObjectId = Field(alias="_id")
+    id: Optional[PyObjectId] = Field(None, alias="_id")  # 导入前的新菜谱还没有 _id
     name: str = Field(..., description="レシピ名")
     description: Optional[str] = Field(None, description="レシピの説明")
     image_url: Optional[str] = Field(None, description="画像URL")
@@ -72,6 +76,40 @@ class RecipeSchema(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
-    class Config:
-        allow_population_by_field_name = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(populate_by_name=True, json_encoders={ObjectId: str})
+
+
+# ===============================
+# 🔹 献立（複数レシピ）
+# ===============================
+class MealPlanRequest(BaseModel):
+    user_id: Optional[str] = None
+    count: int = Field(7, ge=1, description="レシピ数（例: 1週間の夕食なら 7）")
+    max_cooking_time: Optional[int] = Field(None, description="1品あたりの最大調理時間（分）")
+    available_ingredients: List[AvailableIngredient] = Field(
+        default_factory=list,
+        description="利用可能な食材リスト（空かつ user_id 指定時は登録済み在庫を使用）",
+    )
+
+
+class MealPlanRecipe(BaseModel):
+    recipe_id: str = Field(..., description="レシピID")
+    name: str = Field(..., description="レシピ名")
+    cooking_time: Optional[int] = Field(None, description="調理時間（分）")
+    ingredients: List[RequiredIngredient] = Field(..., description="使用する食材と量")
+    usage_score: float = Field(..., description="在庫に対する使用割合の合計")
+
+
+class IngredientUsage(BaseModel):
+    name: str = Field(..., description="食材名")
+    available: float = Field(..., description="在庫量")
+    used: float = Field(..., description="献立全体での使用量")
+
+
+class MealPlanResponse(BaseModel):
+    recipes: List[MealPlanRecipe] = Field(..., description="選ばれたレシピ（使用割合の大きい順）")
+    requested: int = Field(..., description="要求されたレシピ数")
+    complete: bool = Field(..., description="要求数のレシピを揃えられたか")
+    utilization: float = Field(..., description="在庫の平均使用率（0〜1）")
+    ingredient_usage: List[IngredientUsage] = Field(..., description="食材ごとの使用量")
+    solver: dict = Field(default_factory=dict, description="候補数・探索回数・所要時間など")
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.core.db import get_collection
+from app.services.inventory_service import build_deduction_pipeline, convert_quantity
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CompletionEvent:
+    """菜谱完成事件（扣减写入后发出）"""
+    user_id: str
+    recipe_name: str
+    recipe_url: str
+    deductions: List[dict]
+    completed_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+def deductions_for(recipe: dict) -> List[dict]:
+    """从 current_recipe 的 ingredients 计算扣减量；同名食材按第一条的单位合并"""
+    merged: Dict[str, dict] = {}
+    for ing in recipe.get("ingredients", []):
+        name = ing.get("ingredient_id") or ing.get("name")
+        quantity = ing.get("quantity") or 0
+        unit = ing.get("unit") or ""
+        if not name or quantity <= 0:
+            continue
+        if name not in merged:
+            merged[name] = {"name": name, "quantity": quantity, "unit": unit}
+            continue
+        converted = convert_quantity(quantity, unit, merged[name]["unit"])
+        if converted is None:
+            logger.warning(f"[Completion] unit mismatch for {name}: {unit} vs {merged[name]['unit']}, skipped")
+            continue
+        merged[name]["quantity"] += converted
+    return list(merged.values())
+
+
+def _merge(first: List[dict], second: List[dict]) -> List[dict]:
+    """同一用户在一批内多次完成时合并扣减量"""
+    return deductions_for({"ingredients": first + second})
+
+
+class CompletionRecorder:
+    """
+    缓冲菜谱完成事件，按批写入：
+    每个用户一条管道更新（扣减库存，原子执行）+ recipe_completions 事件记录，
+    一次 bulk_write（unordered）提交。写入成功后通知订阅者（用于缓存失效等）。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.COMPLETION_BATCH_SIZE,
+        flush_interval: float = settings.COMPLETION_FLUSH_INTERVAL_MS / 1000,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[tuple] = []          # [(event, future)]
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._listeners: List[Callable[[CompletionEvent], None]] = []
+        self._tasks = set()
+
+    def subscribe(self, listener: Callable[[CompletionEvent], None]):
+        self._listeners.append(listener)
+
+    async def record(self, user_id: str, recipe: dict) -> CompletionEvent:
+        """登记一次完成，等待所在批次写入后返回"""
+        event = CompletionEvent(
+            user_id=user_id,
+            recipe_name=recipe.get("name", ""),
+            recipe_url=recipe.get("recipe_url", ""),
+            deductions=deductions_for(recipe),
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((event, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush_soon(0)
+        elif self._timer is None:
+            self._flush_soon(self.flush_interval)
+        await future
+        return event
+
+    def _flush_soon(self, delay: float):
+        if self._timer:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        # 保持强引用，避免 flush 任务被 GC
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        by_user: Dict[str, List[dict]] = {}
+        for event, _ in batch:
+            by_user[event.user_id] = _merge(by_user.get(event.user_id, []), event.deductions)
+
+        now = datetime.now(timezone.utc)
+        op_users = [user_id for user_id, deductions in by_user.items() if deductions]
+        user_ops = [UpdateOne({"_id": user_id}, build_deduction_pipeline(by_user[user_id], now)) for user_id in op_users]
+
+        # 1) 扣减库存：失败的用户单独记录，其余用户的扣减已生效
+        failed: Dict[str, Exception] = {}
+        if user_ops:
+            try:
+                await get_collection("users").bulk_write(user_ops, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    failed[op_users[write_error["index"]]] = e
+            except Exception as e:
+                failed = {user_id: e for user_id in op_users}
+            if failed:
+                logger.error(f"[Completion] deduction failed for {len(failed)}/{len(op_users)} users: {next(iter(failed.values()))}")
+
+        applied = [(event, future) for event, future in batch if event.user_id not in failed]
+        for event, future in batch:
+            if event.user_id in failed and not future.done():
+                future.set_exception(failed[event.user_id])
+
+        # 2) 完成事件记录：只记录扣减已生效的；写入失败不影响扣减结果（只记日志）
+        event_ops = [
+            InsertOne({
+                "user_id": event.user_id,
+                "recipe_name": event.recipe_name,
+                "recipe_url": event.recipe_url,
+                "deductions": event.deductions,
+                "completed_at": event.completed_at,
+            })
+            for event, _ in applied
+        ]
+        if event_ops:
+            try:
+                await get_collection("recipe_completions").bulk_write(event_ops, ordered=False)
+            except Exception as e:
+                logger.exception(f"[Completion] completion events write failed ({len(event_ops)} events): {e}")
+
+        # 3) 扣减已生效的用户一律通知订阅者（缓存失效等）
+        for event, future in applied:
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"[Completion] listener error: {e}")
+            if not future.done():
+                future.set_result(None)
+        logger.info(f"[Completion] flushed {len(applied)}/{len(batch)} events for {len(by_user)} users")
+
+    async def aclose(self):
+        if self._timer:
+            self._timer.cancel()
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+completions = CompletionRecorder()
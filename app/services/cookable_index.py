@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.db import get_read_collection
+from app.services.completion_service import completions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecipeInfo:
+    id: Any                                  # 原始 _id（用于回查完整文档）
+    name: str
+    cooking_time: Optional[int]
+    requirements: List[Tuple[str, float]]    # [(食材名, 需要量)]
+
+
+@dataclass
+class _Catalog:
+    """食材 → 菜谱 的倒排关系（由 recipe_list 构建）"""
+    version: int
+    recipes: Dict[str, RecipeInfo]
+    by_ingredient: Dict[str, List[Tuple[str, float]]]
+    loaded_at: float
+    _small: Dict[int, Dict[str, int]] = field(default_factory=dict, repr=False)
+
+    def requirement_count(self, rid: str) -> int:
+        return len(self.recipes[rid].requirements)
+
+    def empty_recipes(self) -> Set[str]:
+        return {rid for rid, info in self.recipes.items() if not info.requirements}
+
+    def small_recipes(self, limit: int) -> Dict[str, int]:
+        """食材条目数为 1..limit 的菜谱 → 条目数（按 limit 缓存；目录不可变）"""
+        if limit not in self._small:
+            self._small[limit] = {
+                rid: len(info.requirements) for rid, info in self.recipes.items() if 0 < len(info.requirements) <= limit
+            }
+        return self._small[limit]
+
+
+@dataclass
+class CookableState:
+    """单个用户的覆盖状态：covered[recipe_id] = 已满足的食材条目数"""
+    catalog_version: int
+    inventory: Dict[str, float]
+    covered: Dict[str, int] = field(default_factory=dict)
+    cookable: Set[str] = field(default_factory=set)
+
+
+def _inventory_map(inventory: Iterable[dict]) -> Dict[str, float]:
+    return {item["name"]: item.get("quantity") or 0 for item in inventory or [] if item.get("name")}
+
+
+class CookableIndex:
+    """
+    按用户增量维护「现在就能做」的菜谱集合。
+    食材判定与推荐 pipeline 一致：同名且 recipe.amount <= 库存数量。
+    库存某项变化时只更新使用该食材的菜谱（O(受影响菜谱数)）。
+    """
+
+    def __init__(
+        self,
+        recipe_col=None,
+        max_users: int = settings.COOKABLE_MAX_USERS,
+        catalog_ttl: float = settings.COOKABLE_CATALOG_TTL_SECONDS,
+    ):
+        self._recipe_col = recipe_col
+        self.max_users = max_users
+        self.catalog_ttl = catalog_ttl
+        self._catalog: Optional[_Catalog] = None
+        self._catalog_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._users: "OrderedDict[str, CookableState]" = OrderedDict()
+
+    # ----------------------
+    # 菜谱目录
+    # ----------------------
+    @property
+    def ready(self) -> bool:
+        """目录已加载（未加载时调用 catalog() 会在当前请求中全量读取 recipe_list）"""
+        return self._catalog is not None
+
+    async def catalog(self) -> _Catalog:
+        """
+        已有目录时直接返回；过期时在后台重新加载（stale-while-revalidate），请求不等待全量读取。
+        只有冷启动（尚未加载）时才在调用方等待加载，启动时由 lifespan 调用 warm() 预先加载。
+        """
+        if self._catalog is not None:
+            if time.monotonic() - self._catalog.loaded_at >= self.catalog_ttl:
+                self._refresh_in_background()
+            return self._catalog
+        async with self._catalog_lock:
+            if self._catalog is None:
+                self._catalog = await self._load_catalog()
+        return self._catalog
+
+    def _refresh_in_background(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+
+    async def _refresh(self):
+        try:
+            async with self._catalog_lock:
+                if self._catalog is None or time.monotonic() - self._catalog.loaded_at >= self.catalog_ttl:
+                    self._catalog = await self._load_catalog()
+        except Exception as e:
+            logger.exception(f"[Cookable] catalog refresh failed, keeping the previous one: {e}")
+
+    async def warm(self):
+        """启动时在后台调用：预先加载目录（失败只记录日志，首次使用时重试）"""
+        try:
+            await self.catalog()
+        except Exception as e:
+            logger.warning(f"[Cookable] catalog warm-up failed: {e}")
+
+    async def _load_catalog(self) -> _Catalog:
+        if settings.RECIPE_INDEX_PATH:
+            from app.services import recipe_index  # numpy 只在启用时 import
+
+            if recipe_index.available():
+                previous = self._catalog if isinstance(self._catalog, recipe_index.MappedCatalog) else None
+                catalog = await recipe_index.recipe_index.open(previous, self._recipe_col)
+                if catalog is not previous:
+                    catalog.version = (self._catalog.version + 1) if self._catalog else 1
+                    logger.info(f"[Cookable] mapped catalog opened: {len(catalog)} recipes, version={catalog.version}")
+                return catalog
+            logger.warning("[Cookable] RECIPE_INDEX_PATH is set but numpy is not installed; using in-process catalog")
+
+        col = self._recipe_col if self._recipe_col is not None else get_read_collection("recipe_list")
+        recipes: Dict[str, RecipeInfo] = {}
+        by_ingredient: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        cursor = col.find({}, {"name": 1, "cooking_time": 1, "ingredients.name": 1, "ingredients.amount": 1})
+        async for doc in cursor:
+            rid = str(doc["_id"])
+            requirements = [
+                (ing.get("name"), ing.get("amount") or 0)
+                for ing in doc.get("ingredients", [])
+                if isinstance(ing, dict)
+            ]
+            recipes[rid] = RecipeInfo(doc["_id"], doc.get("name", ""), doc.get("cooking_time"), requirements)
+            for name, amount in requirements:
+                by_ingredient[name].append((rid, amount))
+
+        version = (self._catalog.version + 1) if self._catalog else 1
+        logger.info(f"[Cookable] catalog loaded: {len(recipes)} recipes, version={version}")
+        return _Catalog(version, recipes, dict(by_ingredient), time.monotonic())
+
+    # ----------------------
+    # 用户状态
+    # ----------------------
+    def _build(self, catalog: _Catalog, inventory: Dict[str, float]) -> CookableState:
+        state = CookableState(catalog.version, {})
+        state.cookable = catalog.empty_recipes()
+        for name, quantity in inventory.items():
+            self._apply(catalog, state, name, quantity)
+        return state
+
+    @staticmethod
+    def _apply(catalog: _Catalog, state: CookableState, name: str, quantity: Optional[float]) -> List[str]:
+        """将单个食材的数量变为 quantity（None = 删除），返回新变为可做的菜谱"""
+        old = state.inventory.get(name)
+        if quantity is None:
+            state.inventory.pop(name, None)
+        else:
+            state.inventory[name] = quantity
+
+        newly = []
+        for rid, amount in catalog.by_ingredient.get(name, ()):
+            was = old is not None and amount <= old
+            now = quantity is not None and amount <= quantity
+            if was == now:
+                continue
+            covered = state.covered.get(rid, 0) + (1 if now else -1)
+            if covered:
+                state.covered[rid] = covered
+            else:
+                state.covered.pop(rid, None)
+            if covered == catalog.requirement_count(rid):
+                state.cookable.add(rid)
+                newly.append(rid)
+            else:
+                state.cookable.discard(rid)
+        return newly
+
+    def _sync(self, catalog: _Catalog, state: CookableState, inventory: Dict[str, float]) -> List[str]:
+        """把状态同步到给定库存（只处理有差异的食材）"""
+        newly = []
+        for name in set(state.inventory) | set(inventory):
+            quantity = inventory.get(name)
+            if state.inventory.get(name) != quantity:
+                newly.extend(self._apply(catalog, state, name, quantity))
+        return [rid for rid in dict.fromkeys(newly) if rid in state.cookable]
+
+    def _remember(self, user_id: str, state: CookableState):
+        self._users[user_id] = state
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    async def state_for(self, user_id: str, inventory: List[dict]) -> CookableState:
+        """返回与给定库存一致的状态（缓存命中时只应用差异）"""
+        catalog = await self.catalog()
+        current = _inventory_map(inventory)
+        state = self._users.get(user_id)
+        if state is None or state.catalog_version != catalog.version:
+            state = self._build(catalog, current)
+        else:
+            self._sync(catalog, state, current)
+        self._remember(user_id, state)
+        return state
+
+    async def apply_inventory_change(self, user_id: str, before: List[dict], after: List[dict]) -> List[str]:
+        """库存从 before 变为 after 时调用，返回新变为可做的菜谱 ID"""
+        state = await self.state_for(user_id, before)
+        catalog = await self.catalog()
+        newly = self._sync(catalog, state, _inventory_map(after))
+        self._remember(user_id, state)
+        return newly
+
+    def invalidate(self, user_id: str):
+        self._users.pop(user_id, None)
+
+    async def recipe(self, recipe_id: str) -> Optional[RecipeInfo]:
+        return (await self.catalog()).recipes.get(recipe_id)
+
+    async def missing_counts(self, user_id: str, inventory: List[dict], limit: int = 1) -> Dict[str, int]:
+        """缺少 1..limit 个食材条目的菜谱（「あと少しで作れる」）"""
+        state = await self.state_for(user_id, inventory)
+        catalog = await self.catalog()
+        # 一个食材都没有的菜谱不在 covered 中：条目数本身 <= limit 的直接计入
+        result = {rid: count for rid, count in catalog.small_recipes(limit).items() if rid not in state.covered}
+        for rid, covered in state.covered.items():
+            missing = catalog.requirement_count(rid) - covered
+            if 0 < missing <= limit:
+                result[rid] = missing
+        return result
+
+
+cookable_index = CookableIndex()
+
+# 菜谱完成后库存已在服务器端扣减，丢弃该用户的缓存状态（下次访问时按最新库存重建）
+completions.subscribe(lambda event: cookable_index.invalidate(event.user_id))
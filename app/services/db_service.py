@@ -1,32 +1,59 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional
+from pymongo import ReturnDocument
 from app.core.db import get_collection
 
 # 获取 MongoDB 集合
 user_state_col = get_collection("users")
 
+# 读取用户会话状态时的投影（菜谱正文在 recipe_cache 中；current_recipe 仅旧文档存在）
+USER_STATE_PROJECTION = {
+    "current_recipe_id": 1,
+    "current_recipe_version": 1,
+    "current_step": 1,
+    "step_version": 1,
+    "current_recipe": 1,
+}
+
 # === 保存用户食谱 ===
-def save_user_recipe(user_id: str, recipe: dict):
+async def save_user_recipe(user_id: str, recipe_id: str, recipe_version: str):
     """
-    保存用户当前的食谱，并将 current_step 重置为 0。
-    如果用户已存在，覆盖 recipe。
+    保存用户当前的食谱引用（ID + 版本），并将 current_step 重置为 0。
+    菜谱正文不写入用户文档；旧文档内嵌的 current_recipe 一并删除。
+    step_version 递增，使旧菜谱上进行中的条件更新失效。
     """
-    now = datetime.now()
-    user_state_col.update_one(
+    now = datetime.now(timezone.utc)
+    await user_state_col.update_one(
         {"_id": user_id},
         {
             "$set": {
-                "current_recipe": recipe,
+                "current_recipe_id": recipe_id,
+                "current_recipe_version": recipe_version,
                 "current_step": 0,
+                "updated_at": now,
             },
+            "$unset": {"current_recipe": ""},
+            "$inc": {"step_version": 1},
             "$setOnInsert": {"created_at": now}
         },
         upsert=True
     )
 
+# === 菜谱在做菜过程中被更新：记录已切换到的新版本 ===
+async def update_recipe_version(user_id: str, recipe_id: str, old_version: str, new_version: str):
+    """
+    仅当用户仍在做同一菜谱、且版本仍是 old_version 时更新（不改 step_version，进行中的条件更新不受影响）。
+    之后的查询按新版本直接命中菜谱缓存。
+    """
+    await user_state_col.update_one(
+        {"_id": user_id, "current_recipe_id": recipe_id, "current_recipe_version": old_version},
+        {"$set": {"current_recipe_version": new_version}},
+    )
+
 # === 获取用户状态 ===
 def get_user_state(user_id: str) -> dict:
     """
-    返回用户状态文档，包含 recipe 和 current_step。
+    返回用户状态文档，包含 current_recipe_id 和 current_step。
     如果不存在，返回 None。
     """
     return user_state_col.find_one({"user_id": user_id})
@@ -44,9 +71,28 @@ def update_step(user_id: str, step_index: int):
 # === 重置用户状态 ===
 def reset_user_state(user_id: str):
     """
-    删除用户的 current_step 和 recipe（用于重新开始）。
+    删除用户的 current_step 和菜谱引用（用于重新开始）。
     """
     user_state_col.update_one(
         {"user_id": user_id},
-        {"$unset": {"recipe": "", "current_step": ""}}
+        {"$unset": {"current_recipe_id": "", "current_recipe_version": "", "current_recipe": "", "current_step": ""}}
+    )
+
+# === 乐观并发：条件更新步骤 ===
+async def advance_step(user: dict, next_step: int) -> Optional[dict]:
+    """
+    仅当 current_step / step_version 仍与读取时一致才更新（find_one_and_update 原子执行）。
+    冲突（其他 worker 已修改）时返回 None，调用方重新读取后重试。
+    """
+    return await user_state_col.find_one_and_update(
+        {
+            "_id": user["_id"],
+            "current_step": user.get("current_step"),
+            "step_version": user.get("step_version"),  # 旧文档无该字段时 None 也能匹配
+        },
+        {
+            "$set": {"current_step": next_step, "updated_at": datetime.now(timezone.utc)},
+            "$inc": {"step_version": 1},
+        },
+        return_document=ReturnDocument.AFTER,
     )
@@ -1,11 +1,8 @@
 import json
 import re
 
-import openai
-
 from app.core.config import settings
-
-client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+from app.services.llm_gateway import gateway
 
 def slugify(text: str) -> str:
     return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
@@ -38,7 +35,8 @@ async def generate_recipe_by_gpt(available_ingredients, required_ingredients, ma
     調理時間上限: {max_cooking_time}分
     """
 
-    response = await client.chat.completions.create(
+    response = await gateway.chat_completion(
+        "generate_recipe",
         model=settings.OPENAI_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -72,7 +70,8 @@ async def call_openai_suggest(user_input: str):
         }
     ]
 
-    response = await client.chat.completions.create(
+    response = await gateway.chat_completion(
+        "call_openai_suggest",
         model=settings.OPENAI_MODEL,
         messages=[
             {"role": "system", "content": "ユーザーが入力した食材名を英語に変換して、標準化してください（例：うなぎ → eel）。"},
@@ -1,12 +1,14 @@
-import openai
-from app.core.config import settings
+from typing import Optional
 
-openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+from app.core.config import settings
+from app.services.llm_gateway import LLMBudgetExceededError, LLMUnavailableError, gateway
 
-async def generate_trivia(step_text: str) -> str:
+async def generate_trivia(step_text: str, user_id: Optional[str] = None) -> str:
     """Generate short trivia text for the given cooking step."""
     try:
-        response = await openai_client.chat.completions.create(
+        response = await gateway.chat_completion(
+            "generate_trivia",
+            user_id=user_id,
             model=settings.OPENAI_MODEL,
             messages=[
                 {
@@ -24,14 +26,22 @@ async def generate_trivia(step_text: str) -> str:
             max_tokens=300,
         )
         return response.choices[0].message.content.strip()
+    except LLMUnavailableError:
+        # 上游不稳定 / 预算不足时直接跳过 Trivia（空文字列は呼び出し側で無視される）
+        return ""
     except Exception as e:  # pragma: no cover - OpenAI failure
         return f"(Trivia生成エラー: {e})"
 
 
-async def verify_step_image(instructions: str, base64_image: str) -> str:
-    """Verify step image with GPT. Return 'はい' or 'いいえ'."""
+async def verify_step_image(instructions: str, base64_image: str, user_id: Optional[str] = None) -> str:
+    """
+    Verify step image with GPT. Return 'はい' or 'いいえ'.
+    Raises LLMBudgetExceededError when the user / global budget is exhausted (caller degrades).
+    """
     try:
-        response = await openai_client.chat.completions.create(
+        response = await gateway.chat_completion(
+            "verify_step_image",
+            user_id=user_id,
             model=settings.OPENAI_MODEL,
             messages=[
                 {
@@ -57,5 +67,7 @@ async def verify_step_image(instructions: str, base64_image: str) -> str:
             max_tokens=50,
         )
         return response.choices[0].message.content.strip().lower()
+    except LLMBudgetExceededError:
+        raise
     except Exception as e:  # pragma: no cover - OpenAI failure
         return f"(画像判定エラー: {e})"
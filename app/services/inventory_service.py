@@ -0,0 +1,320 @@
+import csv
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+
+# 单位换算表：unit → (基准单位, 换算系数)
+UNIT_CONVERSIONS = {
+    "g": ("g", 1), "グラム": ("g", 1), "kg": ("g", 1000),
+    "ml": ("ml", 1), "mL": ("ml", 1), "cc": ("ml", 1), "l": ("ml", 1000), "L": ("ml", 1000),
+    "大さじ": ("ml", 15), "小さじ": ("ml", 5), "カップ": ("ml", 200),
+}
+
+
+def convert_quantity(quantity: float, from_unit: str, to_unit: str) -> Optional[float]:
+    """单位换算；无法换算（基准单位不同或未知单位）时返回 None"""
+    if from_unit == to_unit:
+        return quantity
+    src, dst = UNIT_CONVERSIONS.get(from_unit), UNIT_CONVERSIONS.get(to_unit)
+    if not src or not dst or src[0] != dst[0]:
+        return None
+    return quantity * src[1] / dst[1]
+
+
+# 每次库存写入递增（库存 ETag 的版本；旧文档没有该字段时从 0 开始）
+INVENTORY_VERSION_BUMP = {"$add": [{"$ifNull": ["$inventory_version", 0]}, 1]}
+
+
+def _literal(value):
+    # 用户输入作为字面量嵌入 pipeline，避免以 "$" 开头的值被解释为字段路径
+    return {"$literal": value}
+
+
+def normalize_patch(update: List[dict], remove: List[str]):
+    """同名以最后一条为准；同时出现在 update 和 remove 中的以删除为准（与旧实现一致）"""
+    remove_set = set(remove)
+    updates = {item["name"]: item for item in update if item["name"] not in remove_set}
+    return list(updates.values()), sorted(remove_set)
+
+
+def build_patch_pipeline(
+    update: List[dict], remove: List[str], now: datetime, increments: Optional[List[dict]] = None
+) -> list:
+    """
+    生成聚合管道更新：按 name 原地替换 / 删除 / 增量加算已有条目，追加新条目。
+    在服务器端一次原子执行，不需要先读出整个库存。
+    increments: 与已有条目单位相同则数量相加，否则整体替换；不存在则追加。
+    """
+    increments = increments or []
+    update_names = [item["name"] for item in update]
+    increment_names = [item["name"] for item in increments]
+    existing = {"$ifNull": ["$inventory", []]}
+    existing_names = {"$ifNull": ["$inventory.name", []]}
+
+    def lookup(items: List[dict]):
+        return {
+            "$arrayElemAt": [
+                {"$filter": {"input": _literal(items), "as": "new", "cond": {"$eq": ["$$new.name", "$$item.name"]}}},
+                0,
+            ]
+        }
+
+    kept = {
+        "$filter": {
+            "input": existing,
+            "as": "item",
+            "cond": {"$not": [{"$in": ["$$item.name", _literal(remove)]}]},
+        }
+    }
+    incremented = {
+        "$let": {
+            "vars": {"inc": lookup(increments)},
+            "in": {
+                "$cond": [
+                    {"$eq": ["$$item.unit", "$$inc.unit"]},
+                    {"$mergeObjects": ["$$item", {"quantity": {"$add": ["$$item.quantity", "$$inc.quantity"]}}]},
+                    "$$inc",
+                ]
+            },
+        }
+    }
+    replaced = {
+        "$map": {
+            "input": kept,
+            "as": "item",
+            "in": {
+                "$switch": {
+                    "branches": [
+                        {"case": {"$in": ["$$item.name", _literal(update_names)]}, "then": lookup(update)},
+                        {"case": {"$in": ["$$item.name", _literal(increment_names)]}, "then": incremented},
+                    ],
+                    "default": "$$item",
+                }
+            },
+        }
+    }
+    appended = {
+        "$filter": {
+            "input": _literal(update + increments),
+            "as": "new",
+            "cond": {"$not": [{"$in": ["$$new.name", existing_names]}]},
+        }
+    }
+    return [
+        {
+            "$set": {
+                "inventory": {"$concatArrays": [replaced, appended]},
+                "inventory_version": INVENTORY_VERSION_BUMP,
+                "updated_at": now,
+            }
+        }
+    ]
+
+
+class BulkFold:
+    """
+    将同一用户的多行操作（按行顺序）折叠为每个食材一个最终操作，
+    从而每个用户每批只需一条原子更新：
+    set → 覆盖，remove → 删除，add → 相对于已存数量的增量
+    """
+
+    def __init__(self):
+        self._ops: Dict[str, tuple] = {}
+        self.line_numbers: List[int] = []
+
+    def apply(self, line_no: int, op: str, item: dict):
+        name = item["name"]
+        previous = self._ops.get(name)
+        if op == "remove":
+            self._ops[name] = ("remove", None)
+        elif op == "set":
+            self._ops[name] = ("set", item)
+        elif previous is None:
+            self._ops[name] = ("add", item)
+        elif previous[0] == "remove":
+            self._ops[name] = ("set", item)
+        elif previous[1]["unit"] == item["unit"]:
+            merged = {**previous[1], "quantity": previous[1]["quantity"] + item["quantity"]}
+            self._ops[name] = (previous[0], merged)
+        else:
+            # 单位不同：add 的语义为整体替换
+            self._ops[name] = ("set", item)
+        self.line_numbers.append(line_no)
+
+    def pipeline(self, now: datetime) -> list:
+        update = [item for op, item in self._ops.values() if op == "set"]
+        increments = [item for op, item in self._ops.values() if op == "add"]
+        remove = [name for name, (op, _) in self._ops.items() if op == "remove"]
+        return build_patch_pipeline(update, remove, now, increments)
+
+
+def apply_patch(before: Optional[List[dict]], update: List[dict], remove: List[str]) -> List[dict]:
+    """在 Python 中按与 build_patch_pipeline 相同的规则计算更新后的库存"""
+    updates = {item["name"]: item for item in update}
+    remove_set = set(remove)
+    after = [
+        updates.get(item.get("name"), item)
+        for item in before or []
+        if item.get("name") not in remove_set
+    ]
+    existing = {item.get("name") for item in before or []}
+    return after + [item for item in update if item["name"] not in existing]
+
+
+def build_deduction_pipeline(deductions: List[dict], now: datetime) -> list:
+    """
+    生成扣减库存的管道更新（菜谱完成时使用）。
+    deductions: [{name, quantity, unit}]，同名一条。单位不同但可换算时按库存单位换算后扣减，
+    无法换算的条目保持不变。扣减到 0 的条目从库存中删除。
+    """
+    entries = []
+    for d in deductions:
+        base, factor = UNIT_CONVERSIONS.get(d["unit"], (None, None))
+        entries.append({**d, "base": base, "factor": factor})
+    units = [{"unit": unit, "base": base, "factor": factor} for unit, (base, factor) in UNIT_CONVERSIONS.items()]
+
+    def first_match(items, field_name: str, value):
+        return {
+            "$arrayElemAt": [
+                {"$filter": {"input": _literal(items), "as": "x", "cond": {"$eq": [f"$$x.{field_name}", value]}}},
+                0,
+            ]
+        }
+
+    def deducted(amount):
+        return {"$mergeObjects": ["$$item", {"quantity": {"$max": [0, {"$subtract": ["$$item.quantity", amount]}]}}]}
+
+    mapped = {
+        "$map": {
+            "input": {"$ifNull": ["$inventory", []]},
+            "as": "item",
+            "in": {
+                "$let": {
+                    "vars": {"d": first_match(entries, "name", "$$item.name"), "u": first_match(units, "unit", "$$item.unit")},
+                    "in": {
+                        "$switch": {
+                            "branches": [
+                                {"case": {"$eq": [{"$type": "$$d"}, "missing"]}, "then": "$$item"},
+                                {"case": {"$eq": ["$$item.unit", "$$d.unit"]}, "then": deducted("$$d.quantity")},
+                                {
+                                    "case": {"$and": [{"$ne": [{"$type": "$$u"}, "missing"]}, {"$eq": ["$$u.base", "$$d.base"]}]},
+                                    "then": deducted({"$divide": [{"$multiply": ["$$d.quantity", "$$d.factor"]}, "$$u.factor"]}),
+                                },
+                            ],
+                            "default": "$$item",
+                        }
+                    },
+                }
+            },
+        }
+    }
+    remaining = {
+        "$filter": {
+            "input": mapped,
+            "as": "item",
+            "cond": {
+                "$or": [
+                    {"$gt": ["$$item.quantity", 0]},
+                    {"$not": [{"$in": ["$$item.name", _literal([d["name"] for d in deductions])]}]},
+                ]
+            },
+        }
+    }
+    return [{"$set": {"inventory": remaining, "inventory_version": INVENTORY_VERSION_BUMP, "updated_at": now}}]
+
+
+def diff_inventory(before: Optional[List[dict]], update: List[dict], remove: List[str]) -> Dict[str, list]:
+    """根据更新前的库存计算实际发生的变化"""
+    before_map = {item.get("name"): item for item in before or []}
+
+    def same(old: dict, new: dict) -> bool:
+        return all(old.get(k) == new.get(k) for k in ("quantity", "unit"))
+
+    return {
+        "added": [item for item in update if item["name"] not in before_map],
+        "updated": [
+            {"before": before_map[item["name"]], "after": item}
+            for item in update
+            if item["name"] in before_map and not same(before_map[item["name"]], item)
+        ],
+        "removed": [before_map[name] for name in remove if name in before_map],
+    }
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: Optional[int] = None) -> AsyncIterator[Optional[bytes]]:
+    """
+    逐块读取请求体并按行切分（不缓存整个 body；解码由调用方按行处理）。
+    超过 max_line_bytes 的行不保留在内存中：丢弃到下一个换行为止，该行产出 None。
+    """
+    buffer = b""
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if oversized:
+                oversized = False
+                yield None
+                continue
+            line = line.rstrip(b"\r")
+            yield None if max_line_bytes and len(line) > max_line_bytes else line
+        if max_line_bytes and len(buffer) > max_line_bytes:
+            oversized, buffer = True, b""
+    if oversized:
+        yield None
+    elif buffer.strip():
+        yield buffer.rstrip(b"\r")
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes], fmt: str, max_line_bytes: Optional[int] = None
+) -> AsyncIterator[tuple]:
+    """
+    产出 (行号, dict 或 解析错误信息)。
+    fmt = "ndjson"：每行一个 JSON 对象；fmt = "csv"：首行为表头（不支持跨行的引号字段）
+    非 UTF-8 的行、超过 max_line_bytes 的行与 JSON 错误一样作为该行的错误返回；
+    CSV 表头无法解析时其余各行都报错。
+    """
+    header = None
+    header_error = None
+    line_no = 0
+    async for raw in iter_lines(chunks, max_line_bytes):
+        line_no += 1
+        if raw is None:
+            if fmt == "csv" and header is None and header_error is None:
+                header_error = f"invalid CSV header (line {line_no})"
+            yield line_no, f"line exceeds {max_line_bytes} bytes"
+            continue
+        if not raw.strip():
+            continue
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            message = f"invalid UTF-8 at byte {e.start}: {e.reason}"
+            if fmt == "csv" and header is None and header_error is None:
+                header_error = f"invalid CSV header (line {line_no})"
+            yield line_no, message
+            continue
+        if fmt == "csv":
+            if header_error:
+                yield line_no, header_error
+                continue
+            try:
+                row = next(csv.reader([line]))
+            except csv.Error as e:
+                if header is None:
+                    header_error = f"invalid CSV header (line {line_no})"
+                yield line_no, f"invalid CSV: {e}"
+                continue
+            if header is None:
+                header = [h.strip() for h in row]
+                continue
+            yield line_no, {k: v.strip() for k, v in zip(header, row) if v.strip() != ""}
+        else:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, f"invalid JSON: {e.msg}"
+                continue
+            yield line_no, record if isinstance(record, dict) else "line must be a JSON object"
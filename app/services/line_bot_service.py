@@ -1,9 +1,4 @@
-import openai
-
-from app.core.config import settings
-
-# 使用你的 OPENAI API KEY
-openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+from app.services.llm_gateway import LLMUnavailableError, gateway
 
 
 # === Trivia 生成 ===
@@ -13,7 +8,8 @@ async def generate_trivia(next_step_text: str) -> str:
     如果步骤比较忙，GPT 会返回 "今回は暇ではない"。
     """
     try:
-        response = await openai_client.chat.completions.create(
+        response = await gateway.chat_completion(
+            "generate_trivia",
             model="gpt-4o",  # 你也可以换成 gpt-4o-mini
             messages=[
                 {
@@ -31,6 +27,8 @@ async def generate_trivia(next_step_text: str) -> str:
             max_tokens=300,
         )
         return response.choices[0].message.content.strip()
+    except LLMUnavailableError:
+        return ""
     except Exception as e:
         return f"（Trivia生成エラー: {e}）"
 
@@ -42,7 +40,8 @@ async def verify_step_image(current_instructions: str, base64_image: str) -> str
     返回值： "はい" 或 "いいえ"。
     """
     try:
-        response = await openai_client.chat.completions.create(
+        response = await gateway.chat_completion(
+            "verify_step_image",
             model="gpt-4o",
             messages=[
                 {
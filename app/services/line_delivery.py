@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import record_line_call
+
+if TYPE_CHECKING:
+    from linebot import LineBotApi
+    from linebot.exceptions import LineBotApiError
+    from linebot.models import SendMessage
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API 一次调用最多 5 条消息
+MAX_MESSAGES_PER_CALL = 5
+
+
+class TokenBucket:
+    """令牌桶：限制 push 调用频率（push 计入月度额度且有速率限制）"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class _Pending:
+    """同一用户在合并窗口内等待发送的消息"""
+    messages: List["SendMessage"] = field(default_factory=list)
+    waiters: List[asyncio.Future] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class LineDelivery:
+    """
+    LINE 出站消息层。
+    - 同一用户在短窗口内的消息合并为一次调用（最多 5 条）
+    - reply token 有效时优先使用 reply（免费），否则走 push
+    - push 经过令牌桶限流，429 / 5xx 时带退避重试
+    """
+
+    def __init__(
+        self,
+        line_bot_api: Optional["LineBotApi"] = None,
+        window: float = settings.LINE_COALESCE_WINDOW_MS / 1000,
+        reply_token_ttl: float = settings.LINE_REPLY_TOKEN_TTL_SECONDS,
+        push_rate: float = settings.LINE_PUSH_RATE_PER_SECOND,
+        push_burst: int = settings.LINE_PUSH_BURST,
+        max_retries: int = settings.LINE_PUSH_MAX_RETRIES,
+    ):
+        self._line_bot_api = line_bot_api
+        self.window = window
+        self.reply_token_ttl = reply_token_ttl
+        self.max_retries = max_retries
+        self._push_bucket = TokenBucket(push_rate, push_burst)
+        self._pending: Dict[str, _Pending] = {}
+        self._reply_tokens: Dict[str, Tuple[str, float]] = {}
+        self._notices: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    @property
+    def line_bot_api(self) -> "LineBotApi":
+        # 首次发送时才 import linebot 并创建客户端（缩短冷启动）
+        if self._line_bot_api is None:
+            from linebot import LineBotApi
+
+            self._line_bot_api = LineBotApi(
+                settings.LINE_CHANNEL_ACCESS_TOKEN,
+                endpoint=settings.LINE_API_ENDPOINT,
+                data_endpoint=settings.LINE_API_DATA_ENDPOINT,
+            )
+        return self._line_bot_api
+
+    # ----------------------
+    # reply token 管理
+    # ----------------------
+    def bind_reply_token(self, user_id: str, reply_token: str):
+        """记录用户最新的 reply token，下一次发送时优先使用"""
+        if reply_token:
+            self._reply_tokens[user_id] = (reply_token, time.monotonic() + self.reply_token_ttl)
+
+    def _take_reply_token(self, user_id: str) -> Optional[str]:
+        entry = self._reply_tokens.pop(user_id, None)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def notify_if_slow(self, user_id: str, text: str, delay: float = settings.LINE_PROGRESS_NOTICE_DELAY_SECONDS):
+        """
+        延迟发送「处理中」提示：如果在 delay 秒内该用户已有正式消息发出，则不再发送，
+        这样 reply token 可以留给真正的结果。
+        """
+        from linebot.models import TextSendMessage
+
+        loop = asyncio.get_running_loop()
+        self._cancel_notice(user_id)
+        self._notices[user_id] = loop.call_later(
+            delay, self._spawn_notice, user_id, TextSendMessage(text=text)
+        )
+
+    def _spawn_notice(self, user_id: str, message: "SendMessage"):
+        self._notices.pop(user_id, None)
+        self._spawn(self._send_notice(user_id, message))
+
+    async def _send_notice(self, user_id: str, message: "SendMessage"):
+        try:
+            await self._enqueue(user_id, [message])
+        except Exception as e:
+            logger.error(f"[LINE Notice Error] user_id={user_id}, error={e}")
+
+    def _cancel_notice(self, user_id: str):
+        handle = self._notices.pop(user_id, None)
+        if handle:
+            handle.cancel()
+
+    # ----------------------
+    # 发送入口
+    # ----------------------
+    async def send(self, user_id: str, messages):
+        """发送消息（单条或列表），在合并窗口结束并实际送达后返回"""
+        if not isinstance(messages, list):
+            messages = [messages]
+        self._cancel_notice(user_id)
+        await self._enqueue(user_id, messages)
+
+    async def _enqueue(self, user_id: str, messages: List["SendMessage"]):
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(user_id, _Pending())
+        waiter = loop.create_future()
+        pending.messages.extend(messages)
+        pending.waiters.append(waiter)
+
+        if self.window <= 0 or len(pending.messages) >= MAX_MESSAGES_PER_CALL:
+            self._flush_now(user_id)
+        elif pending.timer is None:
+            pending.timer = loop.call_later(self.window, self._flush_now, user_id)
+
+        await waiter
+
+    def _flush_now(self, user_id: str):
+        pending = self._pending.pop(user_id, None)
+        if pending is None:
+            return
+        if pending.timer:
+            pending.timer.cancel()
+        self._spawn(self._flush(user_id, pending))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush(self, user_id: str, pending: _Pending):
+        try:
+            for i in range(0, len(pending.messages), MAX_MESSAGES_PER_CALL):
+                await self._deliver(user_id, pending.messages[i:i + MAX_MESSAGES_PER_CALL])
+        except Exception as e:
+            for waiter in pending.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in pending.waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _deliver(self, user_id: str, chunk: List["SendMessage"]):
+        from linebot.exceptions import LineBotApiError
+
+        reply_token = self._take_reply_token(user_id)
+        if reply_token:
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.line_bot_api.reply_message, reply_token, chunk)
+                record_line_call("reply", time.perf_counter() - started)
+                return
+            except LineBotApiError as e:
+                record_line_call("reply", time.perf_counter() - started, e)
+                # 400: token 已过期或已被使用 → 退回 push
+                if e.status_code != 400:
+                    raise
+                logger.warning(f"[LINE Reply Fallback] user_id={user_id}, error={e}")
+        await self._push(user_id, chunk)
+
+    async def _push(self, user_id: str, chunk: List["SendMessage"]):
+        from linebot.exceptions import LineBotApiError
+
+        # retry_key 保证重试时 LINE 端不会重复投递
+        retry_key = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            await self._push_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(
+                    self.line_bot_api.push_message, user_id, chunk, retry_key=retry_key
+                )
+                record_line_call("push", time.perf_counter() - started)
+                return
+            except LineBotApiError as e:
+                record_line_call("push", time.perf_counter() - started, e)
+                if e.status_code == 409:  # 同一 retry_key 已被受理
+                    return
+                retryable = e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    async def aclose(self):
+        """关闭前立即发送合并窗口中的消息，并等待发送完成（未发送的「处理中」提示丢弃）"""
+        for handle in self._notices.values():
+            handle.cancel()
+        self._notices.clear()
+        for user_id in list(self._pending):
+            self._flush_now(user_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @staticmethod
+    def _backoff(attempt: int, error: "LineBotApiError") -> float:
+        retry_after = (error.headers or {}).get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return (0.5 * 2 ** attempt) * (0.5 + random.random())
+
+
+delivery = LineDelivery()
@@ -0,0 +1,204 @@
+"""
+LLM 调用的准入控制（按成本计的令牌桶）。
+
+- 每次 OpenAI 调用按调用类型消耗 CallPolicy.cost 个令牌（vision 判定比文本调用贵）
+- 两级桶：用户桶（LLM_USER_BUDGET_*，防止单个用户刷图片 / 输入联想占满配额）+ 全局桶（LLM_GLOBAL_BUDGET_*）
+- 超出预算时不排队：网关抛出 LLMBudgetExceededError（LLMUnavailableError 的子类），
+  调用方走已有的降级路径（跳过 Trivia、只返回本地检索结果等）
+- 存储：memory（进程内，全局桶按 worker 各自计算）或 mongo（llm_budgets 集合，多 worker 共享，
+  管道更新原子地完成补充与扣减；空闲的桶由 TTL 索引回收）。存储出错时放行（fail open）
+- 缓存命中的调用不消耗预算（网关在查缓存之后才申请）
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.core.db import get_collection
+from app.core.metrics import llm_budget_rejections, llm_budget_tokens, registry
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = "global"
+
+
+@dataclass(frozen=True)
+class Bucket:
+    capacity: float
+    refill_per_second: float
+
+    @property
+    def full_after(self) -> float:
+        """从空到满所需秒数（之后的状态与新建的桶相同，可以丢弃）"""
+        return self.capacity / self.refill_per_second if self.refill_per_second > 0 else float("inf")
+
+
+USER_BUCKET = Bucket(settings.LLM_USER_BUDGET_CAPACITY, settings.LLM_USER_BUDGET_REFILL_PER_MINUTE / 60)
+GLOBAL_BUCKET = Bucket(settings.LLM_GLOBAL_BUDGET_CAPACITY, settings.LLM_GLOBAL_BUDGET_REFILL_PER_MINUTE / 60)
+
+
+class MemoryBudgetStore:
+    """进程内的令牌桶；LRU 只保留最近活跃的 max_keys 个（被淘汰的桶视为已满）"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key → (tokens, updated_at)
+
+    def _level(self, key: str, bucket: Bucket, now: float) -> float:
+        entry = self._buckets.get(key)
+        if entry is None:
+            return bucket.capacity
+        tokens, updated_at = entry
+        return min(bucket.capacity, tokens + (now - updated_at) * bucket.refill_per_second)
+
+    async def peek(self, key: str, bucket: Bucket) -> float:
+        return self._level(key, bucket, time.monotonic())
+
+    async def take(self, key: str, bucket: Bucket, cost: float) -> Tuple[bool, float]:
+        """剩余令牌 >= cost 时扣减，返回 (是否放行, 剩余令牌)"""
+        now = time.monotonic()
+        tokens = self._level(key, bucket, now)
+        admitted = tokens >= cost
+        if admitted:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return admitted, tokens
+
+    async def refund(self, key: str, bucket: Bucket, cost: float):
+        entry = self._buckets.get(key)
+        if entry is not None:
+            self._buckets[key] = (min(bucket.capacity, entry[0] + cost), entry[1])
+
+
+class MongoBudgetStore:
+    """
+    llm_budgets 集合：{_id: key, tokens, ts（秒）, expires_at}。
+    一次 find_one_and_update（管道更新，upsert）完成「补充 → 判定 → 扣减」，多 worker 并发也不会超发。
+    """
+
+    def __init__(self, col=None):
+        self._col = col
+
+    @property
+    def col(self):
+        if self._col is None:
+            self._col = get_collection("llm_budgets")
+        return self._col
+
+    @staticmethod
+    def _refilled(bucket: Bucket, now: float) -> dict:
+        return {
+            "$min": [
+                bucket.capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", bucket.capacity]},
+                        {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, bucket.refill_per_second]},
+                    ]
+                },
+            ]
+        }
+
+    @staticmethod
+    def _expires_at(bucket: Bucket) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=min(bucket.full_after, 86400))
+
+    async def peek(self, key: str, bucket: Bucket) -> float:
+        doc = await self.col.find_one({"_id": key}, {"tokens": 1, "ts": 1})
+        if not doc:
+            return bucket.capacity
+        return min(bucket.capacity, doc["tokens"] + (time.time() - doc["ts"]) * bucket.refill_per_second)
+
+    async def take(self, key: str, bucket: Bucket, cost: float) -> Tuple[bool, float]:
+        now = time.time()
+        doc = await self.col.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": self._refilled(bucket, now), "ts": now, "expires_at": self._expires_at(bucket)}},
+                {"$set": {"admitted": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$admitted", {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+            ],
+            projection={"tokens": 1, "admitted": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bool(doc["admitted"]), doc["tokens"]
+
+    async def refund(self, key: str, bucket: Bucket, cost: float):
+        await self.col.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [bucket.capacity, {"$add": ["$tokens", cost]}]}}}],
+        )
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        store=None,
+        user_bucket: Bucket = USER_BUCKET,
+        global_bucket: Bucket = GLOBAL_BUCKET,
+        enabled: bool = settings.LLM_BUDGET_ENABLED,
+    ):
+        self.store = store if store is not None else (
+            MongoBudgetStore() if settings.LLM_BUDGET_STORE == "mongo" else MemoryBudgetStore()
+        )
+        self.user_bucket = user_bucket
+        self.global_bucket = global_bucket
+        self.enabled = enabled
+        self.global_tokens = global_bucket.capacity  # 最近一次观测到的全局剩余（指标用）
+
+    async def allows(self, call_type: str, cost: float, user_id: Optional[str] = None) -> bool:
+        """不扣减，只看当前余额（用于提前跳过昂贵的准备工作，例如下载图片）"""
+        if not self.enabled or cost <= 0:
+            return True
+        try:
+            if user_id and await self.store.peek(f"user:{user_id}", self.user_bucket) < cost:
+                return False
+            return await self.store.peek(GLOBAL_KEY, self.global_bucket) >= cost
+        except Exception as e:
+            logger.warning(f"[LLM Budget] store unavailable, admitting: {e}")
+            return True
+
+    async def acquire(self, call_type: str, cost: float, user_id: Optional[str] = None) -> Optional[str]:
+        """
+        扣减用户桶与全局桶。放行时返回 None；不足时返回拒绝的范围 "user" / "global"
+        （全局不足时已扣的用户令牌退回）。
+        """
+        if not self.enabled or cost <= 0:
+            return None
+        user_key = f"user:{user_id}" if user_id else None
+        try:
+            rejected = None
+            if user_key:
+                admitted, _ = await self.store.take(user_key, self.user_bucket, cost)
+                if not admitted:
+                    rejected = "user"
+            if rejected is None:
+                admitted, self.global_tokens = await self.store.take(GLOBAL_KEY, self.global_bucket, cost)
+                if not admitted:
+                    rejected = "global"
+                    if user_key:
+                        await self.store.refund(user_key, self.user_bucket, cost)
+        except Exception as e:
+            logger.warning(f"[LLM Budget] store unavailable, admitting: {e}")
+            return None
+        if rejected:
+            llm_budget_rejections.inc(scope=rejected, call_type=call_type)
+            return rejected
+        llm_budget_tokens.inc(cost, scope="user" if user_key else "anonymous", call_type=call_type)
+        return None
+
+
+admission = AdmissionController()
+registry.gauge(
+    "llm_budget_global_tokens", "Global LLM budget tokens left (last observed by this worker)",
+    callback=lambda: admission.global_tokens,
+)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_content(content):
+    """去掉提示词里的缩进 / 空行差异，使等价提示词得到同一个 key"""
+    if isinstance(content, str):
+        return "\n".join(line.strip() for line in content.strip().splitlines() if line.strip())
+    if isinstance(content, list):
+        return [
+            {**part, "text": _normalize_content(part["text"])} if part.get("type") == "text" else part
+            for part in content
+        ]
+    return content
+
+
+def make_key(call_type: str, kwargs: dict) -> str:
+    """按 model + 规范化后的 messages + 其余参数计算内容地址（sha256）"""
+    params = {k: v for k, v in kwargs.items() if k != "messages"}
+    messages = [
+        {**m, "content": _normalize_content(m.get("content"))} for m in kwargs.get("messages", [])
+    ]
+    payload = json.dumps(
+        {"call_type": call_type, "messages": messages, "params": params},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _SQLiteStore:
+    """持久层：SQLite（WAL 模式，多个 worker 可共享同一文件）"""
+
+    PRUNE_EVERY = 500  # 每写入 N 次清理一次过期条目
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, call_type TEXT, value TEXT, expires_at REAL, created_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row and row[1] > time.time():
+            return row
+        return None
+
+    def put(self, key: str, call_type: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (key, call_type, value, expires_at, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """
+    内容寻址的 LLM 响应缓存：内存 LRU → SQLite 两级。
+    value 为 ChatCompletion 的 JSON 字符串，TTL 由调用类型决定。
+    """
+
+    def __init__(self, path: str = settings.LLM_CACHE_PATH, max_entries: int = settings.LLM_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._store: Optional[_SQLiteStore] = None
+        self.stats = Counter()  # {"<call_type>:memory_hit" / "disk_hit" / "miss": n}
+        if path:
+            try:
+                self._store = _SQLiteStore(path)
+            except sqlite3.Error as e:
+                logger.error(f"[LLM Cache] disk tier disabled: {e}")
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, call_type: str, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry and entry[1] > time.time():
+            self._memory.move_to_end(key)
+            self.stats[f"{call_type}:memory_hit"] += 1
+            return entry[0]
+        if entry:
+            self._memory.pop(key, None)
+
+        if self._store:
+            try:
+                row = await asyncio.to_thread(self._store.get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"[LLM Cache] read failed: {e}")
+                row = None
+            if row:
+                self._remember(key, row[0], row[1])
+                self.stats[f"{call_type}:disk_hit"] += 1
+                return row[0]
+
+        self.stats[f"{call_type}:miss"] += 1
+        return None
+
+    async def put(self, call_type: str, key: str, value: str, ttl: float):
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self._store:
+            try:
+                await asyncio.to_thread(self._store.put, key, call_type, value, expires_at)
+            except sqlite3.Error as e:
+                logger.warning(f"[LLM Cache] write failed: {e}")
+
+    def close(self):
+        if self._store:
+            self._store.close()
+            self._store = None
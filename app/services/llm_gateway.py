@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import llm_cache_hits, llm_errors, llm_request_duration, llm_tokens
+from app.core.profiling import record_span
+from app.services.llm_budget import admission
+from app.services.llm_cache import LLMResponseCache, make_key
+
+if TYPE_CHECKING:
+    import openai
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """熔断中 / 超时 / 重试耗尽。调用方应降级（例如跳过 Trivia）而不是报错给用户"""
+
+
+class LLMBudgetExceededError(LLMUnavailableError):
+    """用户或全局的 LLM 预算不足（scope = "user" / "global"），不排队，直接降级"""
+
+    def __init__(self, call_type: str, scope: str):
+        super().__init__(f"{call_type}: {scope} budget exceeded")
+        self.call_type = call_type
+        self.scope = scope
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """每种调用类型的并发、超时与重试策略"""
+    concurrency: int          # 同时进行的请求上限
+    attempt_timeout: float    # 单次尝试超时（秒，包含排队等待）
+    deadline: float           # 包含重试在内的总期限（秒）
+    retries: int              # 可重试错误的重试次数
+    slow_threshold: float     # 超过该耗时视为慢调用，计入熔断
+    cache_ttl: float = 0      # 响应缓存 TTL（秒），0 = 不缓存
+    cost: float = 1           # 每次调用消耗的预算令牌（见 llm_budget）
+
+
+POLICIES: Dict[str, CallPolicy] = {
+    "generate_trivia": CallPolicy(
+        concurrency=8, attempt_timeout=6, deadline=8, retries=0, slow_threshold=4, cache_ttl=7 * 86400
+    ),
+    # vision（图片 base64 + 高分辨率 token）
+    "verify_step_image": CallPolicy(
+        concurrency=4, attempt_timeout=20, deadline=35, retries=1, slow_threshold=15, cost=10
+    ),
+    "call_openai_suggest": CallPolicy(
+        concurrency=4, attempt_timeout=10, deadline=15, retries=1, slow_threshold=8, cache_ttl=30 * 86400, cost=2
+    ),
+    "ingredient_suggest": CallPolicy(
+        concurrency=8, attempt_timeout=5, deadline=6, retries=0, slow_threshold=3, cache_ttl=86400
+    ),
+    "generate_recipe": CallPolicy(
+        concurrency=2, attempt_timeout=45, deadline=60, retries=1, slow_threshold=30, cost=5
+    ),
+}
+
+def retryable_errors() -> tuple:
+    """可重试的上游错误（其余 4xx 直接抛出）。openai 在首次调用时才 import"""
+    import openai
+
+    return (
+        asyncio.TimeoutError,
+        openai.APIConnectionError,  # 包含 APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class CircuitBreaker:
+    """
+    连续失败或慢调用达到阈值后打开，reset_timeout 秒后放行一次试探请求（half-open）。
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """试探请求以非上游故障（4xx 等）结束时，允许下一次试探"""
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning("[LLM Breaker] circuit opened")
+            self._opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """所有 OpenAI 调用的统一入口：共享连接池 + 按调用类型的信号量 / 超时 / 重试 / 熔断"""
+
+    def __init__(self, policies: Dict[str, CallPolicy] = POLICIES):
+        self.policies = policies
+        self._client: Optional["openai.AsyncOpenAI"] = None
+        self._cache: Optional[LLMResponseCache] = None
+        self._semaphores = {name: asyncio.Semaphore(p.concurrency) for name, p in policies.items()}
+        self._breakers = {
+            name: CircuitBreaker(settings.OPENAI_BREAKER_FAILURE_THRESHOLD, settings.OPENAI_BREAKER_RESET_SECONDS)
+            for name in policies
+        }
+
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        # 首次使用时才 import openai 并创建（缩短冷启动；没有 API key 的环境也能 import）
+        if self._client is None:
+            import openai
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL or None,
+                max_retries=0,  # 重试由网关统一控制
+                http_client=http_client,
+            )
+        return self._client
+
+    @property
+    def cache(self) -> LLMResponseCache:
+        if self._cache is None:
+            self._cache = LLMResponseCache()
+        return self._cache
+
+    def is_available(self, call_type: str) -> bool:
+        """熔断打开时返回 False，调用方可提前跳过可选功能"""
+        return not self._breakers[call_type].is_open
+
+    async def allows(self, call_type: str, user_id: Optional[str] = None) -> bool:
+        """预算是否足够（不扣减）；调用方可据此跳过昂贵的准备工作"""
+        return await admission.allows(call_type, self.policies[call_type].cost, user_id)
+
+    async def chat_completion(self, call_type: str, user_id: Optional[str] = None, **kwargs):
+        """
+        执行 chat.completions.create；不可用时抛出 LLMUnavailableError。
+        user_id 用于按用户计算预算（None = 只计全局），预算不足时抛出 LLMBudgetExceededError。
+        """
+        policy = self.policies[call_type]
+        if not policy.cache_ttl:
+            await self._admit(call_type, policy, user_id)
+            return await self._call(call_type, policy, kwargs)
+
+        # 缓存命中时不占用并发名额，也不受熔断影响
+        key = make_key(call_type, kwargs)
+        cached = await self.cache.get(call_type, key)
+        if cached is not None:
+            from openai.types.chat import ChatCompletion
+
+            llm_cache_hits.inc(call_type=call_type)
+            return ChatCompletion.model_validate_json(cached)
+        await self._admit(call_type, policy, user_id)
+        response = await self._call(call_type, policy, kwargs)
+        await self.cache.put(call_type, key, response.model_dump_json(), policy.cache_ttl)
+        return response
+
+    @staticmethod
+    async def _admit(call_type: str, policy: CallPolicy, user_id: Optional[str]):
+        rejected = await admission.acquire(call_type, policy.cost, user_id)
+        if rejected:
+            llm_errors.inc(call_type=call_type, error="budget_exceeded")
+            raise LLMBudgetExceededError(call_type, rejected)
+
+    async def _call(self, call_type: str, policy: CallPolicy, kwargs: dict):
+        breaker = self._breakers[call_type]
+        if not breaker.allow():
+            llm_errors.inc(call_type=call_type, error="circuit_open")
+            raise LLMUnavailableError(f"{call_type}: circuit open")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        last_error: Optional[BaseException] = None
+        retryable = retryable_errors()
+
+        for attempt in range(policy.retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    self._create(call_type, kwargs), timeout=min(policy.attempt_timeout, remaining)
+                )
+            except retryable as e:
+                self._observe(call_type, started, e)
+                breaker.record_failure()
+                last_error = e
+                logger.warning(f"[LLM Retryable Error] call_type={call_type}, attempt={attempt}, error={e!r}")
+                if attempt < policy.retries:
+                    # full jitter 退避，且不超过剩余期限
+                    await asyncio.sleep(min(random.uniform(0, 0.5 * 2 ** attempt), max(deadline - loop.time(), 0)))
+                continue
+            except Exception as e:
+                self._observe(call_type, started, e)
+                breaker.release_probe()
+                raise
+
+            self._observe(call_type, started, response=response)
+            if time.perf_counter() - started > policy.slow_threshold:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+        raise LLMUnavailableError(f"{call_type}: {last_error!r}") from last_error
+
+    @staticmethod
+    def _observe(call_type: str, started: float, error: Optional[BaseException] = None, response=None):
+        """记录单次尝试的耗时 / 错误 / token 用量"""
+        duration = time.perf_counter() - started
+        llm_request_duration.observe(duration, call_type=call_type, outcome="ok" if error is None else "error")
+        record_span("openai", call_type, started, duration, error=type(error).__name__ if error else None)
+        if error is not None:
+            llm_errors.inc(call_type=call_type, error=type(error).__name__)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            llm_tokens.inc(usage.prompt_tokens or 0, call_type=call_type, kind="prompt")
+            llm_tokens.inc(usage.completion_tokens or 0, call_type=call_type, kind="completion")
+
+    async def _create(self, call_type: str, kwargs: dict):
+        async with self._semaphores[call_type]:
+            return await self.client.chat.completions.create(**kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+
+gateway = LLMGateway()
@@ -0,0 +1,370 @@
+"""
+献立（複数レシピ）の最適化：库存能同时满足的 N 道菜谱中，选出库存使用量最大的组合。
+
+- 每道菜谱表示为稀疏需求向量：{库存条目下标: 需要量 / 库存量}，同一食材在多道菜谱间累计（不重复计算）
+- 约束：各食材的需求合计 <= 1（不超过库存）
+- 目标：(菜谱数, Σ 使用比例) 的字典序最大
+- 求解：多种顺序的贪心作为初始解 → drop-and-refill 局部搜索（去掉 1～2 道后按得分重新填充）
+  → 迭代局部搜索（随机去掉几道、按扰动后的顺序重新填充再局部搜索），在 deadline 或连续
+  MAX_STALE_RESTARTS 次无改进时停止；贪心解总会返回。随机数种子固定，相同输入得到相同结果。
+- 剪枝：候选先按单独得分取前 MEAL_PLAN_MAX_CANDIDATES 件；每道菜谱带有食材位掩码，
+  剩余量已不足任何候选所需最小量的食材组成 blocked 掩码，与之相交的候选不做逐项检查。
+- 候选构建与求解都是 CPU 密集的纯 Python，在线程中执行，不阻塞事件循环；
+  deadline 同时约束候选构建（超时时只保留需求向量已完整的菜谱）与求解。
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+from app.services.cookable_index import cookable_index
+
+EPS = 1e-9
+MAX_STALE_RESTARTS = 100  # 连续多少次扰动没有改进就停止（小规模问题不必用满时间预算）
+
+
+@dataclass
+class Candidate:
+    rid: str
+    demand: Tuple[Tuple[int, float], ...]   # ((库存条目下标, 使用比例), ...)
+    mask: int                                # 使用的库存条目位掩码
+    score: float                             # 使用比例合计
+
+
+@dataclass
+class Solution:
+    chosen: List[int]
+    remaining: List[float]
+    score: float
+
+    @property
+    def key(self) -> Tuple[int, float]:
+        return len(self.chosen), round(self.score, 9)
+
+
+@dataclass
+class SolveStats:
+    candidates: int = 0
+    moves: int = 0
+    timed_out: bool = False
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class MealPlan:
+    recipes: List[Candidate] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)            # 库存条目名（需求向量的列）
+    inventory: Dict[str, float] = field(default_factory=dict)
+    remaining: List[float] = field(default_factory=list)
+    stats: SolveStats = field(default_factory=SolveStats)
+
+
+# ======================
+# 候选构建
+# ======================
+def build_candidates(
+    catalog,
+    names: Sequence[str],
+    inventory: Dict[str, float],
+    cookable: Optional[Set[str]] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Candidate], bool]:
+    """
+    只通过倒排（食材 → 菜谱）构建：可做的菜谱的所有食材都在库存中，因此需求向量是完整的。
+    cookable 未给出时（请求中直接传入的库存），按倒排统计满足的条目数来判定，不构建用户状态。
+    每处理完一个库存条目检查 deadline；超时时停止扫描，只保留已扫描到全部食材条目的菜谱
+    （结果是完整结果的子集，仍然可行）。返回 (候选, 是否超时)。
+    """
+    def expired() -> bool:
+        return deadline is not None and time.perf_counter() >= deadline
+
+    postings = [catalog.by_ingredient.get(name, ()) for name in names]
+    timed_out = False
+    if cookable is None:
+        covered: Dict[str, int] = defaultdict(int)
+        for name, entries in zip(names, postings):
+            if expired():
+                timed_out = True
+                break
+            available = inventory[name]
+            for rid, amount in entries:
+                if amount <= available:
+                    covered[rid] += 1
+        cookable = set()
+        for i, (rid, n) in enumerate(covered.items()):
+            if not i % 4096 and expired():
+                timed_out = True
+                break
+            if n == catalog.requirement_count(rid):
+                cookable.add(rid)
+
+    demand: Dict[str, Dict[int, float]] = defaultdict(dict)
+    seen: Dict[str, int] = defaultdict(int)   # 已扫描到的食材条目数（判定需求向量是否完整）
+    for col, (name, entries) in enumerate(zip(names, postings)):
+        if expired():
+            timed_out = True
+            break
+        available = inventory[name]
+        for rid, amount in entries:
+            if rid in cookable:
+                seen[rid] += 1
+                if amount > 0:
+                    row = demand[rid]
+                    row[col] = row.get(col, 0.0) + amount / available
+
+    candidates = []
+    for rid, row in demand.items():
+        if timed_out and seen[rid] < catalog.requirement_count(rid):
+            continue  # 超时前没有扫描完该菜谱的全部食材
+        if any(fraction > 1 + EPS for fraction in row.values()):
+            continue  # 同一食材在一道菜谱中重复出现，合计超过库存
+        mask = 0
+        for col in row:
+            mask |= 1 << col
+        candidates.append(Candidate(rid, tuple(row.items()), mask, sum(row.values())))
+    return candidates, timed_out
+
+
+# ======================
+# 求解
+# ======================
+class _Solver:
+    def __init__(self, candidates: List[Candidate], columns: int, count: int, deadline: float):
+        self.candidates = candidates
+        self.columns = columns
+        self.count = count
+        self.deadline = deadline
+        self.min_demand = [float("inf")] * columns
+        for c in candidates:
+            for col, fraction in c.demand:
+                if fraction < self.min_demand[col]:
+                    self.min_demand[col] = fraction
+        self.by_score = sorted(range(len(candidates)), key=lambda i: -candidates[i].score)
+        self.moves = 0
+        self.timed_out = False
+
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.deadline
+
+    def _blocked(self, remaining: List[float]) -> int:
+        mask = 0
+        for col, left in enumerate(remaining):
+            if left + EPS < self.min_demand[col]:
+                mask |= 1 << col
+        return mask
+
+    @staticmethod
+    def _fits(candidate: Candidate, remaining: List[float]) -> bool:
+        return all(remaining[col] + EPS >= fraction for col, fraction in candidate.demand)
+
+    def _fill(self, chosen: List[int], remaining: List[float], score: float, order, excluded: Set[int]) -> Solution:
+        """按 order 顺序首次适配（可行性只会变差，因此等价于每次选剩余中排序最靠前的可行菜谱）"""
+        chosen = list(chosen)
+        remaining = list(remaining)
+        taken = set(chosen) | excluded
+        blocked = self._blocked(remaining)
+        for i in order:
+            if len(chosen) >= self.count:
+                break
+            c = self.candidates[i]
+            if i in taken or c.mask & blocked or not self._fits(c, remaining):
+                continue
+            chosen.append(i)
+            taken.add(i)
+            score += c.score
+            for col, fraction in c.demand:
+                remaining[col] -= fraction
+                if remaining[col] + EPS < self.min_demand[col]:
+                    blocked |= 1 << col
+        return Solution(chosen, remaining, score)
+
+    def greedy(self) -> Solution:
+        candidates = self.candidates
+        orders = [
+            self.by_score,
+            # 瓶颈食材的使用比例小的优先（更容易凑齐 N 道）
+            sorted(range(len(candidates)), key=lambda i: (max(f for _, f in candidates[i].demand), -candidates[i].score)),
+            # 单位瓶颈的得分高的优先
+            sorted(range(len(candidates)), key=lambda i: -candidates[i].score / max(f for _, f in candidates[i].demand)),
+        ]
+        full = [1.0] * self.columns
+        return max((self._fill([], full, 0.0, order, set()) for order in orders), key=lambda s: s.key)
+
+    def _drop(self, solution: Solution, drop: Sequence[int]) -> Solution:
+        remaining = list(solution.remaining)
+        score = solution.score
+        for i in drop:
+            c = self.candidates[i]
+            score -= c.score
+            for col, fraction in c.demand:
+                remaining[col] += fraction
+        kept = [i for i in solution.chosen if i not in drop]
+        return self._fill(kept, remaining, score, self.by_score, set(drop))
+
+    def improve(self, solution: Solution) -> Solution:
+        """drop-1 → drop-2 的邻域，先找到的改进即采用（之后回到 drop-1），直到局部最优或超时"""
+        size = 1
+        while size <= 2:
+            found = None
+            for drop in itertools.combinations(list(solution.chosen), size):
+                if self.expired():
+                    self.timed_out = True
+                    return solution
+                self.moves += 1
+                neighbour = self._drop(solution, drop)
+                if neighbour.key > solution.key:
+                    found = neighbour
+                    break
+            if found is None:
+                size += 1
+            else:
+                solution, size = found, 1
+        return solution
+
+    def perturb(self, solution: Solution, rng: random.Random) -> Solution:
+        drop = rng.sample(solution.chosen, min(len(solution.chosen), rng.randint(1, 3)))
+        remaining = list(solution.remaining)
+        score = solution.score
+        for i in drop:
+            c = self.candidates[i]
+            score -= c.score
+            for col, fraction in c.demand:
+                remaining[col] += fraction
+        noisy = sorted(self.by_score, key=lambda i: -self.candidates[i].score * rng.uniform(0.5, 1.5))
+        kept = [i for i in solution.chosen if i not in drop]
+        return self._fill(kept, remaining, score, noisy, set(drop))
+
+    def search(self, solution: Solution, rng: random.Random) -> Solution:
+        best = self.improve(solution)
+        stale = 0
+        while stale < MAX_STALE_RESTARTS:
+            if self.expired():
+                self.timed_out = True
+                break
+            self.moves += 1
+            candidate = self.improve(self.perturb(best, rng))
+            if candidate.key > best.key:
+                best, stale = candidate, 0
+            else:
+                stale += 1
+        return best
+
+
+def solve(candidates: List[Candidate], columns: int, count: int, deadline: float) -> Tuple[Solution, SolveStats]:
+    stats = SolveStats(candidates=len(candidates))
+    if not candidates or count <= 0:
+        return Solution([], [1.0] * columns, 0.0), stats
+    solver = _Solver(candidates, columns, count, deadline)
+    solution = solver.search(solver.greedy(), random.Random(0))
+    stats.moves = solver.moves
+    stats.timed_out = solver.timed_out
+    return solution, stats
+
+
+# ======================
+# 入口
+# ======================
+class MealPlanner:
+    def __init__(
+        self,
+        max_candidates: int = settings.MEAL_PLAN_MAX_CANDIDATES,
+        time_budget_ms: float = settings.MEAL_PLAN_TIME_BUDGET_MS,
+    ):
+        self.max_candidates = max_candidates
+        self.time_budget_ms = time_budget_ms
+
+    async def plan(
+        self,
+        inventory: List[dict],
+        count: int,
+        max_cooking_time: Optional[int] = None,
+        user_id: Optional[str] = None,
+    ) -> MealPlan:
+        started = time.perf_counter()
+        deadline = started + self.time_budget_ms / 1000
+        inventory_map: Dict[str, float] = {}
+        for item in inventory:
+            if item.get("name"):
+                inventory_map[item["name"]] = float(item.get("quantity") or 0)
+        names = list(inventory_map)
+        if len(names) == 0:
+            return MealPlan(inventory=inventory_map)
+
+        catalog = await cookable_index.catalog()
+        cookable = None
+        if user_id:  # 已登录库存：复用增量维护的用户状态（复制一份，线程中不读取会被修改的集合）
+            cookable = set((await cookable_index.state_for(user_id, inventory)).cookable)
+        return await asyncio.to_thread(
+            self._plan, catalog, names, inventory_map, cookable, count, max_cooking_time, started, deadline
+        )
+
+    def _plan(self, catalog, names, inventory_map, cookable, count, max_cooking_time, started, deadline) -> MealPlan:
+        """候选构建 + 剪枝 + 求解（在线程中执行）"""
+        candidates, build_timed_out = build_candidates(catalog, names, inventory_map, cookable, deadline)
+
+        # 按单独得分剪枝；调理时间只对排在前面的菜谱检查（mmap 目录按需解码）
+        if max_cooking_time:
+            ranked = sorted(candidates, key=lambda c: -c.score)
+        else:
+            ranked = heapq.nlargest(self.max_candidates, candidates, key=lambda c: c.score)
+        pruned = []
+        for c in ranked:
+            if len(pruned) >= self.max_candidates:
+                break
+            if max_cooking_time:
+                cooking_time = catalog.recipes[c.rid].cooking_time
+                if cooking_time is None or cooking_time > max_cooking_time:
+                    continue
+            pruned.append(c)
+
+        solution, stats = solve(pruned, len(names), count, deadline)
+        stats.timed_out = stats.timed_out or build_timed_out
+        stats.elapsed_ms = (time.perf_counter() - started) * 1000
+        recipes = sorted((pruned[i] for i in solution.chosen), key=lambda c: -c.score)
+        return MealPlan(recipes, names, inventory_map, solution.remaining, stats)
+
+
+meal_planner = MealPlanner()
+
+
+async def describe(plan: MealPlan, requested: int) -> dict:
+    """MealPlan → MealPlanResponse 形状的 dict"""
+    recipes = []
+    for candidate in plan.recipes:
+        info = await cookable_index.recipe(candidate.rid)
+        if info is None:
+            continue  # 目录刚被替换，菜谱已不存在
+        recipes.append({
+            "recipe_id": candidate.rid,
+            "name": info.name,
+            "cooking_time": info.cooking_time,
+            "ingredients": [{"name": name, "amount": amount} for name, amount in info.requirements],
+            "usage_score": round(candidate.score, 4),
+        })
+    usage = [
+        {
+            "name": name,
+            "available": plan.inventory[name],
+            "used": round((1 - left) * plan.inventory[name], 3),
+        }
+        for name, left in zip(plan.names, plan.remaining)
+    ]
+    utilization = sum(1 - left for left in plan.remaining) / len(plan.names) if plan.names else 0.0
+    return {
+        "recipes": recipes,
+        "requested": requested,
+        "complete": len(recipes) >= requested,
+        "utilization": round(utilization, 4),
+        "ingredient_usage": usage,
+        "solver": {
+            "candidates": plan.stats.candidates,
+            "moves": plan.stats.moves,
+            "timed_out": plan.stats.timed_out,
+            "elapsed_ms": round(plan.stats.elapsed_ms, 1),
+        },
+    }
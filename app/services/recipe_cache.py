@@ -0,0 +1,191 @@
+"""
+菜谱正文的进程内共享缓存。
+
+用户状态（users）只保存 current_recipe_id / current_recipe_version / current_step，
+菜谱正文（RecipeRecommendationResponse 形状的 dict）按菜谱 ID 放在这里的 LRU 中，所有用户共用；
+未命中时按投影读取 recipe_list 的一条文档。
+
+- 版本：content_hash（批量导入）或 updated_at；用户状态中的版本与缓存一致时直接命中，
+  不一致（菜谱在做菜过程中被更新）时重新读取并使用最新内容，同时把用户状态的版本改为最新版本
+  （否则之后每次查询都会判定为过期并重新读取）
+- 不带版本的查询（推荐时）按 RECIPE_CACHE_TTL_SECONDS 重新读取
+- 同一菜谱的并发未命中只读取一次
+- payload 在多个用户 / 请求之间共享，调用方不得修改
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.db import get_read_collection
+from app.core.metrics import recipe_cache_lookups
+from app.services.db_service import update_recipe_version
+from app.services.recipe_similarity import parse_recipe_id
+
+logger = logging.getLogger(__name__)
+
+# 构建 payload 所需的字段（推荐 pipeline 与回查共用）
+RECIPE_PROJECTION = {
+    "name": 1,
+    "cooking_time": 1,
+    "ingredients": 1,
+    "servings": 1,
+    "recipe_img_url": 1,
+    "image_url": 1,
+    "recipe_url": 1,
+    "steps": 1,
+    "content_hash": 1,
+    "updated_at": 1,
+}
+
+
+@dataclass
+class CachedRecipe:
+    id: str          # str(_id)
+    version: str     # 空字符串 = 文档没有版本信息
+    payload: dict    # RecipeRecommendationResponse 形状
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+def recipe_version(doc: dict) -> str:
+    if doc.get("content_hash"):
+        return doc["content_hash"]
+    if doc.get("updated_at"):
+        return doc["updated_at"].isoformat()
+    return ""
+
+
+def _convert_ingredients(raw_ingredients: List[dict]) -> List[dict]:
+    """将 DB/GPT 返回的 ingredients 转换成 IngredientItem 形状"""
+    return [
+        {
+            "ingredient_id": ing.get("ingredient_id") or ing.get("name", ""),
+            "quantity": float(ing.get("quantity") or ing.get("amount") or 0),
+            "unit": ing.get("unit", ""),
+        }
+        for ing in raw_ingredients
+    ]
+
+
+def _convert_steps(raw_steps: List[dict]) -> List[dict]:
+    """将 DB/GPT 返回的 steps 转换成 StepItem 形状"""
+    return [
+        {"step_no": int(step["step_no"]), "instruction": str(step["instruction"])}
+        for step in raw_steps
+        if isinstance(step, dict)
+    ]
+
+
+def to_payload(recipe_doc: dict) -> dict:
+    """
+    DB 文档（可信数据）→ RecipeRecommendationResponse 形状的 dict，只转换一次。
+    不逐条构建 Pydantic 模型；保存、LINE 消息和 HTTP 响应都复用这个 dict。
+    """
+    return {
+        "recipe_id": str(recipe_doc["_id"]) if "_id" in recipe_doc else None,
+        "name": recipe_doc.get("name", ""),
+        "cooking_time": recipe_doc.get("cooking_time", 0),
+        "ingredients": _convert_ingredients(recipe_doc.get("ingredients", [])),
+        "servings": recipe_doc.get("servings", "1人前"),
+        "recipe_img_url": recipe_doc.get("recipe_img_url") or recipe_doc.get("image_url"),
+        "recipe_url": recipe_doc.get("recipe_url"),
+        "steps": _convert_steps(recipe_doc.get("steps", [])),
+        "missing_ingredients": [],
+        "recommend_score": 1.0,
+        "recommend_reason": "おすすめレシピを見つけました！",
+    }
+
+
+class RecipeCache:
+    def __init__(
+        self,
+        recipe_col=None,
+        max_entries: int = settings.RECIPE_CACHE_MAX_ENTRIES,
+        ttl: float = settings.RECIPE_CACHE_TTL_SECONDS,
+    ):
+        self._recipe_col = recipe_col
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedRecipe]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = Counter()  # {"hit" / "miss" / "stale" / "not_found": n}
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        recipe_cache_lookups.inc(outcome=outcome)
+
+    def remember(self, doc: dict) -> CachedRecipe:
+        """放入一条按 RECIPE_PROJECTION（或更多字段）读取的文档"""
+        entry = CachedRecipe(str(doc["_id"]), recipe_version(doc), to_payload(doc))
+        self._entries[entry.id] = entry
+        self._entries.move_to_end(entry.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, recipe_id: str):
+        self._entries.pop(str(recipe_id), None)
+
+    def _fresh(self, entry: CachedRecipe, version: Optional[str]) -> bool:
+        if version:
+            return entry.version == version
+        return time.monotonic() - entry.loaded_at < self.ttl
+
+    async def _load(self, recipe_id: str) -> Optional[CachedRecipe]:
+        col = self._recipe_col if self._recipe_col is not None else get_read_collection("recipe_list")
+        doc = await col.find_one({"_id": parse_recipe_id(recipe_id)}, RECIPE_PROJECTION)
+        return self.remember(doc) if doc else None
+
+    async def get(self, recipe_id: str, version: Optional[str] = None) -> Optional[CachedRecipe]:
+        """按 ID 取菜谱；version 给出且与缓存不一致时重新读取（返回的是最新版本）"""
+        recipe_id = str(recipe_id)
+        entry = self._entries.get(recipe_id)
+        if entry is not None and self._fresh(entry, version):
+            self._entries.move_to_end(recipe_id)
+            self._count("hit")
+            return entry
+        self._count("stale" if entry is not None else "miss")
+
+        pending = self._inflight.get(recipe_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[recipe_id] = future
+        try:
+            entry = await self._load(recipe_id)
+            future.set_result(entry)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 没有其他等待者时不报「未取回的异常」
+            raise
+        finally:
+            self._inflight.pop(recipe_id, None)
+
+        if entry is None:
+            self._count("not_found")
+        elif version and entry.version != version:
+            logger.info(f"[RecipeCache] recipe {recipe_id} changed since it was started ({version} → {entry.version})")
+        return entry
+
+    async def for_user(self, user: Optional[dict]) -> Optional[dict]:
+        """用户当前菜谱的 payload；兼容仍内嵌 current_recipe 的旧文档"""
+        if not user:
+            return None
+        if user.get("current_recipe_id"):
+            recipe_id, version = user["current_recipe_id"], user.get("current_recipe_version")
+            entry = await self.get(recipe_id, version)
+            if entry is None:
+                return None
+            if version and entry.version != version and "_id" in user:
+                try:
+                    await update_recipe_version(user["_id"], recipe_id, version, entry.version)
+                except Exception as e:
+                    logger.warning(f"[RecipeCache] failed to update recipe version for user {user['_id']}: {e}")
+            return entry.payload
+        return user.get("current_recipe")
+
+
+recipe_cache = RecipeCache()
@@ -0,0 +1,357 @@
+"""
+菜谱目录的列式二进制文件（mmap 共享）。
+
+CookableIndex 默认在每个进程内用 dict 持有整个 recipe_list 的目录，uvicorn 多 worker 时内存按 worker 数倍增。
+设置 RECIPE_INDEX_PATH（并安装 numpy）后，目录被编译成一个只读文件，各 worker 以 mmap + NumPy 视图打开，
+所有进程共享同一份物理页。recipe_list 的版本（件数 + 最新 _id + 最新 updated_at）变化时，
+由拿到文件锁的一个 worker 重建，写入临时文件后 os.replace 原子替换；其他 worker 在下次刷新时重新打开。
+版本只看这三个值：原地修改菜谱（食材、调理时间等）却不更新 updated_at 时不会被检测到，
+这类写入必须同时更新 updated_at。
+
+文件格式（小端）:
+    8 字节 magic | 8 字节 header 长度 | header JSON | 按 8 字节对齐的各列
+    ids           S{n}  菜谱 _id 的字符串形式（升序，用于二分查找）
+    id_kind       u1    0 = ObjectId / 1 = str / 2 = int
+    cooking_time  i4    -1 = 未设置
+    name_offsets  i8    names 中的偏移（n+1）
+    names         u1    菜谱名（UTF-8 连续存放）
+    req_offsets   i8    每个菜谱的食材条目范围（n+1，CSR）
+    req_ingredient i4   食材 ID（ingredients 中的下标）
+    req_amount    f8    需要量
+    ingredients   S{n}  食材名（升序）
+    inv_offsets   i8    倒排：每个食材对应的条目范围（k+1）
+    inv_recipe    i4    菜谱下标
+    inv_amount    f8    需要量
+
+    python -m app.services.recipe_index   # 手动重建
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.db import get_read_collection
+from app.core.http_cache import CollectionVersion
+from app.services.cookable_index import RecipeInfo
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MRIDX\x00\x01\x00"
+_PREFIX = struct.Struct("<8sQ")
+ID_OBJECTID, ID_STR, ID_INT = 0, 1, 2
+
+try:  # 可选依赖：没有 numpy 时 CookableIndex 使用进程内 dict
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def available() -> bool:
+    return bool(settings.RECIPE_INDEX_PATH) and np is not None
+
+
+# ======================
+# 构建
+# ======================
+def _id_kind(value) -> int:
+    if isinstance(value, ObjectId):
+        return ID_OBJECTID
+    return ID_INT if isinstance(value, int) else ID_STR
+
+
+def _amount(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def compile_index(docs: List[dict], source_version: str) -> bytes:
+    """docs: recipe_list 的投影（_id / name / cooking_time / ingredients.name / ingredients.amount）"""
+    docs = sorted(docs, key=lambda d: str(d["_id"]).encode("utf-8"))
+    ids = [str(d["_id"]).encode("utf-8") for d in docs]
+    requirements = [
+        [(ing.get("name") or "", _amount(ing.get("amount"))) for ing in d.get("ingredients", []) if isinstance(ing, dict)]
+        for d in docs
+    ]
+    ingredient_names = sorted({name.encode("utf-8") for reqs in requirements for name, _ in reqs})
+    ingredient_ids = {name.decode("utf-8"): i for i, name in enumerate(ingredient_names)}
+
+    names = [str(d.get("name", "")).encode("utf-8") for d in docs]
+    name_offsets = np.zeros(len(docs) + 1, dtype="<i8")
+    np.cumsum(np.array([len(n) for n in names], dtype="<i8"), out=name_offsets[1:])
+    req_offsets = np.zeros(len(docs) + 1, dtype="<i8")
+    np.cumsum(np.array([len(r) for r in requirements], dtype="<i8"), out=req_offsets[1:])
+    req_ingredient = np.array([ingredient_ids[name] for reqs in requirements for name, _ in reqs], dtype="<i4")
+    req_amount = np.array([amount for reqs in requirements for _, amount in reqs], dtype="<f8")
+    req_recipe = np.repeat(np.arange(len(docs), dtype="<i4"), np.diff(req_offsets))
+
+    # 倒排（食材 → 条目），按食材 ID 稳定排序
+    order = np.argsort(req_ingredient, kind="stable")
+    inv_offsets = np.zeros(len(ingredient_names) + 1, dtype="<i8")
+    np.cumsum(np.bincount(req_ingredient, minlength=len(ingredient_names)), out=inv_offsets[1:])
+
+    columns = {
+        "ids": np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}"),
+        "id_kind": np.array([_id_kind(d["_id"]) for d in docs], dtype="u1"),
+        "cooking_time": np.array(
+            [d["cooking_time"] if isinstance(d.get("cooking_time"), int) else -1 for d in docs], dtype="<i4"
+        ),
+        "name_offsets": name_offsets,
+        "names": np.frombuffer(b"".join(names), dtype="u1"),
+        "req_offsets": req_offsets,
+        "req_ingredient": req_ingredient,
+        "req_amount": req_amount,
+        "ingredients": np.array(
+            ingredient_names, dtype=f"S{max((len(n) for n in ingredient_names), default=1)}"
+        ),
+        "inv_offsets": inv_offsets,
+        "inv_recipe": req_recipe[order],
+        "inv_amount": req_amount[order],
+    }
+
+    sections, offset = {}, 0
+    for name, array in columns.items():
+        sections[name] = {"dtype": array.dtype.str, "offset": offset, "count": int(array.shape[0])}
+        offset += -(-array.nbytes // 8) * 8
+    header = json.dumps({
+        "source_version": source_version,
+        "built_at": time.time(),
+        "recipes": len(docs),
+        "sections": sections,
+    }).encode("utf-8")
+    header += b" " * (-(len(header) + _PREFIX.size) % 8)
+
+    parts = [_PREFIX.pack(MAGIC, len(header)), header]
+    for array in columns.values():
+        data = array.tobytes()
+        parts.append(data + b"\x00" * (-len(data) % 8))
+    return b"".join(parts)
+
+
+def read_header(path: str) -> Optional[dict]:
+    try:
+        with open(path, "rb") as f:
+            magic, length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(length))
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def write_atomic(path: str, data: bytes):
+    """写入同目录的临时文件后 os.replace：已 mmap 旧文件的进程不受影响"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ======================
+# 读取（mmap + NumPy 视图）
+# ======================
+def _lookup(sorted_keys, key: str) -> int:
+    """在升序的定长 bytes 列中二分查找，找不到返回 -1"""
+    encoded = key.encode("utf-8")
+    if len(encoded) > sorted_keys.dtype.itemsize:
+        return -1  # 超过列宽时 searchsorted 会按截断后的值比较
+    i = int(np.searchsorted(sorted_keys, encoded))
+    if i < len(sorted_keys) and sorted_keys[i] == encoded:
+        return i
+    return -1
+
+
+class MappedCatalog:
+    """与 cookable_index._Catalog 相同的接口（recipes / by_ingredient / requirement_count / empty_recipes / small_recipes）"""
+
+    def __init__(self, path: str, version: int = 1):
+        self.path = path
+        self.version = version
+        self.loaded_at = time.monotonic()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a recipe index: {path}")
+        self.header = json.loads(bytes(self._mmap[_PREFIX.size:_PREFIX.size + length]))
+        base = _PREFIX.size + length
+        self.columns = {
+            name: np.frombuffer(self._mmap, dtype=spec["dtype"], count=spec["count"], offset=base + spec["offset"])
+            for name, spec in self.header["sections"].items()
+        }
+        self.source_version: str = self.header["source_version"]
+        self.recipes = _RecipeView(self)
+        self.by_ingredient = _IngredientView(self)
+        self._small: Dict[int, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return self.header["recipes"]
+
+    def recipe_id(self, index: int) -> str:
+        return self.columns["ids"][index].decode("utf-8")
+
+    def raw_id(self, index: int):
+        rid, kind = self.recipe_id(index), int(self.columns["id_kind"][index])
+        if kind == ID_OBJECTID:
+            return ObjectId(rid)
+        return int(rid) if kind == ID_INT else rid
+
+    def index_of(self, rid: str) -> int:
+        return _lookup(self.columns["ids"], rid)
+
+    def requirement_count(self, rid: str) -> int:
+        i = self.index_of(rid)
+        offsets = self.columns["req_offsets"]
+        return int(offsets[i + 1] - offsets[i]) if i >= 0 else 0
+
+    def empty_recipes(self) -> Set[str]:
+        empty = np.flatnonzero(np.diff(self.columns["req_offsets"]) == 0)
+        return {self.recipe_id(i) for i in empty}
+
+    def small_recipes(self, limit: int) -> Dict[str, int]:
+        if limit not in self._small:
+            counts = np.diff(self.columns["req_offsets"])
+            small = np.flatnonzero((counts > 0) & (counts <= limit))
+            self._small[limit] = {self.recipe_id(i): int(counts[i]) for i in small}
+        return self._small[limit]
+
+    def info(self, index: int) -> RecipeInfo:
+        c = self.columns
+        start, end = int(c["name_offsets"][index]), int(c["name_offsets"][index + 1])
+        name = c["names"][start:end].tobytes().decode("utf-8")
+        cooking_time = int(c["cooking_time"][index])
+        lo, hi = int(c["req_offsets"][index]), int(c["req_offsets"][index + 1])
+        ingredients = c["ingredients"]
+        requirements = [
+            (ingredients[ing].decode("utf-8"), float(amount))
+            for ing, amount in zip(c["req_ingredient"][lo:hi], c["req_amount"][lo:hi])
+        ]
+        return RecipeInfo(self.raw_id(index), name, cooking_time if cooking_time >= 0 else None, requirements)
+
+
+class _RecipeView(Mapping):
+    """recipe_id → RecipeInfo（访问时才解码）"""
+
+    def __init__(self, catalog: MappedCatalog):
+        self._catalog = catalog
+
+    def __getitem__(self, rid: str):
+        i = self._catalog.index_of(rid)
+        if i < 0:
+            raise KeyError(rid)
+        return self._catalog.info(i)
+
+    def __iter__(self):
+        return (self._catalog.recipe_id(i) for i in range(len(self._catalog)))
+
+    def __len__(self):
+        return len(self._catalog)
+
+    def __contains__(self, rid):
+        return isinstance(rid, str) and self._catalog.index_of(rid) >= 0
+
+
+class _IngredientView:
+    """食材名 → [(recipe_id, 需要量)]"""
+
+    def __init__(self, catalog: MappedCatalog):
+        self._catalog = catalog
+
+    def get(self, name: str, default=()) -> List[Tuple[str, float]]:
+        c = self._catalog.columns
+        i = _lookup(c["ingredients"], name or "")
+        if i < 0:
+            return default
+        lo, hi = int(c["inv_offsets"][i]), int(c["inv_offsets"][i + 1])
+        return [
+            (self._catalog.recipe_id(r), float(amount))
+            for r, amount in zip(c["inv_recipe"][lo:hi], c["inv_amount"][lo:hi])
+        ]
+
+
+# ======================
+# 文件管理（重建 / 原子替换 / 多 worker 协调）
+# ======================
+class RecipeIndexStore:
+    def __init__(self, path: str = settings.RECIPE_INDEX_PATH):
+        self.path = path
+        self.source = CollectionVersion("recipe_list", ttl=0)
+
+    async def build(self, source_version: Optional[str] = None, recipe_col=None) -> dict:
+        """读取 recipe_list 并原子替换索引文件，返回新文件的 header"""
+        source_version = source_version or await self.source.get()
+        col = recipe_col if recipe_col is not None else get_read_collection("recipe_list")
+        started = time.perf_counter()
+        cursor = col.find({}, {"name": 1, "cooking_time": 1, "ingredients.name": 1, "ingredients.amount": 1})
+        docs = [doc async for doc in cursor]
+        data = await asyncio.to_thread(compile_index, docs, source_version)
+        await asyncio.to_thread(write_atomic, self.path, data)
+        logger.info(
+            f"[RecipeIndex] rebuilt {self.path}: {len(docs)} recipes, {len(data)} bytes, "
+            f"{(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        return read_header(self.path)
+
+    async def ensure_current(self, recipe_col=None) -> dict:
+        """
+        文件的 source_version 与 recipe_list 不一致时重建。
+        只有拿到文件锁的 worker 重建；其他 worker 在已有文件时继续使用旧文件，没有文件时等待。
+        """
+        header = read_header(self.path)
+        try:
+            current = await self.source.get()
+        except Exception as e:
+            if header is None:
+                raise
+            logger.warning(f"[RecipeIndex] version check failed, using existing file: {e}")
+            return header
+        if header and header["source_version"] == current:
+            return header
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if header is not None:
+                        return header  # 其他 worker 正在重建，先用旧文件
+                    await asyncio.sleep(0.1)
+            try:
+                header = read_header(self.path)
+                if header and header["source_version"] == current:
+                    return header
+                return await self.build(current, recipe_col)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def open(self, previous: Optional[MappedCatalog] = None, recipe_col=None) -> MappedCatalog:
+        """previous 与文件内容相同时直接沿用（保持 version 不变，用户状态不需要重建）"""
+        header = await self.ensure_current(recipe_col)
+        if previous is not None and previous.source_version == header["source_version"]:
+            previous.loaded_at = time.monotonic()
+            return previous
+        version = (previous.version + 1) if previous is not None else 1
+        return await asyncio.to_thread(MappedCatalog, self.path, version)
+
+
+recipe_index = RecipeIndexStore()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(recipe_index.build()))
@@ -0,0 +1,420 @@
+"""
+菜谱批量导入（recipe_list）：流式读取 JSONL / CSV → RecipeSchema 校验 → 按食材主数据规范化食材名与单位
+→ 内容哈希未变化的跳过 → 新菜谱按 MinHash/LSH 去掉近似重复 → 无序 bulk_write upsert。
+
+校验 / 规范化是 CPU 密集的，在进程池中按批处理；主进程只负责读取文件和写入 MongoDB。
+命令行入口见 tools/ingest_recipes.py。
+
+输入记录（JSONL 每行一个对象；CSV 中 ingredients / steps 为 JSON 数组字符串，tags 以 | 分隔）:
+    {"name": "回鍋肉", "cooking_time": 20, "servings": "2人前", "recipe_url": "...",
+     "ingredients": [{"name": "キャベツ", "amount": 150, "unit": "g"}],
+     "steps": ["キャベツを切る", ...]  または [{"step_no": 1, "instruction": "..."}]}
+
+写入的文档与现有 recipe_list 的形状一致（ingredients: [{name, amount, unit}]，servings: "N人前"），
+另外保存 source_key（去重键：source_id / recipe_url / name）、content_hash 与 minhash / lsh_bands。
+"""
+import asyncio
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.core.db import get_collection, get_read_collection
+from app.schemas.recipe_schema import RecipeSchema
+from app.services.inventory_service import UNIT_CONVERSIONS, convert_quantity
+from app.services.recipe_similarity import LSHIndex, signature_fields
+
+# 单位的表记揺れ → UNIT_CONVERSIONS 中的写法（NFKC 之后再查表）
+UNIT_ALIASES = {
+    "グラム": "g", "gram": "g", "grams": "g", "キロ": "kg", "キログラム": "kg",
+    "cc": "ml", "ミリリットル": "ml", "リットル": "l",
+    "大匙": "大さじ", "小匙": "小さじ", "cup": "カップ",
+}
+SERVINGS_NUMBER = re.compile(r"\d+")
+DEFAULT_FIELDS = {"cuisine": "その他", "difficulty": "normal"}
+
+
+# ======================
+# 食材主数据
+# ======================
+@dataclass
+class IngredientMaster:
+    """别名（name / synonyms，NFKC + 小写）→ 标准名，以及标准名 → 首选单位"""
+    aliases: Dict[str, str] = field(default_factory=dict)
+    units: Dict[str, str] = field(default_factory=dict)
+
+    def resolve(self, raw_name: str) -> Optional[str]:
+        return self.aliases.get(_key(raw_name))
+
+
+def _key(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).strip().lower()
+
+
+async def load_master() -> IngredientMaster:
+    master = IngredientMaster()
+    cursor = get_read_collection("ingredient_list").find({}, {"name": 1, "synonyms": 1, "units": 1})
+    async for doc in cursor:
+        name = doc.get("name")
+        if not name:
+            continue
+        for alias in [name, *(doc.get("synonyms") or [])]:
+            master.aliases.setdefault(_key(alias), name)
+        units = doc.get("units") or []
+        if units:
+            master.units[name] = units[0]
+    return master
+
+
+# ======================
+# 读取（流式）
+# ======================
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def iter_file_records(path: str, fmt: str) -> Iterator[Tuple[int, object]]:
+    """产出 (记录号, dict 或 解析错误信息)；CSV 支持引号内换行"""
+    with _open(path) as f:
+        if fmt == "csv":
+            for row_no, row in enumerate(csv.DictReader(f), start=2):
+                yield row_no, _from_csv_row(row)
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, f"invalid JSON: {e.msg}"
+                continue
+            yield line_no, record if isinstance(record, dict) else "line must be a JSON object"
+
+
+def _from_csv_row(row: dict) -> object:
+    record = {k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ""}
+    try:
+        for column in ("ingredients", "steps"):
+            if column in record:
+                record[column] = json.loads(record[column])
+    except json.JSONDecodeError as e:
+        return f"invalid JSON in CSV column: {e.msg}"
+    if "tags" in record:
+        record["tags"] = [t.strip() for t in record["tags"].split("|") if t.strip()]
+    return record
+
+
+def chunked(records: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ======================
+# 规范化（进程池 worker 中执行）
+# ======================
+_worker_master: Optional[IngredientMaster] = None
+
+
+def init_worker(master: IngredientMaster):
+    global _worker_master
+    _worker_master = master
+
+
+def normalize_unit(unit: str) -> str:
+    unit = unicodedata.normalize("NFKC", unit or "").strip()
+    return UNIT_ALIASES.get(unit.lower(), UNIT_ALIASES.get(unit, unit))
+
+
+def _servings(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = SERVINGS_NUMBER.search(unicodedata.normalize("NFKC", str(value or "")))
+    return int(match.group()) if match else 1
+
+
+def _steps(raw_steps) -> list:
+    steps = []
+    for i, step in enumerate(raw_steps or [], start=1):
+        if isinstance(step, str):
+            steps.append({"step_no": i, "instruction": step})
+        else:
+            steps.append(step)
+    return steps
+
+
+def content_hash(doc: dict) -> str:
+    canonical = json.dumps(doc, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize_record(record: dict, master: IngredientMaster, generated_by: str = "import") -> Tuple[dict, List[str]]:
+    """
+    返回 (待写入文档, 主数据中不存在的食材名)。校验失败时抛出 ValidationError / ValueError。
+    食材名换成主数据的标准名；单位统一写法，主数据有首选单位且可换算时换算过去。
+    """
+    unknown = []
+    ingredients = []
+    for raw in record.get("ingredients") or []:
+        if not isinstance(raw, dict):
+            raise ValueError("ingredient must be an object")
+        raw_name = str(raw.get("name") or raw.get("ingredient_id") or "")
+        name = master.resolve(raw_name)
+        if name is None:
+            name = unicodedata.normalize("NFKC", raw_name).strip()
+            unknown.append(name)
+        quantity = float(raw.get("amount", raw.get("quantity")) or 0)
+        unit = normalize_unit(raw.get("unit", ""))
+        preferred = master.units.get(name)
+        if preferred and preferred != unit and unit in UNIT_CONVERSIONS:
+            converted = convert_quantity(quantity, unit, preferred)
+            if converted is not None:
+                quantity, unit = converted, preferred
+        ingredients.append({"ingredient_id": name, "quantity": round(quantity, 3), "unit": unit})
+
+    candidate = {**DEFAULT_FIELDS, "generated_by": generated_by, **record}
+    candidate.update(
+        name=unicodedata.normalize("NFKC", str(record.get("name") or "")).strip(),
+        ingredients=ingredients,
+        steps=_steps(record.get("steps")),
+        servings=_servings(record.get("servings")),
+    )
+    recipe = RecipeSchema.model_validate(candidate)
+    if not recipe.name or not recipe.ingredients or not recipe.steps:
+        raise ValueError("name, ingredients and steps are required")
+
+    doc = {
+        "name": recipe.name,
+        "description": recipe.description,
+        "cooking_time": recipe.cooking_time,
+        "servings": f"{recipe.servings}人前",
+        "recipe_img_url": record.get("recipe_img_url") or recipe.image_url,
+        "recipe_url": record.get("recipe_url"),
+        "ingredients": [{"name": i.ingredient_id, "amount": i.quantity, "unit": i.unit} for i in recipe.ingredients],
+        "steps": [step.model_dump() for step in recipe.steps],
+        "tags": recipe.tags,
+        "cuisine": recipe.cuisine,
+        "difficulty": recipe.difficulty,
+        "generated_by": recipe.generated_by,
+    }
+    doc = {k: v for k, v in doc.items() if v is not None}
+    doc.update(signature_fields(i["name"] for i in doc["ingredients"]))
+    doc["source_key"] = str(record.get("source_id") or record.get("recipe_url") or recipe.name)
+    doc["content_hash"] = content_hash(doc)
+    return doc, unknown
+
+
+def normalize_chunk(chunk: List[Tuple[int, object]], generated_by: str = "import") -> List[tuple]:
+    """worker 入口：产出 (记录号, 文档 或 None, 错误信息 或 None, 未知食材名)"""
+    results = []
+    for record_no, record in chunk:
+        if not isinstance(record, dict):
+            results.append((record_no, None, str(record), []))
+            continue
+        try:
+            doc, unknown = normalize_record(record, _worker_master, generated_by)
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results.append((record_no, None, error, []))
+        except (ValueError, TypeError) as e:
+            results.append((record_no, None, str(e), []))
+        else:
+            results.append((record_no, doc, None, unknown))
+    return results
+
+
+# ======================
+# 写入
+# ======================
+@dataclass
+class IngestStats:
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    unknown_ingredients: Counter = field(default_factory=Counter)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"read={self.read} inserted={self.inserted} updated={self.updated} unchanged={self.unchanged} "
+            f"duplicates={self.duplicates} "
+            f"invalid={len(self.errors)} elapsed={self.elapsed:.1f}s rate={self.rate:.0f} records/s"
+        )
+
+
+class Deduplicator:
+    """
+    新菜谱的近似重复检查：recipe_list 中已有的菜谱（lsh_bands 索引，每批一次查询）
+    + 已接受但尚未写入的菜谱（进程内 LSH）。已有 source_key 的更新不受影响。
+    写入模式下前一批在下一批检查前已写入数据库，accepted 每批清空，内存不随文件大小增长；
+    dry-run 不写入，只能在整个过程中保留 accepted。
+    """
+
+    def __init__(self, threshold: float = settings.RECIPE_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.accepted = LSHIndex()
+
+    async def split(self, docs: List[dict], check_db: bool = True) -> Tuple[List[dict], List[dict]]:
+        """返回 (保留, 近似重复)"""
+        if check_db:
+            self.accepted = LSHIndex()
+        stored = LSHIndex()
+        bands = list({band for doc in docs for band in doc.get("lsh_bands", ())})
+        if check_db and bands:
+            # 读主节点：前一批刚写入的菜谱在 secondary 上可能尚不可见
+            cursor = get_collection("recipe_list").find(
+                {"lsh_bands": {"$in": bands}}, {"minhash": 1, "source_key": 1}
+            )
+            async for doc in cursor:
+                if doc.get("minhash"):
+                    stored.add(doc.get("source_key") or doc["_id"], doc["minhash"])
+
+        kept, duplicates = [], []
+        for doc in docs:
+            signature = doc.get("minhash")
+            if signature:
+                matches = stored.query(signature, self.threshold) + self.accepted.query(signature, self.threshold)
+                if any(key != doc["source_key"] for key, _ in matches):
+                    duplicates.append(doc)
+                    continue
+                self.accepted.add(doc["source_key"], signature)
+            kept.append(doc)
+        return kept, duplicates
+
+
+async def write_batch(
+    docs: List[dict],
+    stats: IngestStats,
+    dry_run: bool = False,
+    dedup: Optional[Deduplicator] = None,
+    record_nos: Optional[Dict[str, int]] = None,
+):
+    """
+    按 source_key upsert；先一次查出已有的 content_hash，未变化的不写。
+    个别文档写入失败（唯一键冲突、校验失败等）时记入 stats.errors（record_nos: source_key → 记录号），
+    其余文档的结果照常计入，不中断导入。
+    """
+    latest: Dict[str, dict] = {}
+    for doc in docs:
+        latest[doc["source_key"]] = doc  # 同一批内重复时以后出现的为准
+    stats.unchanged += len(docs) - len(latest)
+    existing = {}
+    if not dry_run:
+        cursor = get_collection("recipe_list").find(
+            {"source_key": {"$in": list(latest)}}, {"source_key": 1, "content_hash": 1}
+        )
+        existing = {doc["source_key"]: doc.get("content_hash") async for doc in cursor}
+
+    if dedup is not None:
+        _, duplicates = await dedup.split([doc for key, doc in latest.items() if key not in existing], not dry_run)
+        for doc in duplicates:
+            del latest[doc["source_key"]]
+        stats.duplicates += len(duplicates)
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    keys = []
+    for key, doc in latest.items():
+        if key in existing and existing[key] == doc["content_hash"]:
+            stats.unchanged += 1
+            continue
+        keys.append(key)
+        ops.append(UpdateOne(
+            {"source_key": key},
+            {"$set": {**doc, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        ))
+    if dry_run:
+        stats.inserted += len(ops)  # dry-run 不查询已有数据，全部计为新增
+        return
+    if not ops:
+        return
+    try:
+        result = await get_collection("recipe_list").bulk_write(ops, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for write_error in details.get("writeErrors", []):
+            key = keys[write_error["index"]]
+            record_no = (record_nos or {}).get(key, 0)
+            stats.errors.append((record_no, f"write failed ({key}): {write_error.get('errmsg', 'write error')}"))
+    stats.inserted += details.get("nUpserted", 0)
+    stats.updated += details.get("nModified", 0)
+
+
+async def ingest(
+    records: Iterable[Tuple[int, object]],
+    master: IngredientMaster,
+    batch_size: int = 500,
+    workers: Optional[int] = None,
+    generated_by: str = "import",
+    dry_run: bool = False,
+    progress=None,
+    dedup: Optional[Deduplicator] = None,
+) -> IngestStats:
+    """
+    records: iter_file_records() 的输出。规范化在进程池中进行，同时最多 workers * 2 批在处理中，
+    内存占用与文件大小无关。progress(stats) 每写完一批调用一次。
+    """
+    stats = IngestStats()
+    loop = asyncio.get_running_loop()
+
+    async def consume(future):
+        docs = []
+        record_nos = {}
+        for record_no, doc, error, unknown in await future:
+            if error is not None:
+                stats.errors.append((record_no, error))
+            else:
+                docs.append(doc)
+                record_nos[doc["source_key"]] = record_no
+                stats.unknown_ingredients.update(unknown)
+        if docs:
+            await write_batch(docs, stats, dry_run, dedup, record_nos)
+        if progress:
+            progress(stats)
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(master,)) as pool:
+        pending: List[asyncio.Future] = []
+        for chunk in chunked(records, batch_size):
+            stats.read += len(chunk)
+            pending.append(loop.run_in_executor(pool, normalize_chunk, chunk, generated_by))
+            if len(pending) >= max_pending:
+                await consume(pending.pop(0))
+        for future in pending:
+            await consume(future)
+    return stats
@@ -1,14 +1,13 @@
 import logging
+import random
 from typing import List, Optional
 
-from app.core.db import get_collection
-from app.schemas.recipe_schema import (
-    IngredientItem,
-    StepItem,
-    RecipeRecommendationResponse,
-    AvailableIngredient,
-    RequiredIngredient,
-)
+from app.core.config import settings
+from app.core.db import get_collection, get_read_collection
+from app.services.cookable_index import cookable_index
+from app.services.recipe_cache import RECIPE_PROJECTION, CachedRecipe, recipe_cache
+from app.services.recipe_similarity import ingredient_names, pick_diverse
+from app.schemas.recipe_schema import AvailableIngredient, RequiredIngredient
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +15,9 @@ logger = logging.getLogger(__name__)
 class RecipeRecommender:
     """Recipe recommendation service."""
 
-    def __init__(self, recipe_col=None):
-        self.recipe_col = recipe_col or get_collection("recipe_list")
+    def __init__(self, recipe_col=None, user_col=None):
+        self.recipe_col = recipe_col or get_read_collection("recipe_list")
+        self.user_col = user_col or get_collection("users")
 
     async def _build_pipeline(
         self,
@@ -69,8 +69,8 @@ class RecipeRecommender:
 
         return [
             {"$match": match_conditions},
-            {"$sample": {"size": 1}},  # 随机选一条
-            {"$unset": ["_id"]},      # 移除 MongoDB 内部 ID
+            {"$sample": {"size": settings.RECIPE_DIVERSITY_SAMPLE}},  # 随机取若干条，再按菜去重后选一条
+            {"$project": RECIPE_PROJECTION},  # 只取构建 payload 所需的字段（保留 _id 作为用户状态中的引用）
         ]
 
     async def _find_from_db(
@@ -83,8 +83,8 @@ class RecipeRecommender:
         try:
             pipeline = await self._build_pipeline(available_ingredients, required_ingredients, max_time)
             cursor = await self.recipe_col.aggregate(pipeline)  # Motor 返回 AsyncIOMotorCommandCursor
-            result = await cursor.to_list(length=1)
-            return result[0] if result else None
+            result = await cursor.to_list(length=None)
+            return pick_diverse(result, ingredient_names)
         except Exception as e:
             logger.exception(f"MongoDB 查询失败: {e}")
             return None
@@ -94,10 +94,10 @@ class RecipeRecommender:
         available_ingredients: List[AvailableIngredient],
         required_ingredients: List[RequiredIngredient],
         max_cooking_time: int,
-    ) -> Optional[RecipeRecommendationResponse]:
+    ) -> Optional[CachedRecipe]:
         """
-        根据用户提供的食材和时间推荐菜谱。
-        1. 优先从数据库查找
+        根据用户提供的食材和时间推荐菜谱（payload 为 RecipeRecommendationResponse 形状的 dict）。
+        1. 优先从数据库查找，结果放入共享菜谱缓存
         2. 如果找不到，返回 None
         """
         recipe_doc = await self._find_from_db(available_ingredients, required_ingredients, max_cooking_time)
@@ -106,36 +106,37 @@ class RecipeRecommender:
             # 找不到菜谱，直接返回 None（保持你的要求）
             return None
 
-        # 转换 ingredients 和 steps
-        ingredients = self._convert_ingredients(recipe_doc.get("ingredients", []))
-        steps = self._convert_steps(recipe_doc.get("steps", []))
-
-        return RecipeRecommendationResponse(
-            name=recipe_doc.get("name", ""),
-            cooking_time=recipe_doc.get("cooking_time", 0),
-            ingredients=ingredients,
-            servings=recipe_doc.get("servings", "1人前"),
-            recipe_img_url=recipe_doc.get("recipe_img_url") or recipe_doc.get("image_url"),
-            recipe_url=recipe_doc.get("recipe_url"),
-            steps=steps,
-            missing_ingredients=[],
-            recommend_score=1.0,
-            recommend_reason="おすすめレシピを見つけました！",
-        )
-
-    @staticmethod
-    def _convert_ingredients(raw_ingredients: List[dict]) -> List[IngredientItem]:
-        """将 DB/GPT 返回的 ingredients 转换成 IngredientItem 列表"""
-        return [
-            IngredientItem(
-                ingredient_id=ing.get("ingredient_id") or ing.get("name", ""),
-                quantity=ing.get("quantity") or ing.get("amount") or 0,
-                unit=ing.get("unit", ""),
+        return recipe_cache.remember(recipe_doc)
+
+    async def recommend_from_cookable(
+        self,
+        user_id: str,
+        required_ingredients: List[RequiredIngredient],
+        max_cooking_time: int,
+    ) -> Optional[CachedRecipe]:
+        """
+        使用已登录库存推荐：从增量维护的「今すぐ作れる」集合中查表，
+        只需读取用户库存，选中的菜谱正文从共享缓存取（未命中时按投影读取一条），不做整库聚合。
+        """
+        user = await self.user_col.find_one({"_id": user_id}, {"inventory": 1})
+        if not user:
+            return None
+
+        state = await cookable_index.state_for(user_id, user.get("inventory", []))
+        catalog = await cookable_index.catalog()
+
+        def matches(info) -> bool:
+            if info.cooking_time is None or info.cooking_time > max_cooking_time:
+                return False
+            return all(
+                any(name == req.name and amount <= req.amount for name, amount in info.requirements)
+                for req in required_ingredients
             )
-            for ing in raw_ingredients
-        ]
 
-    @staticmethod
-    def _convert_steps(raw_steps: List[dict]) -> List[StepItem]:
-        """将 DB/GPT 返回的 steps 转换成 StepItem 列表"""
-        return [StepItem(**step) for step in raw_steps if isinstance(step, dict)]
+        candidates = [catalog.recipes[rid] for rid in state.cookable if matches(catalog.recipes[rid])]
+        if not candidates:
+            return None
+
+        sample = random.sample(candidates, min(len(candidates), settings.RECIPE_DIVERSITY_SAMPLE))
+        chosen = pick_diverse(sample, lambda info: [name for name, _ in info.requirements])
+        return await recipe_cache.get(str(chosen.id))
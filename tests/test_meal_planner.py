@@ -0,0 +1,83 @@
+"""
+献立ソルバーの検証：ランダムな小規模インスタンスで全探索の最適値と一致すること。
+
+    python -m unittest tests.test_meal_planner
+"""
+import itertools
+import random
+import time
+import unittest
+from collections import defaultdict
+
+from app.services.cookable_index import RecipeInfo, _Catalog
+from app.services.meal_planner import EPS, build_candidates, solve
+
+
+def random_instance(rng: random.Random, recipes: int = 40, ingredients: int = 8):
+    names = [f"i{k}" for k in range(ingredients)]
+    inventory = {name: float(rng.randint(2, 10)) for name in names}
+    infos = {}
+    by_ingredient = defaultdict(list)
+    for r in range(recipes):
+        rid = f"r{r}"
+        requirements = [(name, float(rng.randint(1, 6))) for name in rng.sample(names, rng.randint(1, 4))]
+        infos[rid] = RecipeInfo(rid, rid, 10, requirements)
+        for name, amount in requirements:
+            by_ingredient[name].append((rid, amount))
+    return _Catalog(1, infos, dict(by_ingredient), time.monotonic()), names, inventory
+
+
+def brute_force(candidates, columns: int, count: int):
+    """(菜谱数, 使用比例合计) 的字典序最大值"""
+    for size in range(min(count, len(candidates)), 0, -1):
+        best = None
+        for combo in itertools.combinations(candidates, size):
+            used = [0.0] * columns
+            for c in combo:
+                for col, fraction in c.demand:
+                    used[col] += fraction
+            if all(u <= 1 + EPS for u in used):
+                score = sum(c.score for c in combo)
+                best = score if best is None else max(best, score)
+        if best is not None:
+            return size, round(best, 6)
+    return 0, 0.0
+
+
+class MealPlannerTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(42)
+        for _ in range(30):
+            catalog, names, inventory = random_instance(rng)
+            candidates, timed_out = build_candidates(catalog, names, inventory)
+            self.assertFalse(timed_out)
+            count = rng.randint(2, 4)
+            solution, _ = solve(candidates, len(names), count, time.perf_counter() + 5)
+            found = (len(solution.chosen), round(solution.score, 6))
+            self.assertEqual(found, brute_force(candidates, len(names), count))
+
+    def test_solution_fits_inventory(self):
+        rng = random.Random(7)
+        for _ in range(20):
+            catalog, names, inventory = random_instance(rng, recipes=200)
+            candidates, _ = build_candidates(catalog, names, inventory)
+            solution, _ = solve(candidates, len(names), 6, time.perf_counter() + 1)
+            used = [0.0] * len(names)
+            for i in solution.chosen:
+                for col, fraction in candidates[i].demand:
+                    used[col] += fraction
+            self.assertTrue(all(u <= 1 + EPS for u in used))
+            self.assertEqual(len(set(solution.chosen)), len(solution.chosen))
+
+    def test_expired_deadline_keeps_only_complete_candidates(self):
+        catalog, names, inventory = random_instance(random.Random(1), recipes=200)
+        full, _ = build_candidates(catalog, names, inventory)
+        partial, timed_out = build_candidates(catalog, names, inventory, deadline=time.perf_counter() - 1)
+        self.assertTrue(timed_out)
+        by_rid = {c.rid: c for c in full}
+        for c in partial:
+            self.assertEqual(c.demand, by_rid[c.rid].demand)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+冷启动 import 时间基准：在新进程中以 `python -X importtime` import 目标模块，
+按模块汇总累计耗时（多次运行取中位数），超出预算时以非零状态退出（CI 用）。
+
+用法:
+    python -m tools.import_budget                              # 报告 + 总预算检查
+    python -m tools.import_budget --write-baseline .import_baseline.json
+    python -m tools.import_budget --baseline .import_baseline.json --tolerance 0.3
+
+检查项:
+- 目标模块总耗时 > --budget-ms
+- 不应在启动时 import 的重型包（--forbid，默认 openai / linebot）被加载
+- 与基线相比，app.* 模块的累计耗时增长超过 tolerance（且超过 --min-regression-ms）
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+DEFAULT_FORBIDDEN = ("openai", "linebot")
+
+
+def measure_once(module: str) -> Dict[str, float]:
+    """返回 {模块名: 累计 import 毫秒}"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"import {module} failed")
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2)) / 1000
+    return timings
+
+
+def measure(module: str, repeat: int) -> Dict[str, float]:
+    runs: Dict[str, List[float]] = defaultdict(list)
+    for _ in range(repeat):
+        for name, ms in measure_once(module).items():
+            runs[name].append(ms)
+    return {name: statistics.median(values) for name, values in runs.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="目标模块的总 import 时间上限")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--forbid", nargs="*", default=list(DEFAULT_FORBIDDEN), help="启动时不应加载的包")
+    parser.add_argument("--baseline", help="基线 JSON（由 --write-baseline 生成）")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="相对基线允许的增长比例")
+    parser.add_argument("--min-regression-ms", type=float, default=20.0, help="小于该增量的变化不视为回归")
+    parser.add_argument("--write-baseline", help="把本次结果（app.* 与总计）写入基线文件")
+    args = parser.parse_args()
+
+    timings = measure(args.module, args.repeat)
+    total = timings.get(args.module, 0.0)
+    print(f"{args.module}: {total:.1f}ms (median of {args.repeat})")
+
+    # 仅列出顶层包与本项目模块，避免输出过长
+    interesting = {
+        name: ms for name, ms in timings.items()
+        if name.startswith("app.") or "." not in name
+    }
+    for name, ms in sorted(interesting.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:9.1f}ms  {name}")
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append(f"total {total:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+    for package in args.forbid:
+        if package in timings:
+            failures.append(f"'{package}' is imported at startup ({timings[package]:.1f}ms)")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for name, before in baseline.items():
+            now = timings.get(name)
+            if now is None:
+                continue
+            if now - before > args.min_regression_ms and now > before * (1 + args.tolerance):
+                failures.append(f"{name}: {before:.1f}ms -> {now:.1f}ms")
+
+    if args.write_baseline:
+        snapshot = {name: round(ms, 1) for name, ms in timings.items() if name.startswith("app.") or name == args.module}
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.write_baseline}")
+
+    if failures:
+        print("\nFAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        raise SystemExit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
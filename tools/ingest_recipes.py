@@ -0,0 +1,86 @@
+"""
+菜谱语料导入（recipe_list）。处理逻辑见 app/services/recipe_ingest.py。
+
+用法:
+    python -m tools.ingest_recipes recipes.jsonl
+    python -m tools.ingest_recipes recipes.csv.gz --format csv --batch-size 1000 --workers 8
+    python -m tools.ingest_recipes recipes.jsonl --dry-run --errors invalid.jsonl
+
+同一 source_key 且内容哈希未变化的记录不会重新写入，可以反复对同一份文件执行。
+与已有菜谱（或本次导入中先出现的菜谱）食材集合近似的新菜谱默认跳过（--keep-duplicates 关闭）。
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.core.config import settings
+from app.core.db import close_client
+from app.services.recipe_ingest import Deduplicator, IngredientMaster, ingest, iter_file_records, load_master
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "jsonl"
+
+
+async def main_async(args):
+    fmt = args.format or detect_format(args.path)
+    master = IngredientMaster() if args.no_master else await load_master()
+    print(f"ingredient master: {len(set(master.aliases.values()))} ingredients, {len(master.aliases)} aliases")
+
+    def progress(stats):
+        sys.stderr.write(f"\r{stats.summary()}")
+        sys.stderr.flush()
+
+    try:
+        stats = await ingest(
+            iter_file_records(args.path, fmt),
+            master,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            generated_by=args.generated_by,
+            dry_run=args.dry_run,
+            progress=progress,
+            dedup=None if args.keep_duplicates else Deduplicator(args.duplicate_threshold),
+        )
+    finally:
+        await close_client()
+    sys.stderr.write("\n")
+
+    print(stats.summary())
+    if stats.unknown_ingredients:
+        print(f"unknown ingredients ({len(stats.unknown_ingredients)}):")
+        for name, count in stats.unknown_ingredients.most_common(args.top_unknown):
+            print(f"  {count:6d}  {name}")
+    for record_no, error in stats.errors[:args.show_errors]:
+        print(f"  #{record_no}: {error}")
+    if args.errors:
+        with open(args.errors, "w", encoding="utf-8") as f:
+            for record_no, error in stats.errors:
+                f.write(json.dumps({"record": record_no, "error": error}, ensure_ascii=False) + "\n")
+        print(f"errors written to {args.errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe corpus ingestion into recipe_list")
+    parser.add_argument("path", help="JSONL / CSV（.gz 可）")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="省略时按扩展名判断")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批规范化 / bulk_write 的记录数")
+    parser.add_argument("--workers", type=int, default=None, help="规范化进程数（默认 CPU 数）")
+    parser.add_argument("--generated-by", default="import", help="写入 generated_by 的值")
+    parser.add_argument("--dry-run", action="store_true", help="只校验 / 规范化，不写入")
+    parser.add_argument("--no-master", action="store_true", help="不读取食材主数据（只做表记统一）")
+    parser.add_argument("--keep-duplicates", action="store_true", help="不跳过近似重复的新菜谱")
+    parser.add_argument(
+        "--duplicate-threshold", type=float, default=settings.RECIPE_DUPLICATE_THRESHOLD,
+        help="食材集合的相似度 >= 该值视为重复",
+    )
+    parser.add_argument("--errors", help="把校验失败的记录号与原因写入该 JSONL 文件")
+    parser.add_argument("--show-errors", type=int, default=10)
+    parser.add_argument("--top-unknown", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+LINE Webhook 负载生成器：模拟大量并发的烹饪会话，端到端压测 /line/callback。
+
+每个会话: 食材を登録する → POST /recipes/recommendations → スタート → (画像 | 次へ)* → 完了
+所有 webhook 都按 LINE 规范签名（X-Line-Signature）。外部 API 由 tools/stub_server.py 替代，
+回复的到达时间通过 stub 的 /__stub__/line/deliveries 观测。
+
+前提:
+    # stub
+    python -m tools.stub_server --port 8900 --latency-ms 800 --jitter-ms 400
+    # app（本地 MongoDB）
+    DEBUG_STATS_ENABLED=true LINE_CHANNEL_SECRET=loadtest \\
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 LINE_API_ENDPOINT=http://127.0.0.1:8900 \\
+    LINE_API_DATA_ENDPOINT=http://127.0.0.1:8900 uvicorn app.main:app --port 8000
+
+用法:
+    python -m tools.line_load --sessions 2000 --concurrency 500 --think-time 3 --seed-recipe
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+from bson import ObjectId
+
+from app.core.config import settings
+
+COMMAND_REGISTER = "食材を登録する"
+COMMAND_START = "スタート"
+COMMAND_NEXT = "次へ"
+COMPLETED_MARKER = "全てのステップが完了"
+LOADTEST_RECIPE_ID = ObjectId("6c6f616474657374" "00000001")  # "loadtest"
+
+# 与 line_bot_router 中新用户的默认库存一致
+DEFAULT_INVENTORY = [
+    {"name": "豚バラ肉", "quantity": 150, "unit": "g"},
+    {"name": "ピーマン", "quantity": 70, "unit": "g"},
+    {"name": "キャベツ", "quantity": 300, "unit": "g"},
+    {"name": "長ねぎ", "quantity": 10, "unit": "g"},
+    {"name": "すりおろし生姜", "quantity": 10, "unit": "g"},
+    {"name": "豆板醤", "quantity": 10, "unit": "g"},
+    {"name": "甜麺醤", "quantity": 20, "unit": "g"},
+    {"name": "しょうゆ", "quantity": 10, "unit": "ml"},
+    {"name": "料理酒", "quantity": 10, "unit": "ml"},
+    {"name": "ごま油", "quantity": 10, "unit": "g"},
+]
+
+
+@dataclass
+class Report:
+    ack_ms: List[float] = field(default_factory=list)
+    next_step_ms: List[float] = field(default_factory=list)
+    recommend_ms: List[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    completed: int = 0
+    events: int = 0
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def summarize(name: str, values: List[float]) -> str:
+    return (
+        f"{name:<22} n={len(values):<7} p50={percentile(values, 0.5):8.1f}ms "
+        f"p95={percentile(values, 0.95):8.1f}ms p99={percentile(values, 0.99):8.1f}ms "
+        f"max={max(values, default=0.0):8.1f}ms"
+    )
+
+
+class LoadSession:
+    """一个 LINE 用户的完整烹饪会话"""
+
+    def __init__(self, args, app: httpx.AsyncClient, stub: httpx.AsyncClient, report: Report, index: int):
+        self.args = args
+        self.app = app
+        self.stub = stub
+        self.report = report
+        self.user_id = f"Uload{index:08d}{uuid.uuid4().hex[:8]}"
+
+    # ----------------------
+    # webhook
+    # ----------------------
+    def _event(self, message: dict, reply_token: str) -> dict:
+        return {
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": self.user_id},
+            "webhookEventId": uuid.uuid4().hex,
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": reply_token,
+            "message": message,
+        }
+
+    async def _post_webhook(self, message: dict) -> Optional[tuple]:
+        reply_token = uuid.uuid4().hex
+        body = json.dumps(
+            {"destination": "Uloadtest", "events": [self._event(message, reply_token)]},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        signature = base64.b64encode(
+            hmac.new(self.args.channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+        ).decode("utf-8")
+
+        sent_at = time.time()
+        started = time.perf_counter()
+        try:
+            resp = await self.app.post(
+                "/line/callback", content=body,
+                headers={"X-Line-Signature": signature, "Content-Type": "application/json"},
+            )
+        except httpx.HTTPError as e:
+            self.report.errors[f"webhook:{type(e).__name__}"] += 1
+            return None
+        self.report.ack_ms.append((time.perf_counter() - started) * 1000)
+        self.report.events += 1
+        if resp.status_code != 200:
+            self.report.errors[f"webhook:{resp.status_code}"] += 1
+            return None
+        return reply_token, sent_at
+
+    async def send_text(self, text: str):
+        return await self._post_webhook({"id": uuid.uuid4().hex[:16], "type": "text", "quoteToken": "q", "text": text})
+
+    async def send_image(self):
+        return await self._post_webhook({
+            "id": uuid.uuid4().hex[:16], "type": "image", "quoteToken": "q",
+            "contentProvider": {"type": "line"},
+        })
+
+    async def wait_delivery(self, posted, ignore: tuple = ()) -> Optional[str]:
+        """轮询 stub，直到该用户收到一条新消息（reply 或 push），返回消息文本"""
+        if not posted:
+            return None
+        reply_token, sent_at = posted
+        deadline = time.time() + self.args.step_timeout
+        while time.time() < deadline:
+            for key in (reply_token, self.user_id):
+                resp = await self.stub.get("/__stub__/line/deliveries", params={"key": key, "since": sent_at})
+                for delivery in resp.json():
+                    text = "\n".join(t for t in delivery["texts"] if t)
+                    if not any(marker in text for marker in ignore):
+                        return text
+            await asyncio.sleep(self.args.poll_interval)
+        self.report.errors["delivery:timeout"] += 1
+        return None
+
+    async def think(self):
+        await asyncio.sleep(random.expovariate(1 / self.args.think_time) if self.args.think_time else 0)
+
+    # ----------------------
+    # 会话流程
+    # ----------------------
+    async def run(self):
+        await self.wait_delivery(await self.send_text(COMMAND_REGISTER))
+        await self.think()
+
+        started = time.perf_counter()
+        resp = await self.app.post("/recipes/recommendations", json={
+            "user_id": self.user_id,
+            "max_cooking_time": 60,
+            "required_ingredients": [],
+            "available_ingredients": DEFAULT_INVENTORY,
+        })
+        self.report.recommend_ms.append((time.perf_counter() - started) * 1000)
+        if resp.status_code != 200:
+            self.report.errors[f"recommend:{resp.status_code}"] += 1
+            return
+        await self.think()
+
+        await self.wait_delivery(await self.send_text(COMMAND_START))
+        for _ in range(self.args.max_steps):
+            await self.think()
+            started = time.perf_counter()
+            if random.random() < self.args.image_ratio:
+                posted = await self.send_image()
+            else:
+                posted = await self.send_text(COMMAND_NEXT)
+            # 「確認中」提示不算作下一步到达
+            text = await self.wait_delivery(posted, ignore=("画像を確認しています",))
+            if text is None:
+                return
+            self.report.next_step_ms.append((time.perf_counter() - started) * 1000)
+            if COMPLETED_MARKER in text:
+                self.report.completed += 1
+                return
+
+
+async def seed_recipe(steps: int):
+    """向本地 MongoDB 写入一条可由默认库存覆盖的菜谱（_id 固定，可重复执行）"""
+    from pymongo import AsyncMongoClient
+
+    client = AsyncMongoClient(settings.MONGO_URI)
+    try:
+        await client[settings.MONGO_DB_NAME].recipe_list.replace_one(
+            {"_id": LOADTEST_RECIPE_ID},
+            {
+                "_id": LOADTEST_RECIPE_ID,
+                "name": "負荷試験用回鍋肉",
+                "cooking_time": 20,
+                "servings": "2人前",
+                "recipe_url": "https://example.com/loadtest",
+                "ingredients": [
+                    {"name": item["name"], "amount": item["quantity"] / 2, "unit": item["unit"]}
+                    for item in DEFAULT_INVENTORY[:6]
+                ],
+                "steps": [{"step_no": i + 1, "instruction": f"手順{i + 1}: 材料を炒める"} for i in range(steps)],
+            },
+            upsert=True,
+        )
+    finally:
+        await client.close()
+
+
+async def fetch_stats(app: httpx.AsyncClient) -> Optional[dict]:
+    try:
+        resp = await app.get("/debug/stats")
+        return resp.json() if resp.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+async def main_async(args):
+    if args.seed_recipe:
+        await seed_recipe(args.max_steps)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    report = Report()
+    async with httpx.AsyncClient(base_url=args.app_url, limits=limits, timeout=30) as app, \
+            httpx.AsyncClient(base_url=args.stub_url, limits=limits, timeout=30) as stub:
+        await app.post("/debug/stats/reset")
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def run_one(index: int):
+            async with semaphore:
+                try:
+                    await LoadSession(args, app, stub, report, index).run()
+                except Exception as e:
+                    report.errors[f"session:{type(e).__name__}"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+        stats = await fetch_stats(app)
+
+    print(f"sessions={args.sessions} completed={report.completed} events={report.events} "
+          f"elapsed={elapsed:.1f}s events/s={report.events / elapsed:.1f}")
+    print(summarize("webhook ack", report.ack_ms))
+    print(summarize("time-to-next-step", report.next_step_ms))
+    print(summarize("recommendation", report.recommend_ms))
+    if report.errors:
+        print("errors:", dict(report.errors))
+    if stats:
+        lag = stats["event_loop_lag"]
+        print(f"event loop lag         p50={lag['p50_ms']}ms p99={lag['p99_ms']}ms max={lag['max_ms']}ms")
+        print(f"background tasks (end) {stats['background_tasks']}")
+        print("mongo commands per session:")
+        for label, entry in stats["mongo_commands"].items():
+            print(f"  {label:<32} {entry['count'] / args.sessions:8.2f}  avg={entry['avg_ms']}ms")
+    else:
+        print("(/debug/stats unavailable: start the app with DEBUG_STATS_ENABLED=true)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LINE webhook load generator")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:8900")
+    parser.add_argument("--channel-secret", default=settings.LINE_CHANNEL_SECRET or "loadtest")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100, help="同时进行的会话数")
+    parser.add_argument("--think-time", type=float, default=2.0, help="用户操作间隔（指数分布均值，秒）")
+    parser.add_argument("--image-ratio", type=float, default=0.5, help="以图片推进步骤的比例")
+    parser.add_argument("--max-steps", type=int, default=6)
+    parser.add_argument("--step-timeout", type=float, default=60.0)
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--seed-recipe", action="store_true", help="写入一条默认库存可做的菜谱")
+    main_args = parser.parse_args()
+    asyncio.run(main_async(main_args))
+
+
+if __name__ == "__main__":
+    main()
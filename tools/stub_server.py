@@ -0,0 +1,297 @@
+"""
+OpenAI / LINE Messaging API 的替身服务器（离线负载测试用）。
+
+只实现本应用用到的 API 子集:
+- POST /v1/chat/completions
+- POST /v2/bot/message/push, /v2/bot/message/reply
+- GET  /v2/bot/message/{message_id}/content
+
+模式:
+- replay: 从 cassette（JSONL）返回录制的响应；未录制的请求返回合成响应（--on-miss error 时返回 404）
+- record: 转发到真实端点，并把响应追加到 cassette
+
+用法:
+    python -m tools.stub_server --mode replay --cassette .cache/stub_cassette.jsonl --latency-ms 300 --error-rate 0.02
+
+应用侧设置:
+    OPENAI_BASE_URL=http://localhost:8900/v1
+    LINE_API_ENDPOINT=http://localhost:8900
+    LINE_API_DATA_ENDPOINT=http://localhost:8900
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from app.services.llm_cache import make_key
+
+
+@dataclass
+class StubConfig:
+    mode: str = "replay"                      # replay / record
+    cassette: str = ".cache/stub_cassette.jsonl"
+    on_miss: str = "synthesize"               # synthesize / error
+    latency_ms: float = 0.0                   # 注入延迟（均值）
+    jitter_ms: float = 0.0                    # 延迟抖动（± 范围）
+    error_rate: float = 0.0                   # 以该概率返回 429 / 500
+    openai_upstream: str = "https://api.openai.com"
+    line_upstream: str = "https://api.line.me"
+    line_data_upstream: str = "https://api-data.line.me"
+    recordings: Dict[str, dict] = field(default_factory=dict)
+
+
+config = StubConfig()
+app = FastAPI(title="mystery-recipe stub")
+_upstream: Optional[httpx.AsyncClient] = None
+
+# 已投递的 LINE 消息（负载测试工具据此测量 time-to-next-step）
+deliveries = defaultdict(lambda: deque(maxlen=200))
+
+# 合成图片内容（应用只做 base64 转发，不解码）
+STUB_IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+
+
+# ======================
+# cassette
+# ======================
+def _request_key(api: str, path: str, body: Optional[dict]) -> str:
+    if api == "openai" and body is not None:
+        return make_key(path, body)
+    raw = json.dumps({"path": path, "body": body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_cassette(path: str) -> Dict[str, dict]:
+    recordings = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["key"]] = entry
+    return recordings
+
+
+def _append_cassette(entry: dict):
+    directory = os.path.dirname(config.cassette)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(config.cassette, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# ======================
+# 延迟 / 错误注入
+# ======================
+async def _inject(api: str) -> Optional[Response]:
+    if config.latency_ms or config.jitter_ms:
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+    if config.error_rate and random.random() < config.error_rate:
+        status = random.choice([429, 500])
+        if api == "openai":
+            body = {"error": {"message": "stub injected error", "type": "stub", "code": str(status)}}
+        else:
+            body = {"message": "stub injected error"}
+        return JSONResponse(body, status_code=status)
+    return None
+
+
+async def _forward(upstream: str, request: Request, body: bytes) -> httpx.Response:
+    global _upstream
+    if _upstream is None:
+        _upstream = httpx.AsyncClient(timeout=60)
+    headers = {k: v for k, v in request.headers.items() if k.lower() in ("authorization", "content-type", "x-line-retry-key")}
+    return await _upstream.request(request.method, upstream + request.url.path, content=body, headers=headers)
+
+
+async def _record_or_replay(api: str, upstream: str, request: Request, synthesize) -> Response:
+    raw = await request.body()
+    body = json.loads(raw) if raw else None
+    key = _request_key(api, request.url.path, body)
+
+    if config.mode == "record":
+        resp = await _forward(upstream, request, raw)
+        entry = {
+            "key": key,
+            "path": request.url.path,
+            "status": resp.status_code,
+            "content_type": resp.headers.get("content-type", "application/json"),
+            "body": resp.text if "json" in resp.headers.get("content-type", "") else resp.content.hex(),
+        }
+        if resp.status_code < 400:
+            config.recordings[key] = entry
+            _append_cassette(entry)
+        return Response(resp.content, status_code=resp.status_code, media_type=entry["content_type"])
+
+    entry = config.recordings.get(key)
+    if entry:
+        content_type = entry["content_type"]
+        content = entry["body"].encode("utf-8") if "json" in content_type else bytes.fromhex(entry["body"])
+        return Response(content, status_code=entry["status"], media_type=content_type)
+    if config.on_miss == "error":
+        return JSONResponse({"message": f"no recording for {request.url.path}"}, status_code=404)
+    return synthesize(body)
+
+
+# ======================
+# OpenAI
+# ======================
+def _synthesize_chat(body: dict) -> Response:
+    messages = body.get("messages", [])
+    prompt_text = json.dumps(messages, ensure_ascii=False)
+    has_image = any(
+        isinstance(m.get("content"), list) and any(p.get("type") == "image_url" for p in m["content"])
+        for m in messages
+    )
+
+    if body.get("function_call") or body.get("functions"):
+        function_call = body.get("function_call")
+        name = function_call.get("name") if isinstance(function_call, dict) else body["functions"][0]["name"]
+        arguments = {
+            "standard_name": "Cabbage", "internal_code": "cabbage", "synonyms": ["キャベツ"],
+            "category": "vegetable", "emoji": "🥬", "confidence": 0.9,
+        }
+        message = {
+            "role": "assistant", "content": None,
+            "function_call": {"name": name, "arguments": json.dumps(arguments)},
+        }
+    elif has_image:
+        message = {"role": "assistant", "content": "はい"}
+    elif "候補" in prompt_text:
+        message = {"role": "assistant", "content": "キャベツ, 白菜, レタス"}
+    else:
+        message = {"role": "assistant", "content": "キャベツは古代ギリシャでも食べられていた野菜です。🎵 おすすめ: 「Cabbage Song」"}
+
+    prompt_tokens = len(prompt_text) // 4
+    completion_tokens = len(json.dumps(message, ensure_ascii=False)) // 4
+    return JSONResponse({
+        "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    })
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    injected = await _inject("openai")
+    if injected:
+        return injected
+    return await _record_or_replay("openai", config.openai_upstream, request, _synthesize_chat)
+
+
+# ======================
+# LINE Messaging API
+# ======================
+def _log_delivery(kind: str, body: dict):
+    entry = {
+        "kind": kind,
+        "to": body.get("to"),
+        "reply_token": body.get("replyToken"),
+        "texts": [m.get("text") for m in body.get("messages", []) if m.get("type") == "text"],
+        "ts": time.time(),
+    }
+    deliveries[entry["to"] or entry["reply_token"]].append(entry)
+
+
+@app.post("/v2/bot/message/push")
+async def line_push(request: Request):
+    injected = await _inject("line")
+    if injected:
+        return injected
+    _log_delivery("push", await request.json())
+    if config.mode == "record":
+        return await _record_or_replay("line", config.line_upstream, request, None)
+    return JSONResponse({"sentMessages": []})
+
+
+@app.post("/v2/bot/message/reply")
+async def line_reply(request: Request):
+    injected = await _inject("line")
+    if injected:
+        return injected
+    _log_delivery("reply", await request.json())
+    if config.mode == "record":
+        return await _record_or_replay("line", config.line_upstream, request, None)
+    return JSONResponse({"sentMessages": []})
+
+
+@app.get("/v2/bot/message/{message_id}/content")
+async def line_content(message_id: str, request: Request):
+    injected = await _inject("line")
+    if injected:
+        return injected
+    return await _record_or_replay(
+        "line", config.line_data_upstream, request,
+        lambda _: Response(STUB_IMAGE, media_type="image/jpeg"),
+    )
+
+
+# ======================
+# stub 控制接口
+# ======================
+@app.get("/__stub__/line/deliveries")
+async def get_deliveries(key: str, since: float = 0.0):
+    """key = 用户 ID（push）或 reply token（reply）"""
+    return [d for d in deliveries.get(key, ()) if d["ts"] > since]
+
+
+@app.post("/__stub__/config")
+async def update_config(patch: dict):
+    """运行中修改延迟 / 错误率（例: {"latency_ms": 2000}）"""
+    for name in ("latency_ms", "jitter_ms", "error_rate", "on_miss"):
+        if name in patch:
+            setattr(config, name, patch[name])
+    return {name: getattr(config, name) for name in ("mode", "latency_ms", "jitter_ms", "error_rate", "on_miss")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI / LINE stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--mode", choices=["replay", "record"], default=config.mode)
+    parser.add_argument("--cassette", default=config.cassette)
+    parser.add_argument("--on-miss", choices=["synthesize", "error"], default=config.on_miss)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-upstream", default=config.openai_upstream)
+    parser.add_argument("--line-upstream", default=config.line_upstream)
+    parser.add_argument("--line-data-upstream", default=config.line_data_upstream)
+    args = parser.parse_args()
+
+    config.mode = args.mode
+    config.cassette = args.cassette
+    config.on_miss = args.on_miss
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.openai_upstream = args.openai_upstream.rstrip("/")
+    config.line_upstream = args.line_upstream.rstrip("/")
+    config.line_data_upstream = args.line_data_upstream.rstrip("/")
+    config.recordings = load_cassette(config.cassette)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()